@@ -43,13 +43,16 @@ INSTALLED_APPS = [
     'rest_framework',
 ]
 
+# the session, csrf, auth and message middleware are skipped on the
+# AUTH_LEAN_PATHS (see rest_auth.middleware)
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'rest_auth.routers.ReplicaRoutingMiddleware',
+    'rest_auth.middleware.LeanSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'rest_auth.middleware.LeanCsrfViewMiddleware',
+    'rest_auth.middleware.LeanAuthenticationMiddleware',
+    'rest_auth.middleware.LeanMessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -84,6 +87,13 @@ DATABASES = {
     }
 }
 
+# authentication lookups are read from the AUTH_REPLICA_DATABASES aliases,
+# the users written by this process stay on the primary for
+# AUTH_REPLICA_PIN_SECONDS (see rest_auth.routers)
+DATABASE_ROUTERS = ['rest_auth.routers.AuthReplicaRouter']
+AUTH_REPLICA_DATABASES = []
+AUTH_REPLICA_PIN_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -122,15 +132,87 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded files, e.g. the avatar thumbnails of the default storage
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+MEDIA_URL = '/media/'
 SITE_ID = 1
 
 # django-rest-google settings
 AUTH_USER_MODEL = 'rest_auth.User'
 LOGIN_SUCCESS_URL = '/'
+# adapters of the enabled providers, routed by their id
+SOCIAL_AUTH_PROVIDERS = ['rest_auth.views.google.GoogleOAuth2Adapter']
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = 'your app key'
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = 'your app secret'
 AUTH_COOKIE_NAME = 'auth'
-AUTH_COOKIE_MAX_AGE = 604800
+# oauth2 routes and jwt-only api prefixes served without session, csrf,
+# django auth and message middleware
+AUTH_LEAN_PATHS = ['/accounts/', '/.well-known/', '/avatars/']
+# signed cookie carrying the oauth state and pkce verifier to the callback
+AUTH_STATE_COOKIE_NAME = 'auth_state'
+AUTH_STATE_MAX_AGE = 600
+SOCIAL_AUTH_PKCE = True
+# token bucket throttles of the login and callback views, per client ip and
+# for the token exchanges of the process (see rest_auth.throttling). Disabled,
+# set 'local' or 'django' to enable them; behind a reverse proxy set the ip
+# header first, otherwise all the clients share the proxy's REMOTE_ADDR
+AUTH_THROTTLE_BACKEND = None
+AUTH_THROTTLE_RATES = {
+    'login': '30/min',
+    'callback': '30/min',
+    'callback_global': '50/s',
+}
+AUTH_THROTTLE_IP_HEADER = None
+AUTH_THROTTLE_PROXY_COUNT = 1
+# duplicate callbacks with the same code wait for the first one and get its
+# tokens, use 'django' with several processes (see rest_auth.coalescing)
+AUTH_CALLBACK_COALESCE = 'local'
+AUTH_CALLBACK_COALESCE_TIMEOUT = 15
+AUTH_CALLBACK_COALESCE_TTL = 30
+# the refresh token cookie, only sent to the refresh and logout views
+AUTH_REFRESH_COOKIE_NAME = 'auth_refresh'
+AUTH_REFRESH_COOKIE_PATH = '/accounts/'
+# seconds a rotated refresh token is still accepted, for the concurrent
+# refreshes of several tabs, before a reuse logs the user out everywhere
+AUTH_REFRESH_REUSE_GRACE = 5
+# claims left out of the access token cookie (see rest_auth.minting)
+AUTH_TOKEN_DROP_CLAIMS = []
+# seconds before a revocation made by another process is enforced
+AUTH_REVOCATION_SYNC_INTERVAL = 10
+# verify the id token locally instead of calling the userinfo endpoint
+SOCIAL_AUTH_GOOGLE_ID_TOKEN = False
+# seconds between the batched SocialAccount.last_login writes
+AUTH_LAST_LOGIN_FLUSH_INTERVAL = 30
+
+# provider http transport settings
+SOCIAL_AUTH_HTTP_POOL_SIZE = 10
+SOCIAL_AUTH_HTTP_KEEP_ALIVE = True
+SOCIAL_AUTH_HTTP2 = False
+# (connect, read) timeouts in seconds per provider endpoint
+SOCIAL_AUTH_HTTP_TIMEOUTS = {
+    'token': (3.05, 10),
+    'userinfo': (3.05, 5),
+    'jwks': (3.05, 5),
+}
+# retries of the idempotent provider calls
+SOCIAL_AUTH_HTTP_RETRIES = 2
+# open the circuit to a provider host at this error rate
+SOCIAL_AUTH_CIRCUIT_ERROR_RATE = 0.5
+SOCIAL_AUTH_CIRCUIT_RESET_TIMEOUT = 30
+
+# serve the login and callback with the async views (ASGI deployments)
+AUTH_ASYNC_VIEWS = False
+
+# local thumbnails of the provider pictures, served on /avatars/ (requires
+# Pillow, see rest_auth.avatars)
+AUTH_AVATARS_ENABLED = False
+AUTH_AVATAR_SIZES = [32, 64, 128, 256]
+
+# serve the authentication metrics on /metrics/ in the Prometheus format
+AUTH_METRICS_ENABLED = False
+# shared directory merging the metrics of several worker processes
+AUTH_METRICS_MULTIPROC_DIR = None
 
 # drf settings
 REST_FRAMEWORK = {
@@ -139,7 +221,12 @@ REST_FRAMEWORK = {
     ),
 }
 
+# asymmetric token signing keys, published on /.well-known/jwks.json
+# (see rest_auth.signing), the simple jwt SIGNING_KEY is used when empty
+AUTH_SIGNING_KEYS = []
+
 # simple jwt settings
 SIMPLE_JWT = {
-    'ACCESS_TOKEN_LIFETIME': timedelta(days=7),
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
 }
@@ -13,18 +13,43 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.urls import path
 
-from rest_auth.views.google import google_oauth2_login, google_oauth2_callback
+from rest_auth.views.avatars import avatar
+from rest_auth.views.metrics import metrics
+from rest_auth.views.oauth2 import oauth2_login, oauth2_callback, \
+    oauth2_login_async, oauth2_callback_async
 from rest_auth.views.templates import login_cancelled, login_error
+from rest_auth.views.tokens import token_refresh, logout, jwks
+
+if getattr(settings, 'AUTH_ASYNC_VIEWS', False):
+    login_view, callback_view = oauth2_login_async, oauth2_callback_async
+else:
+    login_view, callback_view = oauth2_login, oauth2_callback
 
 urlpatterns = [
 
-    # google oauth2 urls
-    path('accounts/google/login/', google_oauth2_login, name="google_login"),
-    path('accounts/google/login/callback/', google_oauth2_callback,
-         name="google_callback"),
+    # oauth2 urls, for every provider of SOCIAL_AUTH_PROVIDERS
+    path('accounts/<str:provider>/login/', login_view, name='oauth2_login'),
+    path('accounts/<str:provider>/login/callback/', callback_view,
+         name='oauth2_callback'),
+    # names of the former google only routes
+    path('accounts/google/login/', login_view, {'provider': 'google'},
+         name='google_login'),
+    path('accounts/google/login/callback/', callback_view,
+         {'provider': 'google'}, name='google_callback'),
     path('accounts/google/login/cancelled/', login_cancelled,
          name='login_cancelled'),
     path('accounts/google/login/error/', login_error, name='login_error'),
+    path('accounts/token/refresh/', token_refresh, name='token_refresh'),
+    path('accounts/logout/', logout, name='logout'),
+    path('.well-known/jwks.json', jwks, name='jwks'),
 ]
+
+if getattr(settings, 'AUTH_METRICS_ENABLED', False):
+    urlpatterns.append(path('metrics/', metrics, name='auth_metrics'))
+
+if getattr(settings, 'AUTH_AVATARS_ENABLED', False):
+    urlpatterns.append(path('avatars/<str:key>/<int:size>.jpg', avatar,
+                            name='avatar'))
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class AuthConfig(AppConfig):
     name = 'rest_auth'
+
+    def ready(self):
+        from rest_auth import signals  # noqa: F401
+        from rest_auth.minting import build_minter
+        from rest_auth.providers import registry
+        from rest_auth.signing import install_signing_keys
+
+        registry.build()
+        install_signing_keys()
+        build_minter()
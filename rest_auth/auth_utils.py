@@ -1,14 +1,23 @@
-from uuid import uuid4
+import hashlib
+import json
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Upper
 from django.http import HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from rest_framework_simplejwt.state import token_backend
+from rest_framework_simplejwt.settings import api_settings
 
 from rest_auth.exceptions import AccountExistError
+from rest_auth.last_login import touch_last_login
+from rest_auth.minting import get_minter
 from rest_auth.models import SocialAccount, User
+from rest_auth.routers import account_key, pin_primary, replica_get, \
+    user_key
+from rest_auth.user_cache import invalidate_user
 from rest_auth.views.constants import AuthError
 
 
@@ -41,17 +50,24 @@ def get_or_create_user(extra_data):
     """
     Steps:
 
-    Check if the user already exists with this email address.
-      If not:
-        1. Create a User
-        2. Create a SocialAccount with that user
-        3. Return the User
+    Look up the SocialAccount by (provider, uid), joined with its User, on
+    a read replica when they are configured (see `rest_auth.routers`), and
+    on the primary when the replica misses it.
+      If found:
+        Return the User
       otherwise:
-        Check if User has a SocialAccount
-          If not:
+        Check if a User already exists with this email address (case
+        insensitive).
+          If it does:
             raise AccountExistError
-          otherwise:
-            Return the User
+          otherwise, in one transaction:
+            1. Create a User
+            2. Create a SocialAccount with that user
+            3. Return the User
+
+    When a concurrent callback creates the same account first, the unique
+    constraints roll the transaction back and the account it created is
+    returned instead.
 
     :param extra_data: Data received from provider
     :type extra_data: dict
@@ -59,41 +75,219 @@ def get_or_create_user(extra_data):
     :return An User instance.
     :rtype User
    """
+    provider = extra_data['provider']
+    uid = extra_data['uid']
+    try:
+        account = replica_get(get_social_account, provider, uid,
+                              pin_key=account_key(provider, uid))
+    except ObjectDoesNotExist:
+        pass
+    else:
+        refresh_social_account(account, extra_data['extra_data'],
+                               extra_data.get('profile_photo'))
+        return account.user
 
     email = extra_data['email']
+    if email_exists(email):
+        raise AccountExistError()
+
     try:
-        user = User.objects.get(email=email)
+        with transaction.atomic():
+            user = User(
+                email=email,
+                first_name=extra_data.get('first_name') or '',
+                last_name=extra_data.get('last_name') or '',
+                profile_photo=extra_data.get('profile_photo')
+            )
+            user.set_unusable_password()
+            user.save()
+
+            SocialAccount.objects.create(
+                user=user,
+                provider=provider,
+                uid=uid,
+                extra_data=extra_data['extra_data'],
+                extra_data_digest=get_extra_data_digest(
+                    extra_data['extra_data'])
+            )
+    except IntegrityError:
         try:
-            SocialAccount.objects.get(user=user)
+            return get_social_account(provider, uid).user
         except ObjectDoesNotExist:
             raise AccountExistError()
-    except ObjectDoesNotExist:
-        user = User(
-            email=email,
-            first_name=extra_data.get('first_name'),
-            last_name=extra_data.get('last_name'),
-            profile_photo=extra_data.get('profile_photo')
-        )
-        user.set_unusable_password()
-        user.save()
-
-        SocialAccount.objects.create(
-            user=user,
-            provider=extra_data['provider'],
-            uid=extra_data['uid'],
-            extra_data=extra_data['extra_data']
-        )
 
+    pin_primary(account_key(provider, uid))
     return user
 
 
+def get_social_account(provider, uid):
+    """
+    Get the SocialAccount with its User in a single joined query. The
+    provider payload is not loaded, only its digest is needed.
+
+    :param provider: The provider id
+    :param uid: The user id at the provider
+    :return SocialAccount instance
+    """
+    return SocialAccount.objects.select_related('user').defer(
+        'extra_data').get(provider=provider, uid=uid)
+
+
+def refresh_social_account(account, data, profile_photo=None):
+    """
+    Update a returning users SocialAccount. The provider payload is only
+    written when its digest changed, and `last_login` goes through the
+    write-behind buffer (see `rest_auth.last_login`). The users
+    `profile_photo` follows the picture of the payload.
+
+    :param account: SocialAccount instance
+    :param data: The provider payload
+    :param profile_photo: The picture url of the payload
+    """
+    digest = get_extra_data_digest(data)
+    if digest != account.extra_data_digest:
+        SocialAccount.objects.filter(pk=account.pk).update(
+            extra_data=data, extra_data_digest=digest)
+        user = account.user
+        if profile_photo and profile_photo != user.profile_photo:
+            User.objects.filter(pk=user.pk).update(
+                profile_photo=profile_photo)
+            user.profile_photo = profile_photo
+            invalidate_user(user.pk)
+            pin_primary(user_key(user.pk))
+    touch_last_login(account.pk)
+
+
+def get_extra_data_digest(data):
+    """
+    Stable digest of a provider payload.
+
+    :param data: The provider payload
+    :return Hex digest
+    """
+    encoded = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def email_exists(email):
+    """
+    Case insensitive check for an User with this email address. It compares
+    UPPER(email), which is served by the `rest_auth_user_email_upper_idx`
+    index. The index is unique, so a signup racing past this check with the
+    same email in another case fails on insert with an IntegrityError.
+
+    :param email: The email address
+    :return bool
+    """
+    return User.objects.annotate(email_upper=Upper('email')).filter(
+        email_upper=email.upper()).exists()
+
+
 def create_access_token_for_user(user):
     """
-    Create an access token for user.
+    Create an access token for user, without building a refresh token.
 
     :param user:
     :return Encoded token
     """
-    refresh = TokenObtainPairSerializer.get_token(user)
-    encoded_token = token_backend.encode(refresh.access_token.payload)
-    return encoded_token
+    return get_minter().mint_access(user)
+
+
+def create_tokens_for_user(user):
+    """
+    Create a short-lived access token and its refresh token for user. Both
+    carry an `iat` claim, compared with the users `tokens_not_before`,
+    unless it is dropped from the access token (see `rest_auth.minting`).
+
+    :param user:
+    :return Encoded access and refresh tokens
+    :rtype tuple
+    """
+    return get_minter().mint_pair(user)
+
+
+def set_auth_cookies(response, access_token, refresh_token=None):
+    """
+    Set the access token cookie and, if given, the refresh token cookie.
+    The refresh cookie is only sent to `AUTH_REFRESH_COOKIE_PATH`.
+
+    :param response: django HttpResponse
+    :param access_token: The encoded access token
+    :param refresh_token: The encoded refresh token
+    :return The response
+    """
+    response.set_cookie(
+        getattr(settings, 'AUTH_COOKIE_NAME', 'auth'),
+        access_token,
+        max_age=getattr(settings, 'AUTH_COOKIE_MAX_AGE', int(
+            api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())),
+        httponly=True,
+        samesite='lax',
+    )
+    if refresh_token is not None:
+        response.set_cookie(
+            getattr(settings, 'AUTH_REFRESH_COOKIE_NAME', 'auth_refresh'),
+            refresh_token,
+            max_age=int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+            path=getattr(settings, 'AUTH_REFRESH_COOKIE_PATH', '/'),
+            httponly=True,
+            samesite='strict',
+        )
+    return response
+
+
+def delete_auth_cookies(response):
+    """
+    Delete the access and refresh token cookies.
+
+    :param response: django HttpResponse
+    :return The response
+    """
+    response.delete_cookie(getattr(settings, 'AUTH_COOKIE_NAME', 'auth'))
+    response.delete_cookie(
+        getattr(settings, 'AUTH_REFRESH_COOKIE_NAME', 'auth_refresh'),
+        path=getattr(settings, 'AUTH_REFRESH_COOKIE_PATH', '/'))
+    return response
+
+
+async def aget_or_create_user(extra_data):
+    """
+    Async version of `get_or_create_user`. The upsert runs as one unit on the
+    thread that owns the database connection.
+
+    :param extra_data: Data received from provider
+    :type extra_data: dict
+
+    :return An User instance.
+    :rtype User
+    """
+    return await sync_to_async(get_or_create_user)(extra_data)
+
+
+async def acreate_access_token_for_user(user):
+    """
+    Async version of `create_access_token_for_user`.
+
+    :param user:
+    :return Encoded token
+    """
+    return await sync_to_async(create_access_token_for_user)(user)
+
+
+async def acreate_tokens_for_user(user):
+    """
+    Async version of `create_tokens_for_user`.
+
+    :param user:
+    :return Encoded access and refresh tokens
+    """
+    return await sync_to_async(create_tokens_for_user)(user)
+
+
+async def arender_authentication_error(request, error=AuthError.UNKNOWN,
+                                       exception=None):
+    """
+    Async version of `render_authentication_error`.
+    """
+    return await sync_to_async(render_authentication_error)(
+        request, error=error, exception=exception)
@@ -0,0 +1,259 @@
+"""
+Local copies of the users' provider pictures (`User.profile_photo`):
+    AUTH_AVATARS_ENABLED = True
+    AUTH_AVATAR_SIZES = [32, 64, 128, 256]
+    AUTH_AVATAR_STORAGE = None  # dotted storage class, default_storage if None
+
+The picture is fetched once, after the login in a background thread or with
+`./manage.py fetch_avatars`, cropped to a square and stored as one JPEG
+thumbnail per size under `avatars/<key>/<size>.jpg`, where the key is a
+digest of the fetched image. `User.avatar_source` remembers the fetched url,
+so a picture is only fetched again once the provider's url changes. The
+thumbnails never change for a key, they are served with a strong `ETag` and
+an immutable `Cache-Control`. It requires the `Pillow` package.
+"""
+import hashlib
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage, get_storage_class
+from django.db import connection
+from django.urls import reverse
+
+from rest_auth.models import User
+from rest_auth.user_cache import invalidate_user
+from rest_auth.views.transport import get_transport
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+DEFAULT_SIZES = (32, 64, 128, 256)
+
+
+class AvatarError(Exception):
+    """
+    Raised when a picture can't be fetched or decoded.
+    """
+
+
+def is_enabled():
+    return getattr(settings, 'AUTH_AVATARS_ENABLED', False)
+
+
+def get_sizes():
+    return tuple(sorted(getattr(settings, 'AUTH_AVATAR_SIZES',
+                                DEFAULT_SIZES)))
+
+
+def get_storage():
+    path = getattr(settings, 'AUTH_AVATAR_STORAGE', None)
+    if path is None:
+        return default_storage
+    return get_storage_class(path)()
+
+
+def get_avatar_name(key, size):
+    return 'avatars/%s/%d.jpg' % (key, size)
+
+
+def get_bucket(size):
+    """
+    The smallest stored size of at least `size`, or the largest one.
+    """
+    sizes = get_sizes()
+    for bucket in sizes:
+        if bucket >= size:
+            return bucket
+    return sizes[-1]
+
+
+def make_thumbnails(content, sizes):
+    """
+    Crop a picture to a square and resize it to every size, without
+    upscaling it.
+    :param content: The picture bytes
+    :param sizes: The thumbnail sizes
+    :return: dict of size to JPEG bytes
+    :raise AvatarError: When the picture can't be decoded
+    """
+    if Image is None:
+        raise ImproperlyConfigured('AUTH_AVATARS_ENABLED requires the '
+                                   '`Pillow` package.')
+    try:
+        image = Image.open(io.BytesIO(content))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise AvatarError('Invalid picture: %s' % e)
+
+    thumbnails = {}
+    side = min(image.size)
+    for size in sizes:
+        thumbnail = ImageOps.fit(image, (min(size, side),) * 2,
+                                 Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, 'JPEG', quality=85, optimize=True)
+        thumbnails[size] = buffer.getvalue()
+    return thumbnails
+
+
+def fetch_picture(url):
+    """
+    Download a picture through the provider transport (timeouts, retries and
+    circuit breaker included).
+    :param url: The picture url
+    :return: The picture bytes
+    :raise AvatarError: When the download fails or is too large
+    """
+    max_bytes = getattr(settings, 'AUTH_AVATAR_MAX_BYTES', 5 * 1024 * 1024)
+    resp = get_transport().request('GET', url, endpoint='avatar', stream=True)
+    try:
+        if resp.status_code != 200:
+            raise AvatarError('Fetching %s failed with status %s'
+                              % (url, resp.status_code))
+        if int(resp.headers.get('content-length') or 0) > max_bytes:
+            raise AvatarError('Picture %s exceeds %d bytes'
+                              % (url, max_bytes))
+        return read_body(resp, url, max_bytes)
+    finally:
+        resp.close()
+
+
+def read_body(resp, url, max_bytes, chunk_size=64 * 1024):
+    """
+    Read a streamed response body, the download is aborted as soon as it
+    exceeds `max_bytes`.
+    :param resp: requests or httpx response
+    :return: The body bytes
+    """
+    if hasattr(resp, 'iter_content'):
+        chunks = resp.iter_content(chunk_size)
+    else:
+        chunks = resp.iter_bytes(chunk_size)
+    body = bytearray()
+    for chunk in chunks:
+        body.extend(chunk)
+        if len(body) > max_bytes:
+            raise AvatarError('Picture %s exceeds %d bytes'
+                              % (url, max_bytes))
+    return bytes(body)
+
+
+def store_avatar(content):
+    """
+    Store the thumbnails of a picture, unless they are stored already.
+    :param content: The picture bytes
+    :return: The avatar key
+    """
+    key = hashlib.sha256(content).hexdigest()[:32]
+    storage = get_storage()
+    sizes = get_sizes()
+    if all(storage.exists(get_avatar_name(key, size)) for size in sizes):
+        return key
+    for size, data in make_thumbnails(content, sizes).items():
+        name = get_avatar_name(key, size)
+        if not storage.exists(name):
+            storage.save(name, ContentFile(data))
+    return key
+
+
+def needs_fetch(user):
+    return bool(user.profile_photo) and \
+        user.profile_photo != user.avatar_source
+
+
+def update_avatar(user):
+    """
+    Fetch and store the picture of a user, if its url changed since the last
+    fetch.
+    :param user: User instance
+    :return: The avatar key, or None when nothing changed
+    """
+    if not needs_fetch(user):
+        return None
+    url = user.profile_photo
+    key = store_avatar(fetch_picture(url))
+    # Only if the url didn't change meanwhile
+    User.objects.filter(pk=user.pk, profile_photo=url).update(
+        avatar_key=key, avatar_source=url)
+    invalidate_user(user.pk)
+    user.avatar_key, user.avatar_source = key, url
+    return key
+
+
+class AvatarFetcher(object):
+    """
+    Fetches the pictures in a background thread, one fetch per user at a
+    time.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='rest-auth-avatars')
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, user):
+        """
+        Queue the fetch of the picture of a user, when its url changed.
+        :param user: User instance
+        :return: bool, whether a fetch was queued
+        """
+        if not needs_fetch(user):
+            return False
+        with self._lock:
+            if user.pk in self._pending:
+                return False
+            self._pending.add(user.pk)
+        self._executor.submit(self._run, user.pk)
+        return True
+
+    def _run(self, user_id):
+        try:
+            user = User.objects.filter(pk=user_id).first()
+            if user is not None:
+                update_avatar(user)
+        except Exception:
+            # The next login tries again.
+            pass
+        finally:
+            with self._lock:
+                self._pending.discard(user_id)
+            connection.close()
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def schedule_avatar_fetch(user):
+    """
+    Queue the fetch of a user's picture after a login, when avatars are
+    enabled. It never blocks the login.
+    :param user: User instance
+    """
+    global _fetcher
+    if not is_enabled() or not needs_fetch(user):
+        return
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AvatarFetcher()
+    _fetcher.schedule(user)
+
+
+def get_avatar_url(user, size=64):
+    """
+    The url of a user's avatar of at least `size` pixels: the local
+    thumbnail when it was fetched, the provider's url otherwise.
+    :param user: User instance
+    :param size: The displayed size in pixels
+    :return: The url or None
+    """
+    if is_enabled() and user.avatar_key:
+        return reverse('avatar', args=(user.avatar_key, get_bucket(size)))
+    return user.profile_photo
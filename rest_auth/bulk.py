@@ -0,0 +1,263 @@
+"""
+Streaming import and export of users and their social accounts, used by the
+`import_users` and `export_users` commands. A row holds a `SocialAccount`
+and its `User`:
+
+    email, first_name, last_name, profile_photo, is_active, date_joined,
+    provider, uid, extra_data
+
+as CSV (`extra_data` JSON encoded) or JSON lines. Rows are read, written and
+saved in chunks, so memory stays flat whatever the size of the file.
+"""
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Upper
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from rest_auth.auth_utils import get_extra_data_digest
+from rest_auth.models import SocialAccount, User
+
+FIELDS = ('email', 'first_name', 'last_name', 'profile_photo', 'is_active',
+          'date_joined', 'provider', 'uid', 'extra_data')
+FORMATS = ('csv', 'jsonl')
+FALSE_VALUES = ('0', 'false', 'no', 'n', 'f', 'off')
+
+
+def get_format(path, fmt=None):
+    """
+    The format of a file, given or guessed from its extension.
+    """
+    if fmt:
+        return fmt
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def open_stream(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    return open(path, mode, newline='', encoding='utf-8')
+
+
+def read_rows(stream, fmt):
+    """
+    Iterate over the rows of a CSV or JSON lines stream.
+    :param stream: Text stream
+    :param fmt: 'csv' or 'jsonl'
+    :return: Iterator of dicts
+    """
+    if fmt == 'csv':
+        csv.field_size_limit(2 ** 24)
+        for row in csv.DictReader(stream):
+            if row.get('extra_data'):
+                row['extra_data'] = json.loads(row['extra_data'])
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+class RowWriter(object):
+    """
+    Write rows to a CSV or JSON lines stream.
+    """
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            row = dict(row, extra_data=json.dumps(row['extra_data'],
+                                                  sort_keys=True))
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, sort_keys=True,
+                                         separators=(',', ':')) + '\n')
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class Progress(object):
+    """
+    Row counters with a throughput, reported every `every` rows.
+
+    :param report: callable receiving the progress line
+    :param every: Rows between two reports
+    """
+    def __init__(self, report, every=10000):
+        self.report = report
+        self.every = every
+        self.counts = {}
+        self.rows = 0
+        self._next = every
+        self._start = time.perf_counter()
+
+    def add(self, rows=0, **counts):
+        self.rows += rows
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+        if self.every and self.rows >= self._next:
+            self._next = self.rows + self.every
+            self.report(self.summary())
+
+    def rate(self):
+        elapsed = time.perf_counter() - self._start
+        return self.rows / elapsed if elapsed else 0.0
+
+    def summary(self):
+        counts = ''.join(', %d %s' % (count, name)
+                         for name, count in sorted(self.counts.items()))
+        return '%d rows%s, %.0f rows/s' % (self.rows, counts, self.rate())
+
+
+def clean_row(row):
+    """
+    Normalize an imported row.
+    :return: The row or None when it is invalid
+    """
+    email = User.objects.normalize_email((row.get('email') or '').strip())
+    provider = (row.get('provider') or '').strip()
+    uid = str(row.get('uid') or '').strip()
+    if not email or not provider or not uid:
+        return None
+    # Blank or missing means the default, only explicit false values
+    # deactivate.
+    is_active = row.get('is_active')
+    if isinstance(is_active, str):
+        is_active = is_active.strip().lower() not in FALSE_VALUES
+    elif is_active is None:
+        is_active = True
+    date_joined = row.get('date_joined')
+    if isinstance(date_joined, str):
+        date_joined = parse_datetime(date_joined) if date_joined else None
+    return {
+        'email': email,
+        'first_name': row.get('first_name') or '',
+        'last_name': row.get('last_name') or '',
+        'profile_photo': row.get('profile_photo') or None,
+        'is_active': is_active,
+        'date_joined': date_joined or timezone.now(),
+        'provider': provider,
+        'uid': uid,
+        'extra_data': row.get('extra_data') or {},
+    }
+
+
+def import_chunk(rows):
+    """
+    Create the users and social accounts of a chunk of rows, in one
+    transaction. Rows whose (provider, uid) exists already are skipped, as
+    well as rows whose email belongs to another user (the same rule as
+    `get_or_create_user`).
+    :param rows: Cleaned rows
+    :return: dict of counters
+    """
+    counts = {'created': 0, 'existing': 0, 'conflicts': 0}
+    # First row wins inside the chunk
+    by_account, emails = {}, set()
+    for row in rows:
+        key = (row['provider'], row['uid'])
+        if key in by_account or row['email'].upper() in emails:
+            counts['conflicts'] += 1
+            continue
+        by_account[key] = row
+        emails.add(row['email'].upper())
+    if not by_account:
+        return counts
+
+    uids = {}
+    for provider, uid in by_account:
+        uids.setdefault(provider, []).append(uid)
+    lookup = Q()
+    for provider, provider_uids in uids.items():
+        lookup |= Q(provider=provider, uid__in=provider_uids)
+    for key in SocialAccount.objects.filter(lookup) \
+            .values_list('provider', 'uid'):
+        if by_account.pop(key, None) is not None:
+            counts['existing'] += 1
+
+    users = User.objects.annotate(email_upper=Upper('email'))
+    taken = set(users.filter(
+        email_upper__in=[row['email'].upper() for row in by_account.values()]
+    ).values_list('email_upper', flat=True))
+    new_rows = [row for row in by_account.values()
+                if row['email'].upper() not in taken]
+    counts['conflicts'] += len(by_account) - len(new_rows)
+    if not new_rows:
+        return counts
+
+    # Each unusable password is random, it tells the users inserted here from
+    # the ones a concurrent signup created with the same email meanwhile.
+    passwords = {row['email'].upper(): make_password(None)
+                 for row in new_rows}
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(email=row['email'], first_name=row['first_name'],
+                 last_name=row['last_name'],
+                 profile_photo=row['profile_photo'],
+                 is_active=row['is_active'], date_joined=row['date_joined'],
+                 password=passwords[row['email'].upper()])
+            for row in new_rows
+        ], ignore_conflicts=True)
+        # Primary keys aren't returned with ignore_conflicts
+        user_ids = {
+            email_upper: pk for email_upper, pk, password in users.filter(
+                email_upper__in=list(passwords)
+            ).values_list('email_upper', 'pk', 'password')
+            if passwords[email_upper] == password
+        }
+        accounts = [
+            SocialAccount(user_id=user_ids[row['email'].upper()],
+                          provider=row['provider'], uid=row['uid'],
+                          extra_data=row['extra_data'],
+                          extra_data_digest=get_extra_data_digest(
+                              row['extra_data']))
+            for row in new_rows if row['email'].upper() in user_ids
+        ]
+        SocialAccount.objects.bulk_create(accounts, ignore_conflicts=True)
+    counts['created'] += len(accounts)
+    counts['conflicts'] += len(new_rows) - len(accounts)
+    return counts
+
+
+def export_rows(chunk_size=2000):
+    """
+    Iterate over the social accounts and their users as rows.
+    :param chunk_size: Rows fetched per query
+    :return: Iterator of dicts
+    """
+    accounts = SocialAccount.objects.select_related('user').only(
+        'provider', 'uid', 'extra_data', 'user__email', 'user__first_name',
+        'user__last_name', 'user__profile_photo', 'user__is_active',
+        'user__date_joined').order_by('pk')
+    for account in accounts.iterator(chunk_size=chunk_size):
+        user = account.user
+        yield {
+            'email': user.email,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'profile_photo': user.profile_photo,
+            'is_active': user.is_active,
+            'date_joined': user.date_joined.isoformat(),
+            'provider': account.provider,
+            'uid': account.uid,
+            'extra_data': account.extra_data,
+        }
@@ -0,0 +1,283 @@
+"""
+Single-flight handling of duplicate callbacks. Double clicks, browser retries
+and proxy replays send the same authorization code several times, only the
+first token exchange can succeed. The callbacks are keyed by a digest of the
+provider, `code` and `state`: the first one logs the user in, the concurrent
+and late duplicates wait for it and get the same tokens (and redirect)
+instead of an error.
+    AUTH_CALLBACK_COALESCE = 'local'  # or 'django' across processes, None
+    AUTH_CALLBACK_COALESCE_TIMEOUT = 15  # seconds a duplicate waits
+    AUTH_CALLBACK_COALESCE_TTL = 30  # seconds the outcome is kept
+    AUTH_CALLBACK_COALESCE_CACHE_ALIAS = 'default'  # 'django' only
+
+Callbacks are only coalesced once their `state` matched the signed login
+state cookie, i.e. they come from the browser that started the login. With
+the 'django' backend the issued tokens are kept in the cache for
+`AUTH_CALLBACK_COALESCE_TTL` seconds. The duplicates waiting on a callback
+that fails fail too, without calling the provider; one that waited
+`AUTH_CALLBACK_COALESCE_TIMEOUT` seconds in vain does the login itself.
+"""
+import asyncio
+import hashlib
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_auth.cache import LRUCache
+from rest_auth.exceptions import OAuth2Error
+
+# Seconds a failure is kept, only for the duplicates already waiting
+FAILURE_TTL = 5
+
+
+class CoalescedError(OAuth2Error):
+    """
+    Raised in the duplicates of a failed callback.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(message='The first callback with this code failed',
+                         cause='coalesced')
+
+
+def get_flight_key(provider, code, state):
+    """
+    Key of a callback, the code itself is not kept.
+    """
+    value = '%s\x1f%s\x1f%s' % (provider, code, state or '')
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def unwrap(outcome):
+    succeeded, value = outcome
+    if not succeeded:
+        raise CoalescedError()
+    return value
+
+
+def get_outcome_ttl(outcome, ttl):
+    return ttl if outcome[0] else min(ttl, FAILURE_TTL)
+
+
+class Flight(object):
+    __slots__ = ('event', 'outcome')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.outcome = None
+
+
+class LocalCoalescer(object):
+    """
+    Per-process single-flight. Waiting duplicates block their thread (or
+    poll on the event loop, see `arun`).
+    """
+    poll_interval = 0.01
+
+    def __init__(self, timeout=15, ttl=30, max_size=10000):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.outcomes = LRUCache(max_size=max_size)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key):
+        """
+        :return: (Flight, whether the caller runs it, outcome of a completed
+            flight or None)
+        """
+        outcome = self.outcomes.get(key)
+        if outcome is not None:
+            return None, False, outcome
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                return flight, False, None
+            flight = self._flights[key] = Flight()
+            return flight, True, None
+
+    def land(self, key, flight, outcome):
+        flight.outcome = outcome
+        self.outcomes.set(key, outcome,
+                          time.time() + get_outcome_ttl(outcome, self.ttl))
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.event.set()
+
+    def run(self, key, func):
+        """
+        Run `func` once for concurrent callers of the same key.
+        :param key: The flight key, see `get_flight_key`
+        :param func: callable doing the login
+        :return: (result, whether this caller ran `func`)
+        :raise CoalescedError: When the first caller failed
+        """
+        flight, leader, outcome = self.join(key)
+        if outcome is not None:
+            return unwrap(outcome), False
+        if not leader:
+            if flight.event.wait(self.timeout):
+                return unwrap(flight.outcome), False
+            return func(), True
+        outcome = (False, None)
+        try:
+            value = func()
+            outcome = (True, value)
+        finally:
+            self.land(key, flight, outcome)
+        return value, True
+
+    async def arun(self, key, func):
+        """
+        `run` for async views, `func` returns an awaitable.
+        """
+        flight, leader, outcome = self.join(key)
+        if outcome is not None:
+            return unwrap(outcome), False
+        if not leader:
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                if flight.event.is_set():
+                    return unwrap(flight.outcome), False
+                await asyncio.sleep(self.poll_interval)
+            return await func(), True
+        outcome = (False, None)
+        try:
+            value = await func()
+            outcome = (True, value)
+        finally:
+            self.land(key, flight, outcome)
+        return value, True
+
+
+class DjangoCoalescer(object):
+    """
+    Single-flight across processes through Django's cache framework. The
+    first callback takes a lock with `cache.add`, the duplicates poll for
+    its outcome.
+    """
+    key_prefix = 'rest_auth:callback:'
+    poll_interval = 0.05
+
+    def __init__(self, timeout=15, ttl=30, alias='default'):
+        self.timeout = timeout
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def join(self, key):
+        """
+        :return: (whether the caller runs the flight, outcome or None)
+        """
+        outcome = self.cache.get(self.key_prefix + key)
+        if outcome is not None:
+            return False, outcome
+        return self.cache.add(self.key_prefix + 'lock:' + key, 1,
+                              self.timeout), None
+
+    def poll(self, key):
+        return self.cache.get(self.key_prefix + key)
+
+    def land(self, key, outcome):
+        self.cache.set(self.key_prefix + key, outcome,
+                       get_outcome_ttl(outcome, self.ttl))
+        self.cache.delete(self.key_prefix + 'lock:' + key)
+
+    def run(self, key, func):
+        leader, outcome = self.join(key)
+        if outcome is not None:
+            return unwrap(outcome), False
+        if not leader:
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                outcome = self.poll(key)
+                if outcome is not None:
+                    return unwrap(outcome), False
+            return func(), True
+        outcome = (False, None)
+        try:
+            value = func()
+            outcome = (True, value)
+        finally:
+            self.land(key, outcome)
+        return value, True
+
+    async def arun(self, key, func):
+        leader, outcome = await sync_to_async(self.join)(key)
+        if outcome is not None:
+            return unwrap(outcome), False
+        if not leader:
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                outcome = await sync_to_async(self.poll)(key)
+                if outcome is not None:
+                    return unwrap(outcome), False
+            return await func(), True
+        outcome = (False, None)
+        try:
+            value = await func()
+            outcome = (True, value)
+        finally:
+            await sync_to_async(self.land)(key, outcome)
+        return value, True
+
+
+_coalescer = None
+_coalescer_config = None
+_coalescer_lock = threading.Lock()
+
+
+def get_coalescer():
+    """
+    Return the configured coalescer.
+    :return: LocalCoalescer, DjangoCoalescer or None if disabled
+    """
+    global _coalescer, _coalescer_config
+    config = (
+        getattr(settings, 'AUTH_CALLBACK_COALESCE', 'local'),
+        getattr(settings, 'AUTH_CALLBACK_COALESCE_TIMEOUT', 15),
+        getattr(settings, 'AUTH_CALLBACK_COALESCE_TTL', 30),
+        getattr(settings, 'AUTH_CALLBACK_COALESCE_CACHE_ALIAS', 'default'),
+    )
+    if config != _coalescer_config:
+        with _coalescer_lock:
+            backend, timeout, ttl, alias = config
+            if backend == 'local':
+                _coalescer = LocalCoalescer(timeout=timeout, ttl=ttl)
+            elif backend == 'django':
+                _coalescer = DjangoCoalescer(timeout=timeout, ttl=ttl,
+                                             alias=alias)
+            else:
+                _coalescer = None
+            _coalescer_config = config
+    return _coalescer
+
+
+def run_once(key, func):
+    """
+    Run the login of a callback once for its duplicates.
+    :param key: The flight key, see `get_flight_key`
+    :param func: callable doing the login
+    :return: (result, whether this callback ran `func`)
+    """
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return func(), True
+    return coalescer.run(key, func)
+
+
+async def arun_once(key, func):
+    """
+    `run_once` for async views, `func` returns an awaitable.
+    """
+    coalescer = get_coalescer()
+    if coalescer is None:
+        return await func(), True
+    return await coalescer.arun(key, func)
@@ -18,7 +18,9 @@ class AccountExistError(Exception):
 
 class OAuth2Error(Exception):
     """
-    This exception used for general oauth errors.
+    This exception used for general oauth errors. The `cause` names the step
+    that failed, e.g. 'token_exchange' or 'id_token'.
     """
-    def __init__(self, message, *args, **kwargs):
+    def __init__(self, message, cause=None, *args, **kwargs):
         self.message = message
+        self.cause = cause
@@ -0,0 +1,169 @@
+"""
+Local fake of Google's OAuth2 endpoints, used to load test the login flow
+without calling Google. It serves the authorize, token, userinfo and jwks
+endpoints over real HTTP, with configurable latency and error rate:
+
+    with FakeGoogleServer(latency=0.05, error_rate=0.01) as server:
+        with server.patch_adapter(GoogleOAuth2Adapter):
+            ...
+"""
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from rest_auth.providers import registry
+from rest_auth.testing import StubProvider
+from rest_auth.views.google import GoogleOAuth2Adapter
+
+
+class FakeGoogleHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request(parse_qs(urlparse(self.path).query))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode()
+        self.handle_request(parse_qs(body))
+
+    def handle_request(self, query):
+        server = self.server.fake
+        params = {key: values[0] for key, values in query.items()}
+        path = urlparse(self.path).path
+        server.record(path)
+        if server.latency:
+            time.sleep(server.latency * random.uniform(0.5, 1.5))
+
+        if path == server.authorize_path:
+            self.authorize(server, params)
+            return
+        if random.random() < server.error_rate:
+            self.send_json({'error': 'backend_error'}, 503)
+            return
+
+        provider = server.provider
+        if path == server.token_path and self.command == 'POST':
+            resp = provider.token_response(params)
+        elif path == server.userinfo_path:
+            resp = provider.userinfo_response(params.get('access_token'))
+        elif path == server.jwks_path and provider.private_key is not None:
+            self.send_json(provider.jwks, 200,
+                           {'Cache-Control': 'public, max-age=3600'})
+            return
+        else:
+            self.send_json({'error': 'not_found'}, 404)
+            return
+        self.send_json(resp.json(), resp.status_code)
+
+    def authorize(self, server, params):
+        code = server.provider.authorize(uid=server.pick_user())
+        query = {'code': code}
+        if params.get('state'):
+            query['state'] = params['state']
+        self.send_response(302)
+        self.send_header('Location', '%s?%s' % (params['redirect_uri'],
+                                                urlencode(query)))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_json(self, data, status, headers=None):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeGoogleServer(object):
+    """
+    Threaded HTTP server faking Google's OAuth2 endpoints.
+
+    :param latency: Mean delay added to each response, in seconds
+    :param error_rate: Fraction of token/userinfo/jwks calls answered with 503
+    :param users: Number of distinct users handed out by the authorize
+        endpoint, so that repeated flows cover returning users
+    :param id_token: Whether the token response carries a signed id token
+    :param audience: The id token audience, the oauth2 client id
+    """
+    authorize_path = '/o/oauth2/auth'
+    token_path = '/o/oauth2/token'
+    userinfo_path = '/oauth2/v1/userinfo'
+    jwks_path = '/oauth2/v3/certs'
+
+    def __init__(self, latency=0.0, error_rate=0.0, users=1000,
+                 id_token=False, audience=None, host='127.0.0.1', port=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.users = users
+        self.provider = StubProvider(adapter=GoogleOAuth2Adapter,
+                                     id_token=id_token, audience=audience)
+        self.counts = {}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), FakeGoogleHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def pick_user(self):
+        return 'fake-user-%d' % random.randrange(self.users)
+
+    def record(self, path):
+        with self._lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def patch_adapter(self, adapter):
+        """
+        Point the adapter's endpoints to this server for the duration of the
+        block. The adapter's key set is reset so that, in id token mode, it
+        is fetched from the fake jwks endpoint, and the provider registry is
+        rebuilt with the new endpoints.
+        """
+        names = ('authorize_url', 'access_token_url', 'profile_url',
+                 'jwks_url', 'jwks')
+        previous = {name: getattr(adapter, name) for name in names}
+        adapter.authorize_url = self.url + self.authorize_path
+        adapter.access_token_url = self.url + self.token_path
+        adapter.profile_url = self.url + self.userinfo_path
+        adapter.jwks_url = self.url + self.jwks_path
+        adapter.jwks = None
+        registry.build()
+        try:
+            yield self
+        finally:
+            for name, value in previous.items():
+                setattr(adapter, name, value)
+            registry.build()
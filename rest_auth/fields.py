@@ -0,0 +1,76 @@
+import base64
+import json
+import zlib
+
+from django.db import models
+
+COMPRESSED_KEY = '_z'
+
+
+class CompactJSONField(models.JSONField):
+    """
+    Database agnostic JSON field storing a dict compactly: the keys of
+    `keep_keys` are stored as is, the other keys are zlib compressed into a
+    single `_z` key when `compress` is set (when it saves space), or dropped
+    otherwise. Reading the field returns the whole dict again.
+
+    Only the kept keys can be used in lookups, e.g. `extra_data__email`.
+
+    :param keep_keys: Keys stored uncompressed, None keeps every key
+    :param compress: Whether the other keys are compressed or dropped
+    """
+    def __init__(self, *args, keep_keys=None, compress=True, **kwargs):
+        self.keep_keys = tuple(keep_keys) if keep_keys is not None else None
+        self.compress = compress
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if self.keep_keys is not None:
+            kwargs['keep_keys'] = list(self.keep_keys)
+        if not self.compress:
+            kwargs['compress'] = False
+        return name, path, args, kwargs
+
+    def compact(self, value):
+        """
+        The stored form of a value.
+        :param value: The dict to store
+        :return: The compacted dict
+        """
+        if not isinstance(value, dict) or self.keep_keys is None:
+            return value
+        kept = {key: item for key, item in value.items()
+                if key in self.keep_keys}
+        rest = {key: item for key, item in value.items()
+                if key not in self.keep_keys}
+        if not rest or not self.compress:
+            return kept
+        encoded = json.dumps(rest, cls=self.encoder, sort_keys=True,
+                             separators=(',', ':'))
+        compressed = base64.b64encode(
+            zlib.compress(encoded.encode(), 9)).decode('ascii')
+        if len(compressed) < len(encoded):
+            kept[COMPRESSED_KEY] = compressed
+        else:
+            kept.update(rest)
+        return kept
+
+    def expand(self, value):
+        if not isinstance(value, dict) or COMPRESSED_KEY not in value:
+            return value
+        value = dict(value)
+        rest = json.loads(zlib.decompress(
+            base64.b64decode(value.pop(COMPRESSED_KEY))).decode(),
+            cls=self.decoder)
+        rest.update(value)
+        return rest
+
+    def get_db_prep_save(self, value, connection):
+        # Lookups go through get_prep_value, only the saved values are
+        # compacted.
+        return super().get_db_prep_save(self.compact(value), connection)
+
+    def from_db_value(self, value, expression, connection):
+        value = super().from_db_value(value, expression, connection)
+        return self.expand(value)
@@ -0,0 +1,142 @@
+"""
+Write-behind buffer for `SocialAccount.last_login`.
+
+Returning logins only record the account id and the login time in memory.
+The pending touches are coalesced per account and written with one
+`bulk_update` by a background thread every `AUTH_LAST_LOGIN_FLUSH_INTERVAL`
+seconds, when `AUTH_LAST_LOGIN_MAX_PENDING` accounts are waiting, and at
+process exit. Setting the interval to 0 writes each touch inline.
+"""
+import atexit
+import os
+import threading
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from rest_auth.models import SocialAccount
+
+
+class LastLoginBuffer(object):
+    """
+    Thread-safe buffer of pending `last_login` updates.
+    """
+    batch_size = 500
+
+    def __init__(self, interval=30, max_pending=1000):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def touch(self, account_id, when=None):
+        """
+        Record a login of the account.
+        :param account_id: The SocialAccount primary key
+        :param when: The login time, defaults to now
+        """
+        when = when or timezone.now()
+        if not self.interval:
+            SocialAccount.objects.filter(pk=account_id).update(
+                last_login=when)
+            return
+
+        self._ensure_thread()
+        with self._lock:
+            self._pending[account_id] = when
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write all the pending updates.
+        :return: The number of accounts updated
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        accounts = [SocialAccount(pk=pk, last_login=when)
+                    for pk, when in pending.items()]
+        SocialAccount.objects.bulk_update(accounts, ['last_login'],
+                                          batch_size=self.batch_size)
+        return len(accounts)
+
+    def pending(self):
+        return len(self._pending)
+
+    def _ensure_thread(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            # Pending touches inherited from a parent process are its own.
+            self._pending = {}
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='rest-auth-last-login')
+            self._thread.start()
+            self._pid = pid
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Retry the next batch, last_login is advisory.
+                pass
+            finally:
+                connection.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_last_login_buffer():
+    """
+    Return the buffer of this process.
+    :return: LastLoginBuffer instance
+    """
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = LastLoginBuffer(
+                    interval=getattr(
+                        settings, 'AUTH_LAST_LOGIN_FLUSH_INTERVAL', 30),
+                    max_pending=getattr(
+                        settings, 'AUTH_LAST_LOGIN_MAX_PENDING', 1000),
+                )
+    return _buffer
+
+
+def touch_last_login(account_id):
+    get_last_login_buffer().touch(account_id)
+
+
+def flush_last_login():
+    """
+    Flush the pending updates of this process, e.g. from a server hook.
+    :return: The number of accounts updated
+    """
+    if _buffer is None:
+        return 0
+    return _buffer.flush()
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        flush_last_login()
+    except Exception:
+        pass
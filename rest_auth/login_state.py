@@ -0,0 +1,121 @@
+"""
+CSRF protection of the login flow without server side storage.
+
+`OAuth2LoginView` generates a random `state` and, when the provider supports
+it, a PKCE `code_verifier` (RFC 7636). They are signed and time-stamped with
+`django.core.signing` and set in a cookie only sent to the provider's
+callback path:
+    AUTH_STATE_COOKIE_NAME = 'auth_state'
+    AUTH_STATE_MAX_AGE = 600
+
+`OAuth2CallbackView` checks the signature, the age and the `state` parameter
+returned by the provider against that cookie, so no session row is written
+or read and any process can serve the callback.
+"""
+import base64
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare
+
+from rest_auth.exceptions import OAuth2Error
+
+SALT = 'rest_auth.login_state'
+
+
+class LoginState(object):
+    """
+    The state of a login flow.
+    """
+    __slots__ = ('state', 'code_verifier')
+
+    def __init__(self, state, code_verifier=None):
+        self.state = state
+        self.code_verifier = code_verifier
+
+
+def get_code_challenge(code_verifier):
+    """
+    The S256 code challenge of a PKCE code verifier.
+    :param code_verifier: The code verifier
+    :return: The code challenge
+    """
+    digest = hashlib.sha256(code_verifier.encode('ascii')).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def get_cookie_name():
+    return getattr(settings, 'AUTH_STATE_COOKIE_NAME', 'auth_state')
+
+
+def create_login_state(provider):
+    """
+    Generate the state of a new login flow.
+    :param provider: ProviderConfig instance
+    :return: LoginState instance
+    """
+    # 43 to 128 characters are allowed for the code verifier
+    code_verifier = secrets.token_urlsafe(48) if provider.pkce else None
+    return LoginState(secrets.token_urlsafe(24), code_verifier)
+
+
+def set_login_state(response, provider, login_state):
+    """
+    Set the signed login state cookie on the login redirect.
+    :param response: django HttpResponse
+    :param provider: ProviderConfig instance
+    :param login_state: LoginState instance
+    :return: The response
+    """
+    value = {'p': provider.id, 's': login_state.state}
+    if login_state.code_verifier is not None:
+        value['v'] = login_state.code_verifier
+    response.set_cookie(
+        get_cookie_name(),
+        signing.dumps(value, salt=SALT),
+        max_age=getattr(settings, 'AUTH_STATE_MAX_AGE', 600),
+        path=provider.callback_path,
+        httponly=True,
+        # Sent on the top-level redirect back from the provider
+        samesite='lax',
+    )
+    return response
+
+
+def load_login_state(request, provider):
+    """
+    Verify the state returned to the callback against the login state cookie.
+    :param request: django HttpRequest
+    :param provider: ProviderConfig instance
+    :return: LoginState instance
+    :raise OAuth2Error: When the cookie is missing, forged or expired, or
+        the state doesn't match
+    """
+    value = request.COOKIES.get(get_cookie_name())
+    if not value:
+        raise OAuth2Error(message='Missing login state', cause='state')
+    try:
+        value = signing.loads(value, salt=SALT, max_age=getattr(
+            settings, 'AUTH_STATE_MAX_AGE', 600))
+    except signing.BadSignature:
+        # SignatureExpired is a BadSignature as well
+        raise OAuth2Error(message='Invalid or expired login state',
+                          cause='state')
+    state = request.GET.get('state', '')
+    if not isinstance(value, dict) or value.get('p') != provider.id or \
+            not constant_time_compare(value.get('s', ''), state):
+        raise OAuth2Error(message='Login state mismatch', cause='state')
+    return LoginState(value['s'], value.get('v'))
+
+
+def delete_login_state(response, provider):
+    """
+    Delete the login state cookie, a state is only used once.
+    :param response: django HttpResponse
+    :param provider: ProviderConfig instance
+    :return: The response
+    """
+    response.delete_cookie(get_cookie_name(), path=provider.callback_path)
+    return response
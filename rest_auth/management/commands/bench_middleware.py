@@ -0,0 +1,121 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment
+from django.urls import include, path, reverse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from rest_auth.auth_utils import create_access_token_for_user
+from rest_auth.middleware import DEFAULT_LEAN_PATHS, LEAN_MIDDLEWARE
+from rest_auth.models import User
+
+API_PREFIX = '/api/'
+
+
+class BenchView(APIView):
+    """
+    Minimal protected API view, authenticated with the default DRF
+    authentication classes.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response({'id': request.user.pk})
+
+
+# The project urls and the benchmarked API view
+urlpatterns = [
+    path('api/bench/', BenchView.as_view(), name='bench_api'),
+    path('', include(settings.ROOT_URLCONF)),
+]
+
+
+def get_profiles():
+    """
+    The `MIDDLEWARE` setting with the Django and with the lean session,
+    CSRF, authentication and message middleware.
+    :return: dict of profile name to middleware paths
+    """
+    stock = {lean: middleware for middleware, lean in LEAN_MIDDLEWARE.items()}
+    standard = [stock.get(middleware, middleware)
+                for middleware in settings.MIDDLEWARE]
+    return {
+        'standard': standard,
+        'lean': [LEAN_MIDDLEWARE.get(middleware, middleware)
+                 for middleware in standard],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Measure the per request time of the OAuth2 and JWT API routes '
+            'with the Django session, CSRF, authentication and message '
+            'middleware, and with their lean versions skipping those '
+            'routes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=500,
+                            help='Requests per route and profile.')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            user = User.objects.create(email='bench@example.com')
+            token = create_access_token_for_user(user)
+            results = {name: self.run_profile(middleware, token,
+                                              options['repeat'])
+                       for name, middleware in get_profiles().items()}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.report(results)
+
+    def run_profile(self, middleware, token, repeat):
+        lean_paths = list(getattr(settings, 'AUTH_LEAN_PATHS',
+                                  DEFAULT_LEAN_PATHS))
+        # The repeated logins of a single client would be throttled
+        with override_settings(MIDDLEWARE=middleware, ROOT_URLCONF=__name__,
+                               AUTH_LEAN_PATHS=lean_paths + [API_PREFIX],
+                               AUTH_THROTTLE_BACKEND=None):
+            client = Client()
+            client.cookies[getattr(settings, 'AUTH_COOKIE_NAME',
+                                   'auth')] = token
+            routes = {
+                'login_redirect': reverse('oauth2_login', args=('google',)),
+                'jwks': reverse('jwks'),
+                'api_request': reverse('bench_api'),
+            }
+            return {route: self.measure(client, url, repeat)
+                    for route, url in routes.items()}
+
+    def measure(self, client, url, repeat):
+        # Warm up the url resolver, the token and revocation caches.
+        for _ in range(10):
+            client.get(url)
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            runs.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.stderr.write('%s answered with status %s'
+                              % (url, response.status_code))
+        return statistics.median(runs) * 1e6
+
+    def report(self, results):
+        self.stdout.write('%-16s %12s %12s %12s' % (
+            'route', 'standard', 'lean', 'saved'))
+        for route, standard in results['standard'].items():
+            lean = results['lean'][route]
+            self.stdout.write('%-16s %10.1fus %10.1fus %10.1fus (%.0f%%)' % (
+                route, standard, lean, standard - lean,
+                (standard - lean) / standard * 100))
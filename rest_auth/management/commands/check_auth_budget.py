@@ -0,0 +1,14 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Run the performance budget tests: the login callback and '
+            'authenticated API requests against a stub provider must match '
+            'their query and outbound HTTP budgets, and their median latency '
+            'an opt-in one. Same as `./manage.py test '
+            'rest_auth.tests.test_budgets`.')
+
+    def handle(self, *args, **options):
+        call_command('test', 'rest_auth.tests.test_budgets',
+                     interactive=False, verbosity=options['verbosity'])
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from rest_auth.bulk import FORMATS, Progress, RowWriter, export_rows, \
+    get_format, open_stream
+
+
+class Command(BaseCommand):
+    help = ('Stream the social accounts and their users to a CSV or JSON '
+            'lines file, read in chunks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The output file, - for stdout.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched per query.')
+        parser.add_argument('--progress', type=int, default=10000,
+                            help='Rows between two progress reports, 0 '
+                                 'disables them.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        progress = Progress(self.stderr.write, options['progress'])
+        stream = open_stream(path, 'w')
+        try:
+            writer = RowWriter(stream, get_format(path, options['format']))
+            for row in export_rows(options['chunk_size']):
+                writer.write(row)
+                progress.add(1)
+        finally:
+            if path != '-':
+                stream.close()
+        self.stderr.write('Exported %s.' % progress.summary())
@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from rest_auth.models import SocialAccount
+
+
+class Command(BaseCommand):
+    help = ('Report the bytes each SocialAccount.extra_data takes compacted, '
+            'compared with the whole payload stored as plain JSON.')
+
+    def handle(self, *args, **options):
+        field = SocialAccount._meta.get_field('extra_data')
+        rows = full_total = stored_total = 0
+        for pk, value in SocialAccount.objects.values_list(
+                'pk', 'extra_data').order_by('pk').iterator():
+            full = len(json.dumps(value, cls=field.encoder).encode())
+            stored = len(json.dumps(field.compact(value),
+                                    cls=field.encoder).encode())
+            rows += 1
+            full_total += full
+            stored_total += stored
+            if options['verbosity'] > 1:
+                self.stdout.write('%-10s %8d -> %8d bytes, %d saved' % (
+                    pk, full, stored, full - stored))
+
+        if not rows:
+            self.stdout.write('No social accounts.')
+            return
+        saved = full_total - stored_total
+        self.stdout.write(
+            '%d rows: %.0f -> %.0f bytes per row, %.0f saved per row '
+            '(%.0f%%), %d bytes saved in total.' % (
+                rows, full_total / rows, stored_total / rows, saved / rows,
+                saved / full_total * 100, saved))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+
+from rest_auth import avatars
+from rest_auth.avatars import AvatarError, update_avatar
+from rest_auth.exceptions import OAuth2Error
+from rest_auth.models import User
+from rest_auth.views.transport import TRANSPORT_ERRORS
+
+
+class Command(BaseCommand):
+    help = ('Fetch the pictures of the users whose provider url changed '
+            'since the last fetch and store their thumbnails.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=None,
+                            help='Maximum number of users to process.')
+
+    def handle(self, *args, **options):
+        if avatars.Image is None:
+            raise CommandError('Storing avatars requires the `Pillow` '
+                               'package.')
+
+        users = User.objects.exclude(profile_photo__isnull=True) \
+            .exclude(profile_photo='') \
+            .filter(Q(avatar_source__isnull=True) |
+                    ~Q(avatar_source=F('profile_photo'))) \
+            .order_by('pk')
+        if options['limit'] is not None:
+            users = users[:options['limit']]
+
+        fetched = failed = 0
+        for user in users.iterator():
+            # A failing picture or provider host doesn't stop the batch, e.g.
+            # an open circuit (OAuth2Error) or a timeout.
+            try:
+                if update_avatar(user) is not None:
+                    fetched += 1
+            except (AvatarError, OAuth2Error, *TRANSPORT_ERRORS) as e:
+                failed += 1
+                self.stderr.write('User %s: %s' % (user.pk, e))
+        self.stdout.write('Fetched %d avatars, %d failed.' % (fetched, failed))
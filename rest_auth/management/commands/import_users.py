@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from rest_auth.bulk import FORMATS, Progress, chunked, clean_row, \
+    get_format, import_chunk, open_stream, read_rows
+
+
+class Command(BaseCommand):
+    help = ('Stream users and their social accounts from a CSV or JSON lines '
+            'file, created in chunks. Existing (provider, uid) pairs and '
+            'emails of other users are skipped.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='The file to import, - for stdin.')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows created per transaction.')
+        parser.add_argument('--progress', type=int, default=10000,
+                            help='Rows between two progress reports, 0 '
+                                 'disables them.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        progress = Progress(self.stderr.write, options['progress'])
+        stream = open_stream(path, 'r')
+        try:
+            rows = read_rows(stream, get_format(path, options['format']))
+            for chunk in chunked(rows, options['chunk_size']):
+                cleaned = [clean_row(row) for row in chunk]
+                valid = [row for row in cleaned if row is not None]
+                progress.add(len(chunk), invalid=len(chunk) - len(valid),
+                             **import_chunk(valid))
+        finally:
+            if path != '-':
+                stream.close()
+        self.stdout.write('Imported %s.' % progress.summary())
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.test.utils import setup_test_environment, \
+    teardown_test_environment
+from django.urls import reverse
+
+from rest_auth.fake_provider import FakeGoogleServer
+from rest_auth.last_login import flush_last_login
+from rest_auth.views.google import GoogleOAuth2Adapter
+
+
+class QueryCounter(object):
+    """
+    Count the queries of every database connection, in all threads.
+    """
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        with self._lock:
+            self.count += 1
+        return execute(sql, params, many, context)
+
+    def add_to(self, sender, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def install(self):
+        connection_created.connect(self.add_to)
+        for conn in connections.all():
+            self.add_to(None, conn)
+
+    def uninstall(self):
+        connection_created.disconnect(self.add_to)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = ('Run full login flows through OAuth2LoginView and '
+            'OAuth2CallbackView against a local fake Google server, under '
+            'WSGI and/or ASGI, and report throughput, latency and query '
+            'rate.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flows', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--handler', choices=('wsgi', 'asgi', 'both'),
+                            default='both')
+        parser.add_argument('--users', type=int, default=500,
+                            help='Distinct users, repeated flows log '
+                                 'returning users in.')
+        parser.add_argument('--latency', type=float, default=0.02,
+                            help='Mean fake provider latency in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0)
+
+    def handle(self, *args, **options):
+        adapter = GoogleOAuth2Adapter()
+        previous_jwks = GoogleOAuth2Adapter.jwks
+        server = FakeGoogleServer(
+            latency=options['latency'],
+            error_rate=options['error_rate'],
+            users=options['users'],
+            id_token=adapter.use_id_token(),
+            audience=adapter.get_credentials()['oauth2_key'],
+        )
+        handlers = ('wsgi', 'asgi') if options['handler'] == 'both' \
+            else (options['handler'],)
+
+        setup_test_environment()
+        test_file = self.use_file_test_database()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        counter = QueryCounter()
+        counter.install()
+        try:
+            # Every flow comes from the same client address
+            with server, server.patch_adapter(GoogleOAuth2Adapter), \
+                    override_settings(AUTH_THROTTLE_BACKEND=None):
+                self.stdout.write('Fake provider on %s, %d flows, '
+                                  'concurrency %d' % (server.url,
+                                                      options['flows'],
+                                                      options['concurrency']))
+                for handler in handlers:
+                    counter.count = 0
+                    run = getattr(self, 'run_%s' % handler)
+                    start = time.perf_counter()
+                    results = run(options['flows'], options['concurrency'])
+                    elapsed = time.perf_counter() - start
+                    self.report(handler, results, elapsed, counter.count)
+                self.stdout.write('Provider requests: %s' % server.counts)
+            flush_last_login()
+        finally:
+            counter.uninstall()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            GoogleOAuth2Adapter.jwks = previous_jwks
+            if test_file and os.path.exists(test_file):
+                os.remove(test_file)
+
+    def use_file_test_database(self):
+        """
+        Concurrent writers need a file based sqlite test database, the
+        shared in-memory one fails with "table is locked" under load.
+        """
+        settings_dict = connection.settings_dict
+        if settings_dict['ENGINE'] != 'django.db.backends.sqlite3' or \
+                settings_dict['TEST'].get('NAME'):
+            return None
+        fd, path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(fd)
+        os.remove(path)
+        settings_dict['TEST']['NAME'] = path
+        return path
+
+    def authorize(self, location):
+        """
+        Follow the login redirect to the fake authorize endpoint.
+        :return: The callback path and its query parameters
+        """
+        resp = requests.get(location, allow_redirects=False)
+        callback = urlparse(resp.headers['Location'])
+        params = {key: values[0]
+                  for key, values in parse_qs(callback.query).items()}
+        return callback.path, params
+
+    def is_logged_in(self, response):
+        cookie_name = getattr(settings, 'AUTH_COOKIE_NAME', 'auth')
+        return response.status_code == 302 and \
+            cookie_name in response.cookies
+
+    def run_wsgi(self, flows, concurrency):
+        local = threading.local()
+        login_url = reverse('oauth2_login', args=('google',))
+
+        def flow(_):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client()
+            start = time.perf_counter()
+            response = client.get(login_url)
+            path, params = self.authorize(response['Location'])
+            callback_start = time.perf_counter()
+            response = client.get(path, params)
+            end = time.perf_counter()
+            return self.is_logged_in(response), end - start, \
+                end - callback_start
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(flow, range(flows)))
+
+    def run_asgi(self, flows, concurrency):
+        login_url = reverse('oauth2_login', args=('google',))
+
+        async def flow(semaphore):
+            async with semaphore:
+                client = AsyncClient()
+                start = time.perf_counter()
+                response = await client.get(login_url)
+                path, params = await asyncio.get_running_loop(). \
+                    run_in_executor(None, self.authorize,
+                                    response['Location'])
+                callback_start = time.perf_counter()
+                # Django 3.1's AsyncClient drops the query of `data`.
+                response = await client.get(
+                    '%s?%s' % (path, urlencode(params)))
+                end = time.perf_counter()
+                return self.is_logged_in(response), end - start, \
+                    end - callback_start
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(
+                *(flow(semaphore) for _ in range(flows)))
+
+        return asyncio.run(main())
+
+    def report(self, handler, results, elapsed, queries):
+        ok = [result for result in results if result[0]]
+        if not ok:
+            raise CommandError('%s: every login flow failed' % handler)
+        flow_times = [result[1] * 1000 for result in ok]
+        callback_times = [result[2] * 1000 for result in ok]
+        self.stdout.write(
+            '%s: %d/%d ok, %.1f logins/s, flow p50 %.1fms p99 %.1fms, '
+            'callback p50 %.1fms p99 %.1fms, %.1f queries/s '
+            '(%.2f per login)' % (
+                handler.upper(), len(ok), len(results), len(ok) / elapsed,
+                statistics.median(flow_times), percentile(flow_times, 0.99),
+                statistics.median(callback_times),
+                percentile(callback_times, 0.99),
+                queries / elapsed, queries / float(len(results))))
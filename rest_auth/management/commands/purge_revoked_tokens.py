@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from rest_auth.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = 'Delete the revoked token ids whose tokens have expired.'
+
+    def handle(self, *args, **options):
+        deleted, _ = RevokedToken.objects.filter(
+            expires_at__lte=timezone.now()).delete()
+        self.stdout.write('Deleted %d expired revoked tokens.' % deleted)
@@ -0,0 +1,440 @@
+"""
+Low-overhead counters and histograms of the authentication traffic, served
+in the Prometheus text format by `rest_auth.views.metrics.metrics`.
+
+Each metric holds its own lock, only taken to bump a value. With several
+worker processes (e.g. gunicorn) set:
+    AUTH_METRICS_MULTIPROC_DIR = '/tmp/rest_auth_metrics'
+Each process then dumps its values to that directory every
+`AUTH_METRICS_SYNC_INTERVAL` seconds and at exit, and a scrape served by any
+worker sums the files of all of them. The files are named after the pid and
+the start of the process: the scrapes fold the counters and histograms of
+exited processes (or of an earlier process with a reused pid) into an
+archive file, so the totals stay monotonic across worker restarts, and drop
+their gauges.
+"""
+import atexit
+import contextlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on Windows
+    fcntl = None
+
+LABEL_SEPARATOR = '\x1f'
+# Values of the exited processes, in the multi-process directory
+ARCHIVE_NAME = 'archive.json'
+
+
+class Counter(object):
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return {LABEL_SEPARATOR.join(key): value
+                    for key, value in self._values.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def samples(self, values):
+        for key, value in sorted(values.items()):
+            yield self.name, self.labels(key), value
+
+    def labels(self, key, **extra):
+        pairs = list(zip(self.labelnames, key.split(LABEL_SEPARATOR))) \
+            if self.labelnames else []
+        pairs.extend(extra.items())
+        return pairs
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down. Merged across processes by summing, e.g.
+    the number of workers with an open circuit.
+    """
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Counter):
+    type = 'histogram'
+    default_buckets = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=None):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets or self.default_buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per bucket counts, then the sum and count of observations
+                entry = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                entry[index] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {LABEL_SEPARATOR.join(key): list(entry)
+                    for key, entry in self._values.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, entry in values.items():
+            current = total.get(key)
+            if current is None:
+                total[key] = list(entry)
+            else:
+                total[key] = [a + b for a, b in zip(current, entry)]
+
+    def samples(self, values):
+        for key, entry in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                yield self.name + '_bucket', \
+                    self.labels(key, le=repr(float(bound))), cumulative
+            yield self.name + '_bucket', self.labels(key, le='+Inf'), \
+                entry[-1]
+            yield self.name + '_sum', self.labels(key), entry[-2]
+            yield self.name + '_count', self.labels(key), entry[-1]
+
+
+class Registry(object):
+    """
+    Collection of metrics, rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self._sync_thread = None
+        self._sync_pid = None
+        self._dump_pid = None
+        self._dump_name = None
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=None):
+        return self.register(Histogram(name, documentation, labelnames,
+                                       buckets))
+
+    def snapshot(self):
+        return {name: metric.snapshot()
+                for name, metric in self.metrics.items()}
+
+    def collect(self):
+        """
+        Return the values of this process, merged with the other processes
+        when a multi-process directory is configured.
+        """
+        directory = get_multiproc_dir()
+        if not directory:
+            return self.snapshot()
+
+        self.dump()
+        total = {}
+        # A dead dump must be archived once, and not read in between
+        with lock_directory(directory):
+            live, dead = split_dumps(directory)
+            archive = load_values(os.path.join(directory, ARCHIVE_NAME))
+            if dead:
+                for filename in dead:
+                    self.merge(archive,
+                               load_values(os.path.join(directory, filename)),
+                               archive=True)
+                write_values(directory, ARCHIVE_NAME, archive)
+                for filename in dead:
+                    remove_file(os.path.join(directory, filename))
+            self.merge(total, archive)
+            for filename in live:
+                self.merge(total,
+                           load_values(os.path.join(directory, filename)))
+        return total
+
+    def merge(self, total, values, archive=False):
+        """
+        Add the values of a process to `total`.
+        :param total: The merged values
+        :param values: The values of a process, see `snapshot`
+        :param archive: Whether the process exited, its gauges are dropped
+        """
+        for name, metric_values in values.items():
+            metric = self.metrics.get(name)
+            if metric is None or archive and metric.type == 'gauge':
+                continue
+            metric.merge(total.setdefault(name, {}), metric_values)
+
+    def render(self):
+        """
+        Render all the metrics in the Prometheus text format.
+        """
+        values = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append('# HELP %s %s' % (name, metric.documentation))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            for sample, labels, value in metric.samples(values.get(name,
+                                                                   {})):
+                if labels:
+                    sample += '{%s}' % ','.join(
+                        '%s="%s"' % (label, escape(label_value))
+                        for label, label_value in labels)
+                lines.append('%s %s' % (sample, format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self):
+        """
+        Write the values of this process to the multi-process directory.
+        """
+        directory = get_multiproc_dir()
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        write_values(directory, self.get_dump_name(), self.snapshot())
+
+    def get_dump_name(self):
+        """
+        Name of this process dump, '<pid>-<start in ms>.json'.
+        """
+        pid = os.getpid()
+        if self._dump_pid != pid:
+            self._dump_name = '%d-%d.json' % (pid, time.time() * 1000)
+            self._dump_pid = pid
+        return self._dump_name
+
+    def start_sync(self):
+        """
+        Start the thread dumping this process values, once per process.
+        """
+        pid = os.getpid()
+        if self._sync_pid == pid or not get_multiproc_dir():
+            return
+        with self._lock:
+            if self._sync_pid == pid:
+                return
+            interval = getattr(settings, 'AUTH_METRICS_SYNC_INTERVAL', 5)
+            event = threading.Event()
+
+            def run():
+                while not event.wait(interval):
+                    try:
+                        self.dump()
+                    except OSError:
+                        pass
+
+            self._sync_thread = threading.Thread(target=run, daemon=True,
+                                                 name='rest-auth-metrics')
+            self._sync_thread.start()
+            self._sync_pid = pid
+
+
+def get_multiproc_dir():
+    return getattr(settings, 'AUTH_METRICS_MULTIPROC_DIR', None)
+
+
+DUMP_NAME_RE = re.compile(r'^(\d+)-(\d+)\.json$')
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+def split_dumps(directory):
+    """
+    Split the dumps of the live and of the exited processes.
+    :param directory: The multi-process directory
+    :return: (live file names, dead file names)
+    """
+    latest = {}
+    dead = []
+    for filename in os.listdir(directory):
+        match = DUMP_NAME_RE.match(filename)
+        if match is None:
+            continue
+        pid, start = int(match.group(1)), int(match.group(2))
+        if not is_alive(pid):
+            dead.append(filename)
+            continue
+        # A reused pid, the earlier process is gone
+        previous = latest.get(pid)
+        if previous is not None:
+            dead.append(min(previous, (start, filename))[1])
+        latest[pid] = max(previous or (start, filename), (start, filename))
+    return [filename for start, filename in latest.values()], dead
+
+
+@contextlib.contextmanager
+def lock_directory(directory):
+    """
+    Exclusive lock of the multi-process directory, across processes.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def load_values(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_values(directory, filename, values):
+    """
+    Replace a file of the multi-process directory atomically.
+    """
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(values, f)
+    os.replace(path, os.path.join(directory, filename))
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def escape(value):
+    return value.replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def format_value(value):
+    if isinstance(value, float) and not value.is_integer():
+        return repr(value)
+    return str(int(value))
+
+
+registry = Registry()
+
+login_starts = registry.counter(
+    'rest_auth_login_starts_total',
+    'Login redirects to the provider.', ['provider'])
+login_successes = registry.counter(
+    'rest_auth_login_successes_total',
+    'Successful logins.', ['provider'])
+login_cancellations = registry.counter(
+    'rest_auth_login_cancellations_total',
+    'Logins cancelled by the user.', ['provider'])
+login_errors = registry.counter(
+    'rest_auth_login_errors_total',
+    'Failed logins by AuthError type and cause.',
+    ['provider', 'error', 'cause'])
+provider_request_seconds = registry.histogram(
+    'rest_auth_provider_request_seconds',
+    'Latency of the calls to the provider by endpoint.', ['endpoint'])
+provider_retries = registry.counter(
+    'rest_auth_provider_retries_total',
+    'Retried calls to the provider by endpoint.', ['endpoint'])
+circuit_breaker_open = registry.gauge(
+    'rest_auth_circuit_breaker_open',
+    'Whether the circuit to a provider host is open (or half open).',
+    ['host'])
+circuit_breaker_transitions = registry.counter(
+    'rest_auth_circuit_breaker_transitions_total',
+    'Circuit breaker state changes by host and new state.',
+    ['host', 'state'])
+circuit_breaker_rejections = registry.counter(
+    'rest_auth_circuit_breaker_rejections_total',
+    'Provider calls refused because the circuit was open.', ['host'])
+token_refreshes = registry.counter(
+    'rest_auth_token_refreshes_total',
+    'Refresh token rotations by outcome.', ['outcome'])
+authenticated_requests = registry.counter(
+    'rest_auth_authenticated_requests_total',
+    'Requests authenticated by RestAuthentication.', ['mode'])
+token_validation_failures = registry.counter(
+    'rest_auth_token_validation_failures_total',
+    'Requests rejected by RestAuthentication.', ['reason'])
+coalesced_callbacks = registry.counter(
+    'rest_auth_coalesced_callbacks_total',
+    'Duplicate callbacks served the tokens of the first one.', ['provider'])
+throttled_requests = registry.counter(
+    'rest_auth_throttled_requests_total',
+    'Login and callback requests refused by a throttle, by scope.',
+    ['scope'])
+
+
+def record_login_error(provider, error, exception=None, cause=None):
+    """
+    Count a failed login.
+    :param provider: The provider id
+    :param error: The AuthError value
+    :param exception: The exception that ended the login, if any
+    :param cause: The cause, defaults to the `cause` of an OAuth2Error or
+        the exception class name
+    """
+    if cause is None:
+        cause = getattr(exception, 'cause', None) or \
+            (type(exception).__name__ if exception is not None else error)
+    login_errors.inc(provider=provider, error=error, cause=cause)
+    registry.start_sync()
+
+
+def record_event(counter, **labels):
+    counter.inc(**labels)
+    registry.start_sync()
+
+
+@atexit.register
+def _dump_at_exit():
+    try:
+        registry.dump()
+    except Exception:
+        pass
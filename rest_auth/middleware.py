@@ -0,0 +1,87 @@
+"""
+Path-scoped versions of the session, CSRF, authentication and message
+middleware. They behave like the Django ones, except on the paths listed in:
+    AUTH_LEAN_PATHS = ['/accounts/', '/.well-known/', '/api/']
+
+where they are skipped entirely. Those paths are the OAuth2 routes and the
+API views authenticated by `RestAuthentication` from the `auth` cookie or
+header, none of which use `request.session`, `request.user` set by Django,
+messages or Django's CSRF check (DRF views are CSRF exempt, the token views
+use SameSite cookies). Replace the Django entries of `MIDDLEWARE` in place,
+the admin checks still find them since they are subclasses:
+    'rest_auth.middleware.LeanSessionMiddleware',
+    'rest_auth.middleware.LeanCsrfViewMiddleware',
+    'rest_auth.middleware.LeanAuthenticationMiddleware',
+    'rest_auth.middleware.LeanMessageMiddleware',
+
+`./manage.py bench_middleware` measures the per request savings.
+"""
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+
+DEFAULT_LEAN_PATHS = ('/accounts/', '/.well-known/')
+
+
+def is_lean_request(request):
+    """
+    Whether the request path is one of `AUTH_LEAN_PATHS`. The answer is kept
+    on the request, every lean middleware asks for it.
+    :param request: django HttpRequest
+    :return: bool
+    """
+    try:
+        return request._auth_lean_path
+    except AttributeError:
+        paths = tuple(getattr(settings, 'AUTH_LEAN_PATHS',
+                              DEFAULT_LEAN_PATHS))
+        lean = request._auth_lean_path = \
+            bool(paths) and request.path_info.startswith(paths)
+        return lean
+
+
+class LeanPathMixin(object):
+    """
+    Skip the middleware on the lean paths. Under ASGI the skipped middleware
+    don't cost a thread hop either, the (async) view is returned directly.
+    """
+    def __call__(self, request):
+        if is_lean_request(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class LeanSessionMiddleware(LeanPathMixin, SessionMiddleware):
+    pass
+
+
+class LeanAuthenticationMiddleware(LeanPathMixin, AuthenticationMiddleware):
+    pass
+
+
+class LeanMessageMiddleware(LeanPathMixin, MessageMiddleware):
+    pass
+
+
+class LeanCsrfViewMiddleware(LeanPathMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        # Called by the handler, outside of `__call__`
+        if is_lean_request(request):
+            return None
+        return super().process_view(request, callback, callback_args,
+                                    callback_kwargs)
+
+
+# Django middleware and their lean version
+LEAN_MIDDLEWARE = {
+    'django.contrib.sessions.middleware.SessionMiddleware':
+        'rest_auth.middleware.LeanSessionMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware':
+        'rest_auth.middleware.LeanCsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware':
+        'rest_auth.middleware.LeanAuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware':
+        'rest_auth.middleware.LeanMessageMiddleware',
+}
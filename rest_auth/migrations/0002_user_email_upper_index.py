@@ -0,0 +1,16 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_auth', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX rest_auth_user_email_upper_idx '
+            'ON rest_auth_user (UPPER(email));',
+            reverse_sql='DROP INDEX rest_auth_user_email_upper_idx;',
+        ),
+    ]
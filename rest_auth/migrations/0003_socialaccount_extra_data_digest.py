@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_auth', '0002_user_email_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='socialaccount',
+            name='extra_data_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
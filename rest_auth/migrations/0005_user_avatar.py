@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_auth', '0004_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='avatar_key',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='avatar_source',
+            field=models.URLField(blank=True, null=True),
+        ),
+    ]
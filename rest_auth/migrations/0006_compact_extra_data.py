@@ -0,0 +1,37 @@
+# Generated by Django 3.1.14 on 2026-10-18 12:48
+
+from django.db import migrations
+import rest_auth.fields
+
+
+def compact_extra_data(apps, schema_editor):
+    """
+    Rewrite the existing payloads in their compact form.
+    """
+    SocialAccount = apps.get_model('rest_auth', 'SocialAccount')
+    manager = SocialAccount.objects.db_manager(schema_editor.connection.alias)
+    batch = []
+    for account in manager.only('pk', 'extra_data').order_by('pk') \
+            .iterator(chunk_size=500):
+        batch.append(account)
+        if len(batch) == 500:
+            manager.bulk_update(batch, ['extra_data'])
+            batch = []
+    if batch:
+        manager.bulk_update(batch, ['extra_data'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_auth', '0005_user_avatar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='socialaccount',
+            name='extra_data',
+            field=rest_auth.fields.CompactJSONField(keep_keys=['id', 'sub', 'email', 'verified_email', 'email_verified', 'name', 'given_name', 'family_name', 'picture', 'locale', 'hd']),
+        ),
+        migrations.RunPython(compact_extra_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Make the UPPER(email) index unique, so that two concurrent signups whose
+    emails only differ by case can't both be inserted. It fails on a table
+    already holding such duplicates, they have to be merged first.
+
+    The index may be missing: SQLite drops it when a later migration
+    rebuilds the table.
+    """
+
+    dependencies = [
+        ('rest_auth', '0006_compact_extra_data'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            ['DROP INDEX IF EXISTS rest_auth_user_email_upper_idx;',
+             'CREATE UNIQUE INDEX rest_auth_user_email_upper_idx '
+             'ON rest_auth_user (UPPER(email));'],
+            reverse_sql=[
+                'DROP INDEX IF EXISTS rest_auth_user_email_upper_idx;',
+                'CREATE INDEX rest_auth_user_email_upper_idx '
+                'ON rest_auth_user (UPPER(email));'],
+        ),
+    ]
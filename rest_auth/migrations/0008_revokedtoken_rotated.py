@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 13:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rest_auth', '0007_unique_email_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='revokedtoken',
+            name='rotated',
+            field=models.BooleanField(default=False),
+        ),
+    ]
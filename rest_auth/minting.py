@@ -0,0 +1,207 @@
+"""
+Direct minting of the issued tokens from a claim template, built once by
+`AuthConfig.ready`:
+
+    # Claims with the same value in every access token
+    AUTH_TOKEN_STATIC_CLAIMS = {'tenant': 'web'}
+    # Claims read from the user: an attribute name, or the dotted path of a
+    # callable taking the user
+    AUTH_TOKEN_USER_CLAIMS = {'email': 'email',
+                              'org': 'myapp.claims.get_org'}
+    # Claims left out of the access tokens, to keep the cookie small
+    AUTH_TOKEN_DROP_CLAIMS = ['iat', 'perms']
+
+The static part of the payload is computed once, only the per-user and per
+token claims (user id, `exp`, `iat`, `jti`) are filled in on each call. No
+throwaway simplejwt token object is built, so nothing is written to the
+blacklist app tables either.
+"""
+import operator
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from rest_framework_simplejwt import settings as simple_jwt_settings, state
+
+# Without them simplejwt rejects the token
+REQUIRED_CLAIMS = ('exp',)
+
+
+def get_stateless_claims(user):
+    """
+    Claims embedded in the access token so that the stateless authentication
+    mode can build a `ClaimsUser` without loading the user.
+
+    :param user:
+    :return Claims as dict
+    """
+    return {
+        'email': user.email,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'is_staff': getattr(user, 'is_staff', False),
+        'is_superuser': user.is_superuser,
+        'perms': [] if user.is_superuser else sorted(
+            user.get_all_permissions()),
+    }
+
+
+def get_claim_getter(claim, source):
+    """
+    Resolve the source of a user claim.
+    :param claim: The claim name
+    :param source: An attribute name, a dotted path to a callable taking the
+        user, or a callable
+    :return: callable taking the user
+    :raise ImproperlyConfigured: When the callable can't be imported
+    """
+    if callable(source):
+        return source
+    if not isinstance(source, str) or not source:
+        raise ImproperlyConfigured('Invalid AUTH_TOKEN_USER_CLAIMS entry: %s'
+                                   % claim)
+    if '.' not in source:
+        return operator.attrgetter(source)
+    try:
+        return import_string(source)
+    except ImportError as e:
+        raise ImproperlyConfigured('Invalid AUTH_TOKEN_USER_CLAIMS entry %s: '
+                                   '%s' % (claim, e))
+
+
+class TokenMinter(object):
+    """
+    Mints access and refresh tokens from a precomputed claim template.
+
+    :param static_claims: Claims added to every access token
+    :param user_claims: dict of claim to its source (see `get_claim_getter`)
+    :param drop_claims: Claims left out of the access tokens
+    :param stateless_claims: Whether the access tokens carry the claims of
+        `get_stateless_claims`
+    """
+    def __init__(self, static_claims=None, user_claims=None,
+                 drop_claims=(), stateless_claims=False):
+        api_settings = simple_jwt_settings.api_settings
+        self.user_id_field = api_settings.USER_ID_FIELD
+        self.user_id_claim = api_settings.USER_ID_CLAIM
+        self.jti_claim = api_settings.JTI_CLAIM
+        self.access_lifetime = int(
+            api_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+        self.refresh_lifetime = int(
+            api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+        drop_claims = frozenset(drop_claims)
+        required = {api_settings.TOKEN_TYPE_CLAIM, self.user_id_claim,
+                    self.jti_claim} | set(REQUIRED_CLAIMS)
+        if drop_claims & required:
+            raise ImproperlyConfigured(
+                'AUTH_TOKEN_DROP_CLAIMS can\'t drop the required claims: %s'
+                % ', '.join(sorted(drop_claims & required)))
+        reserved = (required | {'iat'}) & \
+            (set(static_claims or ()) | set(user_claims or ()))
+        if reserved:
+            raise ImproperlyConfigured('The token claims are set by the '
+                                       'minter: %s'
+                                       % ', '.join(sorted(reserved)))
+        self.drop_claims = drop_claims
+        self.with_iat = 'iat' not in drop_claims
+        self.stateless_claims = stateless_claims
+
+        static = {api_settings.TOKEN_TYPE_CLAIM: 'access'}
+        static.update(static_claims or {})
+        self.access_claims = {claim: value for claim, value in static.items()
+                              if claim not in drop_claims}
+        self.refresh_claims = {api_settings.TOKEN_TYPE_CLAIM: 'refresh'}
+        self.user_claims = tuple(
+            (claim, get_claim_getter(claim, source))
+            for claim, source in (user_claims or {}).items()
+            if claim not in drop_claims)
+
+    def get_payload(self, user, claims, lifetime, now):
+        payload = dict(claims)
+        payload[self.user_id_claim] = getattr(user, self.user_id_field)
+        payload[self.jti_claim] = uuid4().hex
+        payload['exp'] = now + lifetime
+        return payload
+
+    def get_access_payload(self, user, now=None):
+        """
+        Build the claims of an access token.
+        :param user:
+        :param now: The issue time as epoch, defaults to now
+        :return: The claims as dict
+        """
+        now = int(time.time()) if now is None else now
+        payload = self.get_payload(user, self.access_claims,
+                                   self.access_lifetime, now)
+        if self.with_iat:
+            payload['iat'] = now
+        for claim, getter in self.user_claims:
+            payload[claim] = getter(user)
+        if self.stateless_claims:
+            payload.update(
+                (claim, value) for claim, value in
+                get_stateless_claims(user).items()
+                if claim not in self.drop_claims)
+        return payload
+
+    def get_refresh_payload(self, user, now=None):
+        """
+        Build the claims of a refresh token. It always carries `iat`, which
+        is compared with the users `tokens_not_before`.
+        :param user:
+        :param now: The issue time as epoch, defaults to now
+        :return: The claims as dict
+        """
+        now = int(time.time()) if now is None else now
+        payload = self.get_payload(user, self.refresh_claims,
+                                   self.refresh_lifetime, now)
+        payload['iat'] = now
+        return payload
+
+    def mint_access(self, user):
+        """
+        :return: The encoded access token
+        """
+        # The backend is looked up on each call, `AuthConfig.ready` may
+        # replace it (see `rest_auth.signing`).
+        return state.token_backend.encode(self.get_access_payload(user))
+
+    def mint_pair(self, user):
+        """
+        :return: The encoded access and refresh tokens
+        """
+        now = int(time.time())
+        backend = state.token_backend
+        return backend.encode(self.get_access_payload(user, now)), \
+            backend.encode(self.get_refresh_payload(user, now))
+
+
+_minter = None
+
+
+def build_minter():
+    """
+    (Re)build the token minter from the settings:
+        AUTH_TOKEN_STATIC_CLAIMS = {}
+        AUTH_TOKEN_USER_CLAIMS = {}
+        AUTH_TOKEN_DROP_CLAIMS = []
+        AUTH_STATELESS_CLAIMS = False
+    :return: TokenMinter instance
+    """
+    global _minter
+    _minter = TokenMinter(
+        static_claims=getattr(settings, 'AUTH_TOKEN_STATIC_CLAIMS', None),
+        user_claims=getattr(settings, 'AUTH_TOKEN_USER_CLAIMS', None),
+        drop_claims=getattr(settings, 'AUTH_TOKEN_DROP_CLAIMS', ()),
+        stateless_claims=getattr(settings, 'AUTH_STATELESS_CLAIMS', False),
+    )
+    return _minter
+
+
+def get_minter():
+    if _minter is None:
+        return build_minter()
+    return _minter
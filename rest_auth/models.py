@@ -1,9 +1,15 @@
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.contrib.auth.models import PermissionsMixin
-from django.contrib.postgres.fields import JSONField
 from django.db import models
 from django.utils import timezone
 
+from rest_auth.fields import CompactJSONField
+
+# Provider payload keys stored uncompressed in SocialAccount.extra_data
+EXTRA_DATA_KEYS = ('id', 'sub', 'email', 'verified_email', 'email_verified',
+                   'name', 'given_name', 'family_name', 'picture', 'locale',
+                   'hd')
+
 
 class UserManager(BaseUserManager):
     use_in_migrations = True
@@ -28,8 +34,15 @@ class User(AbstractBaseUser, PermissionsMixin):
     last_name = models.CharField(max_length=150)
     email = models.EmailField(unique=True)
     profile_photo = models.URLField(null=True)
+    # Local copy of profile_photo (see `rest_auth.avatars`): the digest of
+    # the fetched picture and the url it was fetched from
+    avatar_key = models.CharField(max_length=32, blank=True, default='')
+    avatar_source = models.URLField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(default=timezone.now)
+    # Tokens issued before this time are revoked, e.g. logout everywhere
+    tokens_not_before = models.DateTimeField(null=True, blank=True,
+                                             db_index=True)
 
     objects = UserManager()
 
@@ -39,14 +52,110 @@ class User(AbstractBaseUser, PermissionsMixin):
 class SocialAccount(models.Model):
     """
     This model will be used to store users created from social account. The
-    extra_data field is imported from postgres fields for simplicity.
+    extra_data field keeps the `EXTRA_DATA_KEYS` of the provider payload and
+    compresses the rest (see `CompactJSONField`); it is deferred on the
+    login lookup.
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     provider = models.CharField(max_length=30)
     uid = models.URLField(max_length=100)
     last_login = models.DateTimeField(auto_now=True)
     date_joined = models.DateTimeField(auto_now_add=True)
-    extra_data = JSONField()
+    extra_data = CompactJSONField(keep_keys=EXTRA_DATA_KEYS)
+    # Digest of extra_data, used to skip writing unchanged provider payloads
+    extra_data_digest = models.CharField(max_length=64, blank=True,
+                                         default='')
 
     class Meta:
         unique_together = ('provider', 'uid')
+
+
+class RevokedToken(models.Model):
+    """
+    Denylist of revoked token ids (`jti`), kept until the token expires.
+    Requests check it through the in-memory snapshot of
+    `rest_auth.revocation`.
+    """
+    jti = models.CharField(max_length=64, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+    # Revoked by its rotation (refresh), not by a logout
+    rotated = models.BooleanField(default=False)
+
+
+class ClaimsUser(object):
+    """
+    Lightweight, immutable user built from the claims of a validated access
+    token, used by the stateless authentication mode. It carries what
+    `create_access_token_for_user` embedded at mint time and never touches
+    the database, so it can't be saved or deleted.
+
+    `is_active` is always True: tokens are only issued to active users, and
+    a user deactivated since keeps access in this mode until the token
+    expires, unless its tokens are revoked (see `rest_auth.revocation`).
+    """
+    __slots__ = ('id', 'pk', 'email', 'first_name', 'last_name', 'is_staff',
+                 'is_superuser', 'perms', 'token')
+
+    is_active = True
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token, user_id):
+        values = {
+            'id': user_id,
+            'pk': user_id,
+            'email': token.get('email', ''),
+            'first_name': token.get('first_name', ''),
+            'last_name': token.get('last_name', ''),
+            'is_staff': token.get('is_staff', False),
+            'is_superuser': token.get('is_superuser', False),
+            'perms': frozenset(token.get('perms', ())),
+            'token': token,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ClaimsUser instances are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ClaimsUser instances are immutable')
+
+    def __str__(self):
+        return self.email or 'ClaimsUser %s' % self.id
+
+    def __eq__(self, other):
+        return isinstance(other, ClaimsUser) and self.id == other.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def get_username(self):
+        return self.email
+
+    def get_full_name(self):
+        return ('%s %s' % (self.first_name, self.last_name)).strip()
+
+    def get_all_permissions(self, obj=None):
+        return set(self.perms)
+
+    def has_perm(self, perm, obj=None):
+        return self.is_superuser or perm in self.perms
+
+    def has_perms(self, perm_list, obj=None):
+        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+    def has_module_perms(self, app_label):
+        if self.is_superuser:
+            return True
+        prefix = app_label + '.'
+        return any(perm.startswith(prefix) for perm in self.perms)
+
+    def save(self, *args, **kwargs):
+        raise TypeError('ClaimsUser is not backed by the database, load the '
+                        'User to save it')
+
+    def delete(self, *args, **kwargs):
+        raise TypeError('ClaimsUser is not backed by the database, load the '
+                        'User to delete it')
@@ -0,0 +1,171 @@
+"""
+Registry of the configured OAuth2 providers, built once at startup by
+`AuthConfig.ready`:
+    SOCIAL_AUTH_PROVIDERS = ['rest_auth.views.google.GoogleOAuth2Adapter']
+
+Each provider gets an immutable `ProviderConfig` holding everything the login
+and callback views need, so that no settings lookup, `reverse()` or scope
+join happens per request. A misconfigured provider fails at startup with
+`ImproperlyConfigured`, except for its callback path: it is reversed on first
+use, as the URLconf can't be loaded while the apps are getting ready.
+"""
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404
+from django.urls import NoReverseMatch
+from django.utils.module_loading import import_string
+
+DEFAULT_PROVIDERS = ('rest_auth.views.google.GoogleOAuth2Adapter',)
+ACCESS_TOKEN_METHODS = ('GET', 'POST')
+
+
+class ProviderConfig(object):
+    """
+    Immutable, precomputed configuration of a provider.
+    """
+    __slots__ = ('id', 'name', 'adapter', 'oauth2_key', 'oauth2_secret',
+                 'scope', 'authorize_url', 'access_token_url',
+                 'access_token_method', 'basic_auth', 'headers',
+                 'auth_params', '_callback_path', 'pkce')
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values[name])
+
+    def __setattr__(self, name, value):
+        raise AttributeError('ProviderConfig instances are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('ProviderConfig instances are immutable')
+
+    def __repr__(self):
+        return '<ProviderConfig: %s>' % self.id
+
+    @property
+    def callback_path(self):
+        """
+        The path of the callback view, reversed once.
+        :raise ImproperlyConfigured: When the callback route is missing
+        """
+        callback_path = self._callback_path
+        if callback_path is None:
+            try:
+                callback_path = self.adapter.get_callback_path()
+            except NoReverseMatch as e:
+                raise ImproperlyConfigured('No callback url for the %s '
+                                           'provider: %s' % (self.id, e))
+            object.__setattr__(self, '_callback_path', callback_path)
+        return callback_path
+
+
+def build_provider_config(adapter_class):
+    """
+    Build the configuration of a provider and check it.
+    :param adapter_class: Social Provider class, ex: GoogleOAuth2Adapter
+    :return: ProviderConfig instance
+    :raise ImproperlyConfigured: When the provider is misconfigured
+    """
+    adapter = adapter_class()
+    try:
+        credentials = adapter.get_credentials()
+    except AttributeError as e:
+        raise ImproperlyConfigured('Missing credentials of the %s provider: '
+                                   '%s' % (adapter.id, e))
+    for name in ('oauth2_key', 'oauth2_secret'):
+        if not credentials.get(name) or \
+                not isinstance(credentials[name], str):
+            raise ImproperlyConfigured('The %s of the %s provider must be a '
+                                       'non empty string.'
+                                       % (name, adapter.id))
+
+    if adapter.access_token_method not in ACCESS_TOKEN_METHODS:
+        raise ImproperlyConfigured('Unsupported access token method of the '
+                                   '%s provider: %s'
+                                   % (adapter.id, adapter.access_token_method))
+
+    auth_params = adapter.get_static_auth_params()
+    if not isinstance(auth_params, dict):
+        raise ImproperlyConfigured('The AUTH_PARAMS of the %s provider must '
+                                   'be a dict.' % adapter.id)
+
+    # Ordered and deduplicated, so the authorize url is stable
+    scope = adapter.scope_delimiter.join(dict.fromkeys(adapter.get_scope()))
+    headers = adapter.headers
+    return ProviderConfig(
+        id=adapter.id,
+        name=adapter.name,
+        adapter=adapter,
+        oauth2_key=credentials['oauth2_key'],
+        oauth2_secret=credentials['oauth2_secret'],
+        scope=scope,
+        authorize_url=adapter.authorize_url,
+        access_token_url=adapter.access_token_url,
+        access_token_method=adapter.access_token_method,
+        basic_auth=adapter.basic_auth,
+        headers=MappingProxyType(dict(headers)) if headers else None,
+        auth_params=MappingProxyType(dict(auth_params)),
+        _callback_path=None,
+        # PKCE, when the provider supports it, unless disabled with:
+        #   SOCIAL_AUTH_PKCE = False
+        pkce=getattr(adapter, 'pkce', False) and
+        getattr(settings, 'SOCIAL_AUTH_PKCE', True),
+    )
+
+
+class ProviderRegistry(object):
+    """
+    Provider configurations indexed by provider id.
+    """
+    def __init__(self):
+        self.providers = {}
+
+    def build(self, adapters=None):
+        """
+        (Re)build the configuration of every provider. The registry is only
+        swapped once all of them are valid.
+        :param adapters: Adapter classes or dotted paths, defaults to the
+            `SOCIAL_AUTH_PROVIDERS` setting
+        """
+        if adapters is None:
+            adapters = getattr(settings, 'SOCIAL_AUTH_PROVIDERS',
+                               DEFAULT_PROVIDERS)
+        providers = {}
+        for adapter in adapters:
+            if isinstance(adapter, str):
+                try:
+                    adapter = import_string(adapter)
+                except ImportError as e:
+                    raise ImproperlyConfigured(
+                        'Invalid SOCIAL_AUTH_PROVIDERS entry: %s' % e)
+            if adapter.id in providers:
+                raise ImproperlyConfigured('Duplicate provider id: %s'
+                                           % adapter.id)
+            providers[adapter.id] = build_provider_config(adapter)
+        self.providers = providers
+
+    def get(self, provider_id):
+        """
+        Return the configuration of a provider.
+        :param provider_id: The provider id, ex: 'google'
+        :return: ProviderConfig instance
+        :raise Http404: When the provider is not configured
+        """
+        try:
+            return self.providers[provider_id]
+        except KeyError:
+            raise Http404('Unknown provider: %s' % provider_id)
+
+    def __contains__(self, provider_id):
+        return provider_id in self.providers
+
+    def __iter__(self):
+        return iter(self.providers.values())
+
+
+registry = ProviderRegistry()
+
+
+def get_provider(provider_id):
+    return registry.get(provider_id)
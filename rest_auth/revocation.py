@@ -0,0 +1,299 @@
+"""
+Revocation of issued tokens without a query per request.
+
+Tokens are revoked by id (`RevokedToken`, e.g. on logout or refresh
+rotation) or per user with `User.tokens_not_before` (logout everywhere).
+`RestAuthentication` checks them against an in-memory snapshot: a Bloom
+filter of the revoked ids that have not expired yet and the recent not
+before stamps. The snapshot is rebuilt in a background thread every
+`AUTH_REVOCATION_SYNC_INTERVAL` seconds, so a revocation made by another
+process is seen within that delay. Revocations made by this process are
+applied to the snapshot immediately.
+
+A token id matching the Bloom filter is confirmed with a query, so a false
+positive (`AUTH_REVOCATION_ERROR_RATE`) costs a query, never a valid token.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from rest_auth.models import RevokedToken, User
+from rest_auth.routers import pin_primary, user_key
+from rest_auth.user_cache import invalidate_user
+
+
+class BloomFilter(object):
+    """
+    Bloom filter over strings.
+
+    :param capacity: Expected number of items
+    :param error_rate: Accepted false positive rate at that capacity
+    """
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        for i in range(self.hashes):
+            yield (first + i * second) % self.size
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(value))
+
+
+class RevocationSnapshot(object):
+    """
+    Revoked token ids and not before stamps at a point in time.
+
+    :param jtis: The revoked token ids
+    :param not_before: dict of user id to not before epoch
+    :param error_rate: False positive rate of the Bloom filter
+    """
+    def __init__(self, jtis, not_before, error_rate=0.001):
+        jtis = list(jtis)
+        self.jtis = BloomFilter(max(len(jtis) * 2, 1024), error_rate)
+        for jti in jtis:
+            self.jtis.add(jti)
+        self.not_before = not_before
+        self.confirmed = {}
+        self.built_at = time.monotonic()
+
+
+class RevocationList(object):
+    """
+    Thread-safe holder of the revocation snapshot of this process.
+
+    :param interval: Seconds between two snapshot rebuilds
+    :param error_rate: False positive rate of the Bloom filter
+    """
+    def __init__(self, interval=10, error_rate=0.001):
+        self.interval = interval
+        self.error_rate = error_rate
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        # Local revocations, replayed on a snapshot built concurrently
+        self._recent = []
+
+    def build(self):
+        """
+        Load the revocations from the database.
+        :return: RevocationSnapshot instance
+        """
+        now = timezone.now()
+        started = time.monotonic()
+        jtis = RevokedToken.objects.filter(expires_at__gt=now) \
+            .values_list('jti', flat=True)
+        # Older stamps can't revoke an access token that is still valid
+        cutoff = now - api_settings.ACCESS_TOKEN_LIFETIME
+        not_before = {
+            str(pk): stamp.timestamp() for pk, stamp in
+            User.objects.filter(tokens_not_before__gt=cutoff)
+                        .values_list('pk', 'tokens_not_before')
+        }
+        snapshot = RevocationSnapshot(jtis, not_before, self.error_rate)
+        with self._lock:
+            self._recent = [entry for entry in self._recent
+                            if entry[0] >= started]
+            for _, kind, key, value in self._recent:
+                self._apply(snapshot, kind, key, value)
+        return snapshot
+
+    def refresh(self):
+        snapshot = self.build()
+        with self._lock:
+            self._snapshot = snapshot
+
+    def refresh_in_background(self):
+        """
+        Rebuild the snapshot in a daemon thread, unless one is running.
+        """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep the current snapshot, retry on the next check.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+                connection.close()
+
+        threading.Thread(target=run, daemon=True,
+                         name='rest-auth-revocation').start()
+
+    def get_snapshot(self):
+        if self._snapshot is None:
+            self.refresh()
+        elif time.monotonic() - self._snapshot.built_at >= self.interval:
+            self.refresh_in_background()
+        return self._snapshot
+
+    def is_revoked(self, payload):
+        """
+        Whether a validated token was revoked.
+        :param payload: The token claims
+        :return: bool
+        """
+        snapshot = self.get_snapshot()
+        user_id = payload.get(api_settings.USER_ID_CLAIM)
+        not_before = snapshot.not_before.get(str(user_id))
+        if not_before is not None and \
+                get_issued_at(payload) < math.floor(not_before):
+            return True
+
+        jti = payload.get(api_settings.JTI_CLAIM)
+        if jti is None or jti not in snapshot.jtis:
+            return False
+        revoked = snapshot.confirmed.get(jti)
+        if revoked is None:
+            revoked = snapshot.confirmed[jti] = \
+                RevokedToken.objects.filter(jti=jti).exists()
+        return revoked
+
+    def add(self, kind, key, value):
+        """
+        Apply a revocation made by this process to the current snapshot.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Only a snapshot build still running can miss older entries
+            self._recent = [entry for entry in self._recent
+                            if entry[0] >= now - 2 * max(self.interval, 1)]
+            self._recent.append((now, kind, key, value))
+            if self._snapshot is not None:
+                self._apply(self._snapshot, kind, key, value)
+
+    @staticmethod
+    def _apply(snapshot, kind, key, value):
+        if kind == 'jti':
+            snapshot.jtis.add(key)
+            snapshot.confirmed[key] = True
+        else:
+            snapshot.not_before[key] = max(value,
+                                           snapshot.not_before.get(key, 0))
+
+
+_revocation_list = None
+_revocation_list_lock = threading.Lock()
+
+
+def get_revocation_list():
+    """
+    Return the revocation list of this process, set up with:
+        AUTH_REVOCATION_SYNC_INTERVAL = 10
+        AUTH_REVOCATION_ERROR_RATE = 0.001
+    :return: RevocationList instance
+    """
+    global _revocation_list
+    if _revocation_list is None:
+        with _revocation_list_lock:
+            if _revocation_list is None:
+                _revocation_list = RevocationList(
+                    interval=getattr(
+                        settings, 'AUTH_REVOCATION_SYNC_INTERVAL', 10),
+                    error_rate=getattr(
+                        settings, 'AUTH_REVOCATION_ERROR_RATE', 0.001),
+                )
+    return _revocation_list
+
+
+def get_issued_at(payload):
+    """
+    Return the issue time of a token. Tokens minted without an `iat` claim
+    are assumed to be issued a full lifetime before they expire.
+    :param payload: The token claims
+    :return: The issue time as epoch
+    """
+    if 'iat' in payload:
+        return payload['iat']
+    lifetime = api_settings.REFRESH_TOKEN_LIFETIME \
+        if payload.get(api_settings.TOKEN_TYPE_CLAIM) == 'refresh' \
+        else api_settings.ACCESS_TOKEN_LIFETIME
+    return payload.get('exp', 0) - lifetime.total_seconds()
+
+
+def is_token_revoked(payload):
+    return get_revocation_list().is_revoked(payload)
+
+
+def revoke_token(payload, rotated=False):
+    """
+    Revoke a token by id until it expires.
+    :param payload: The token claims
+    :param rotated: Whether the token is revoked by its rotation
+    :return: False if the token was already revoked
+    """
+    jti = payload[api_settings.JTI_CLAIM]
+    expires_at = datetime.fromtimestamp(payload['exp'], tz=dt_timezone.utc)
+    try:
+        with transaction.atomic():
+            RevokedToken.objects.create(jti=jti, expires_at=expires_at,
+                                        rotated=rotated)
+    except IntegrityError:
+        return False
+    get_revocation_list().add('jti', jti, True)
+    return True
+
+
+def is_recently_rotated(payload):
+    """
+    Whether a refresh token was rotated less than
+    `AUTH_REFRESH_REUSE_GRACE` seconds ago, i.e. it is presented again by
+    another tab or a retried request rather than replayed.
+    :param payload: The refresh token claims
+    """
+    grace = getattr(settings, 'AUTH_REFRESH_REUSE_GRACE', 5)
+    if not grace:
+        return False
+    return RevokedToken.objects.filter(
+        jti=payload[api_settings.JTI_CLAIM], rotated=True,
+        revoked_at__gte=timezone.now() - timedelta(seconds=grace),
+    ).exists()
+
+
+def revoke_user_tokens(user_id):
+    """
+    Revoke every token issued to a user until now.
+    :param user_id: The user primary key
+    """
+    now = timezone.now()
+    User.objects.filter(pk=user_id).update(tokens_not_before=now)
+    invalidate_user(user_id)
+    pin_primary(user_key(user_id))
+    get_revocation_list().add('user', str(user_id), now.timestamp())
+
+
+def is_issued_before_stamp(payload, user):
+    """
+    Whether the token was issued before the not before stamp of its user.
+    `iat` has a one second resolution, the stamp is floored to the second so
+    that a token issued in the same second, e.g. by the login following a
+    logout everywhere, stays valid.
+    """
+    return user.tokens_not_before is not None and \
+        get_issued_at(payload) < \
+        math.floor(user.tokens_not_before.timestamp())
@@ -0,0 +1,167 @@
+"""
+Read replica routing of the authentication lookups:
+    DATABASE_ROUTERS = ['rest_auth.routers.AuthReplicaRouter']
+    AUTH_REPLICA_DATABASES = ['replica']
+    AUTH_REPLICA_PIN_SECONDS = 5
+
+Only the reads made inside `replica_reads()` go to a replica: the user lookup
+of `RestAuthentication` (when the user cache is disabled, the cache is only
+filled from the primary) and the returning user lookup of
+`get_or_create_user`. Everything else, writes and the reads following a
+write in the same request (see `ReplicaRoutingMiddleware`), stays on the
+primary.
+
+A user or account written by this process (e.g. a new signup or a logout
+everywhere) is pinned to the primary for `AUTH_REPLICA_PIN_SECONDS`, and a
+lookup missing on a replica is retried on the primary, so replica lag never
+rejects a user that was just created by another process either.
+"""
+import asyncio
+import contextlib
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DEFAULT_DB_ALIAS
+
+from rest_auth.cache import LRUCache
+
+_replica_reads = ContextVar('rest_auth_replica_reads', default=False)
+_wrote = ContextVar('rest_auth_wrote', default=False)
+_pins = LRUCache(max_size=10000)
+
+
+def get_replicas():
+    return getattr(settings, 'AUTH_REPLICA_DATABASES', ())
+
+
+def pin_primary(key, seconds=None):
+    """
+    Read the rows of `key` from the primary for a while, e.g. after a write
+    the replicas may not have applied yet.
+    :param key: The pinned key, see `user_key` and `account_key`
+    :param seconds: Defaults to `AUTH_REPLICA_PIN_SECONDS`
+    """
+    if not get_replicas():
+        return
+    if seconds is None:
+        seconds = getattr(settings, 'AUTH_REPLICA_PIN_SECONDS', 5)
+    _pins.set(key, True, time.time() + seconds)
+
+
+def is_pinned(key):
+    return key is not None and _pins.get(key, False)
+
+
+def user_key(user_id):
+    return 'user:%s' % user_id
+
+
+def account_key(provider, uid):
+    return 'account:%s:%s' % (provider, uid)
+
+
+@contextlib.contextmanager
+def replica_reads(pin_key=None):
+    """
+    Route the reads of the block to a replica, unless no replica is
+    configured, this request wrote already or `pin_key` is pinned.
+    :param pin_key: The key of the read rows
+    :return: Whether the reads may go to a replica
+    """
+    allowed = bool(get_replicas()) and not _wrote.get() and \
+        not is_pinned(pin_key)
+    token = _replica_reads.set(allowed)
+    try:
+        yield allowed
+    finally:
+        _replica_reads.reset(token)
+
+
+def replica_get(func, *args, pin_key=None, retry_on=(ObjectDoesNotExist,),
+                **kwargs):
+    """
+    Run a lookup on a replica, and again on the primary when it fails with
+    `retry_on`, as the replica may lag behind.
+    :param func: The lookup
+    :param pin_key: The key of the read rows
+    :param retry_on: Exceptions retried on the primary
+    :return: The result of the lookup
+    """
+    with replica_reads(pin_key) as on_replica:
+        try:
+            return func(*args, **kwargs)
+        except retry_on:
+            if not on_replica:
+                raise
+    return func(*args, **kwargs)
+
+
+class AuthReplicaRouter(object):
+    """
+    Send the reads made inside `replica_reads()` to one of the
+    `AUTH_REPLICA_DATABASES`, and record the writes of the request.
+    Instances loaded from a replica, e.g. `request.user`, are saved and
+    their relations read on the primary.
+    """
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        if not replicas:
+            return None
+        if _replica_reads.get() and not _wrote.get():
+            return random.choice(replicas)
+        return self.get_primary(hints)
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return self.get_primary(hints)
+
+    def get_primary(self, hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db in get_replicas():
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        replicas = get_replicas()
+        if obj1._state.db in replicas or obj2._state.db in replicas:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Scope the write tracking of `AuthReplicaRouter` to a request, worker
+    threads and tasks serve many of them.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as async, like Django's MiddlewareMixin
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = _wrote.set(False)
+        try:
+            return self.get_response(request)
+        finally:
+            _wrote.reset(token)
+
+    async def __acall__(self, request):
+        token = _wrote.set(False)
+        try:
+            return await self.get_response(request)
+        finally:
+            _wrote.reset(token)
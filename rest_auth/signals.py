@@ -0,0 +1,57 @@
+from django.core.signals import setting_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from rest_auth.minting import build_minter
+from rest_auth.models import User
+from rest_auth.providers import registry
+from rest_auth.routers import pin_primary, user_key
+from rest_auth.signing import install_signing_keys
+from rest_auth.user_cache import invalidate_user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """
+    Drop the cached copy of a user when it is saved or deleted, e.g. when
+    `is_active` changes, and read it from the primary for a while.
+    """
+    invalidate_user(instance.pk)
+    pin_primary(user_key(instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_cached_user_permissions(sender, instance, action, reverse,
+                                       pk_set, **kwargs):
+    """
+    Drop the cached users whose groups or permissions changed, their
+    permission cache would be stale otherwise.
+    """
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_user(instance.pk)
+        pin_primary(user_key(instance.pk))
+    elif pk_set:
+        for pk in pk_set:
+            invalidate_user(pk)
+            pin_primary(user_key(pk))
+
+
+@receiver(setting_changed)
+def rebuild_startup_config(setting, **kwargs):
+    """
+    Rebuild the provider configurations, the signing keys and the token
+    minter when a setting they are built from changes, e.g. with
+    `override_settings` in tests.
+    """
+    if setting.startswith(('SOCIAL_AUTH_', 'SOCIALACCOUNT_')) or \
+            setting == 'ROOT_URLCONF':
+        registry.build()
+    if setting in ('AUTH_SIGNING_KEYS', 'SIMPLE_JWT'):
+        install_signing_keys()
+    if setting.startswith('AUTH_TOKEN_') or \
+            setting in ('AUTH_STATELESS_CLAIMS', 'SIMPLE_JWT'):
+        build_minter()
@@ -0,0 +1,244 @@
+"""
+Asymmetric signing of the issued tokens, so that other services can verify
+them with the public keys published on the JWKS endpoint:
+
+    AUTH_SIGNING_KEYS = [
+        # The first key with a private key signs new tokens
+        {'kid': '2026-10', 'algorithm': 'ES256',
+         'private_key_file': '/etc/auth/2026-10.pem'},
+        # Previous keys only verify the tokens they signed until they expire
+        {'kid': '2026-04', 'algorithm': 'RS256',
+         'public_key_file': '/etc/auth/2026-04.pub.pem'},
+    ]
+
+Keys are given as PEM with `private_key`/`public_key` or read from
+`private_key_file`/`public_key_file`. They are parsed once at startup by
+`AuthConfig.ready`, and `KeySetBackend` replaces simplejwt's `token_backend`
+so every encode and decode reuses the parsed keys. Tokens carry the `kid`
+of their key in their header.
+"""
+import base64
+import hashlib
+import json
+
+import jwt
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import gettext_lazy as _
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import InvalidKeyError
+from rest_framework_simplejwt import state
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+try:
+    from cryptography.hazmat.primitives.asymmetric import ec, ed448, \
+        ed25519, rsa
+    from cryptography.hazmat.primitives.serialization import Encoding, \
+        PublicFormat
+except ImportError:  # pragma: no cover - cryptography is not installed
+    rsa = None
+
+ASYMMETRIC_ALGORITHMS = ('RS256', 'RS384', 'RS512', 'PS256', 'PS384',
+                         'PS512', 'ES256', 'ES384', 'ES512', 'EdDSA')
+EC_CURVES = {'secp256r1': 'P-256', 'secp384r1': 'P-384',
+             'secp521r1': 'P-521'}
+
+
+class SigningKey(object):
+    """
+    Parsed signing key and its public JWK.
+    """
+    __slots__ = ('kid', 'algorithm', 'private_key', 'public_key', 'jwk')
+
+    def __init__(self, kid, algorithm, private_key, public_key, jwk):
+        self.kid = kid
+        self.algorithm = algorithm
+        self.private_key = private_key
+        self.public_key = public_key
+        self.jwk = jwk
+
+
+def b64_uint(value, length=None):
+    length = length or (value.bit_length() + 7) // 8
+    return base64.urlsafe_b64encode(value.to_bytes(length, 'big')) \
+        .rstrip(b'=').decode()
+
+
+def public_jwk(public_key):
+    """
+    Export a public key as JWK (RFC 7517, RFC 8037 for EdDSA).
+    :param public_key: cryptography public key
+    :return: The JWK as dict
+    """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        numbers = public_key.public_numbers()
+        return {'kty': 'RSA', 'n': b64_uint(numbers.n),
+                'e': b64_uint(numbers.e)}
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        numbers = public_key.public_numbers()
+        size = (public_key.curve.key_size + 7) // 8
+        return {'kty': 'EC', 'crv': EC_CURVES[public_key.curve.name],
+                'x': b64_uint(numbers.x, size),
+                'y': b64_uint(numbers.y, size)}
+    if isinstance(public_key, (ed25519.Ed25519PublicKey,
+                               ed448.Ed448PublicKey)):
+        raw = public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+        crv = 'Ed25519' if isinstance(public_key, ed25519.Ed25519PublicKey) \
+            else 'Ed448'
+        return {'kty': 'OKP', 'crv': crv,
+                'x': base64.urlsafe_b64encode(raw).rstrip(b'=').decode()}
+    raise TypeError('Unsupported key type: %s' % type(public_key).__name__)
+
+
+def read_key(config, name):
+    if config.get(name):
+        return config[name]
+    path = config.get(name + '_file')
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError as e:
+        raise ImproperlyConfigured('Cannot read the %s of signing key %s: %s'
+                                   % (name, config.get('kid'), e))
+
+
+def load_signing_key(config):
+    """
+    Parse a signing key.
+    :param config: dict with kid, algorithm and the private or public key
+    :return: SigningKey instance
+    :raise ImproperlyConfigured: When the key is invalid
+    """
+    kid = config.get('kid')
+    algorithm = config.get('algorithm')
+    if not kid:
+        raise ImproperlyConfigured('Every AUTH_SIGNING_KEYS entry needs a '
+                                   '`kid`.')
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ImproperlyConfigured('Unsupported algorithm of signing key %s: '
+                                   '%s' % (kid, algorithm))
+    implementation = get_default_algorithms().get(algorithm)
+    if implementation is None or rsa is None:
+        raise ImproperlyConfigured(
+            'The %s algorithm of signing key %s needs the `cryptography` '
+            'package and a PyJWT version supporting it.' % (algorithm, kid))
+
+    private_pem = read_key(config, 'private_key')
+    public_pem = read_key(config, 'public_key')
+    try:
+        private_key = implementation.prepare_key(private_pem) \
+            if private_pem else None
+        if public_pem:
+            public_key = implementation.prepare_key(public_pem)
+        elif private_key is not None:
+            public_key = private_key.public_key()
+        else:
+            raise ImproperlyConfigured('Signing key %s has no key.' % kid)
+        jwk = public_jwk(public_key)
+    except (ValueError, TypeError, KeyError, InvalidKeyError) as e:
+        raise ImproperlyConfigured('Invalid signing key %s: %s' % (kid, e))
+    jwk.update({'kid': kid, 'alg': algorithm, 'use': 'sig'})
+    return SigningKey(kid, algorithm, private_key, public_key, jwk)
+
+
+class KeySetBackend(object):
+    """
+    Drop-in replacement of simplejwt's `TokenBackend` signing with the
+    active key of a key set and verifying with the key named by the `kid`
+    of the token.
+
+    :param keys: SigningKey instances, the first one with a private key
+        signs the new tokens
+    :param audience: The `aud` claim added and checked
+    :param issuer: The `iss` claim added and checked
+    """
+    def __init__(self, keys, audience=None, issuer=None):
+        self.keys = {key.kid: key for key in keys}
+        signers = [key for key in keys if key.private_key is not None]
+        if not signers:
+            raise ImproperlyConfigured('AUTH_SIGNING_KEYS has no private '
+                                       'key to sign tokens with.')
+        self.active = signers[0]
+        self.algorithm = self.active.algorithm
+        self.audience = audience
+        self.issuer = issuer
+        self.headers = {'kid': self.active.kid}
+        self.jwks = json.dumps(
+            {'keys': [key.jwk for key in keys]}, sort_keys=True).encode()
+        self.jwks_etag = '"%s"' % hashlib.sha256(self.jwks).hexdigest()[:32]
+
+    def encode(self, payload):
+        """
+        Returns an encoded token for the given payload dictionary.
+        """
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload['aud'] = self.audience
+        if self.issuer is not None:
+            jwt_payload['iss'] = self.issuer
+
+        token = jwt.encode(jwt_payload, self.active.private_key,
+                           algorithm=self.active.algorithm,
+                           headers=self.headers)
+        return token.decode('utf-8') if isinstance(token, bytes) else token
+
+    def decode(self, token, verify=True):
+        """
+        Validate the given token with the key of its `kid` and return its
+        payload.
+        :raise TokenBackendError: When the token is malformed, signed with
+            an unknown key, its signature check fails or it has expired
+        """
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+            key = self.keys.get(kid)
+            if key is None:
+                raise TokenBackendError(_('Token is invalid or expired'))
+            return jwt.decode(token, key.public_key,
+                              algorithms=[key.algorithm], verify=verify,
+                              audience=self.audience, issuer=self.issuer,
+                              options={'verify_aud':
+                                       self.audience is not None})
+        except jwt.InvalidTokenError:
+            raise TokenBackendError(_('Token is invalid or expired'))
+
+
+_default_backend = None
+
+
+def install_signing_keys():
+    """
+    Replace simplejwt's token backend with a `KeySetBackend` built from
+    `AUTH_SIGNING_KEYS`, or restore the default one when it is empty.
+    :return: The installed backend
+    """
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = state.token_backend
+    configs = getattr(settings, 'AUTH_SIGNING_KEYS', None)
+    if configs:
+        kids = [config.get('kid') for config in configs]
+        if len(set(kids)) != len(kids):
+            raise ImproperlyConfigured('Duplicate kid in AUTH_SIGNING_KEYS.')
+        state.token_backend = KeySetBackend(
+            [load_signing_key(config) for config in configs],
+            audience=api_settings.AUDIENCE,
+            issuer=api_settings.ISSUER,
+        )
+    else:
+        state.token_backend = _default_backend
+    return state.token_backend
+
+
+def get_jwks():
+    """
+    Return the published key set and its ETag.
+    :return: The JWKS as json bytes and its ETag
+    """
+    backend = state.token_backend
+    if isinstance(backend, KeySetBackend):
+        return backend.jwks, backend.jwks_etag
+    return b'{"keys": []}', '"empty"'
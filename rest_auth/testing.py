@@ -0,0 +1,239 @@
+"""
+Helpers to run the login flow against a local stub provider, without any
+network access. The stub is installed as the shared transport:
+
+    provider = StubProvider()
+    set_transport(provider)
+"""
+import hashlib
+import io
+import json
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from rest_auth.user_cache import get_user_cache
+from rest_auth.views.google import GoogleOAuth2Adapter
+
+
+def make_profile(uid, email=None, first_name='Stub', last_name='User'):
+    """
+    Build the userinfo of a stub user.
+    :return: The profile as returned by the provider
+    """
+    return {
+        'id': uid,
+        'email': email or '%s@example.com' % uid,
+        'verified_email': True,
+        'name': '%s %s' % (first_name, last_name),
+        'given_name': first_name,
+        'family_name': last_name,
+        'picture': 'https://example.com/%s.png' % uid,
+    }
+
+
+def generate_signing_key(kid):
+    """
+    Generate an RSA key to sign id tokens with.
+    :param kid: The key id
+    :return: (private key, public JWK as dict)
+    """
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from jwt.algorithms import RSAAlgorithm
+
+    private_key = rsa.generate_private_key(public_exponent=65537,
+                                           key_size=2048)
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk['kid'] = kid
+    return private_key, jwk
+
+
+def make_response(data, status=200, headers=None):
+    """
+    Build a `requests.Response` holding a json body.
+    :param data: The json body
+    :param status: The status code
+    :param headers: Extra response headers
+    :return: Response instance
+    """
+    resp = Response()
+    resp.status_code = status
+    resp._content = json.dumps(data).encode()
+    resp._content_consumed = True
+    resp.encoding = 'utf-8'
+    resp.headers = CaseInsensitiveDict({'content-type': 'application/json'})
+    resp.headers.update(headers or {})
+    return resp
+
+
+class StubProvider(object):
+    """
+    Transport answering the token, userinfo and jwks requests of an adapter
+    with canned responses. Each issued code maps to the user given to
+    `authorize`, and every outbound request is recorded in `calls`.
+
+    With `id_token=True` the token response carries an id token signed with
+    a local RSA key, and the adapter is given the matching key set.
+
+    The `picture` urls of the issued profiles serve a generated PNG (with
+    `Pillow` installed), for the avatar fetch.
+    """
+    def __init__(self, adapter=GoogleOAuth2Adapter, id_token=False,
+                 audience=None):
+        self.adapter = adapter
+        self.audience = audience
+        self.calls = []
+        self._codes = {}
+        self._tokens = {}
+        self._pictures = set()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self.private_key = None
+        if id_token:
+            self._setup_id_token()
+
+    def _setup_id_token(self):
+        from rest_auth.views.id_token import JWKSCache
+
+        self.private_key, jwk = generate_signing_key('stub')
+        self.jwks = {'keys': [jwk]}
+        self.adapter.jwks = JWKSCache(keys=self.jwks)
+
+    def authorize(self, uid=None, email=None, first_name='Stub',
+                  last_name='User'):
+        """
+        Issue an authorization code for a user.
+        :return: The code to send to the callback
+        """
+        with self._lock:
+            self._counter += 1
+            number = self._counter
+        uid = uid or 'stub-%d' % number
+        code = 'code-%d-%s' % (number, uid)
+        self._codes[code] = make_profile(uid, email, first_name, last_name)
+        self._pictures.add(self._codes[code]['picture'])
+        return code
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        with self._lock:
+            self.calls.append((method, url))
+        url = url.split('?')[0]
+        if url == self.adapter.access_token_url:
+            return self.token_response(params or data or {})
+        if url == self.adapter.profile_url:
+            return self.userinfo_response((params or {}).get('access_token'))
+        if url == getattr(self.adapter, 'jwks_url', None):
+            return make_response(self.jwks)
+        if url in self._pictures:
+            return self.picture_response(url)
+        return make_response({'error': 'not_found'}, status=404)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def token_response(self, data):
+        profile = self._codes.get(data.get('code'))
+        if profile is None:
+            return make_response({'error': 'invalid_grant'}, status=400)
+        access_token = 'token-%s' % data['code']
+        self._tokens[access_token] = profile
+        body = {'access_token': access_token, 'expires_in': 3600,
+                'token_type': 'Bearer'}
+        if self.private_key is not None:
+            body['id_token'] = self.make_id_token(profile)
+        return make_response(body)
+
+    def picture_response(self, url, size=300):
+        from PIL import Image
+
+        color = tuple(hashlib.sha256(url.encode()).digest()[:3])
+        buffer = io.BytesIO()
+        Image.new('RGB', (size, size), color).save(buffer, 'PNG')
+        resp = make_response(None)
+        resp._content = buffer.getvalue()
+        resp.headers['content-type'] = 'image/png'
+        return resp
+
+    def userinfo_response(self, access_token):
+        profile = self._tokens.get(access_token)
+        if profile is None:
+            return make_response({'error': 'invalid_token'}, status=401)
+        return make_response(profile)
+
+    def make_id_token(self, profile, private_key=None, kid='stub', **claims):
+        """
+        Sign an id token for a profile.
+        :param profile: The user profile, see `make_profile`
+        :param private_key: The signing key, defaults to the stub key
+        :param kid: The key id of the token header
+        :param claims: Claims replacing the issued ones, e.g. `aud`
+        :return: The encoded id token
+        """
+        import jwt
+
+        now = int(time.time())
+        overrides = claims
+        claims = {
+            'iss': self.adapter.id_token_issuers[0],
+            'aud': self.audience,
+            'sub': profile['id'],
+            'email': profile['email'],
+            'email_verified': True,
+            'given_name': profile['given_name'],
+            'family_name': profile['family_name'],
+            'picture': profile['picture'],
+            'iat': now,
+            'exp': now + 300,
+        }
+        claims.update(overrides)
+        token = jwt.encode(claims, private_key or self.private_key,
+                           algorithm='RS256', headers={'kid': kid})
+        return token.decode() if isinstance(token, bytes) else token
+
+    def stats(self):
+        return {'backend': 'stub', 'requests': len(self.calls)}
+
+    def close(self):
+        pass
+
+
+def get_state(login_response):
+    """
+    Extract the state parameter from the login redirect, if any.
+    :param login_response: The response of the login view
+    :return: The state or None
+    """
+    query = parse_qs(urlparse(login_response['Location']).query)
+    return query.get('state', [None])[0]
+
+
+def get_budgets(adapter):
+    """
+    Query and outbound HTTP budgets of the stock configuration, checked by
+    `rest_auth.tests.test_budgets`, overridden per scenario with:
+        AUTH_PERFORMANCE_BUDGETS = {
+            'callback_returning_user': {'queries': 2, 'ms': 40},
+        }
+    The median latency depends on the machine, it is only checked when an
+    'ms' budget is set.
+    :param adapter: The provider adapter instance
+    :return: The budgets by scenario
+    """
+    outbound = 1 if adapter.use_id_token() else 2
+    api_queries = 0 if get_user_cache() is not None else 1
+    budgets = {
+        'callback_new_user': {'queries': 4, 'outbound': outbound},
+        'callback_returning_user': {'queries': 1, 'outbound': outbound},
+        'api_request': {'queries': api_queries, 'outbound': 0},
+    }
+    overrides = getattr(settings, 'AUTH_PERFORMANCE_BUDGETS', {})
+    for scenario, budget in overrides.items():
+        budgets.setdefault(scenario, {}).update(budget)
+    return budgets
@@ -0,0 +1,133 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from rest_auth.last_login import flush_last_login
+from rest_auth.testing import StubProvider, get_budgets, get_state
+from rest_auth.views.google import GoogleOAuth2Adapter
+from rest_auth.views.transport import set_transport
+
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT',
+                          'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class BudgetView(APIView):
+    """
+    Minimal protected API view, authenticated with the default DRF
+    authentication classes.
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request):
+        return Response({'id': request.user.pk})
+
+
+# The avatar fetch runs after the response, in a background thread; it
+# would race with the outbound count. The repeated logins of a single client
+# would be throttled.
+@override_settings(AUTH_AVATARS_ENABLED=False, AUTH_THROTTLE_BACKEND=None)
+class AuthBudgetTests(TestCase):
+    """
+    The query and outbound HTTP counts of the login callback and of the
+    authenticated API requests must match their budget (see `get_budgets`),
+    and the median latency stay under its 'ms' budget when one is set.
+    """
+    # Runs per scenario measured for an 'ms' budget
+    repeat = 20
+
+    def setUp(self):
+        adapter = GoogleOAuth2Adapter()
+        self.previous_jwks = GoogleOAuth2Adapter.jwks
+        self.provider = StubProvider(
+            id_token=adapter.use_id_token(),
+            audience=adapter.get_credentials()['oauth2_key'])
+        self.previous_transport = set_transport(self.provider)
+        self.budgets = get_budgets(adapter)
+
+    def tearDown(self):
+        flush_last_login()
+        set_transport(self.previous_transport)
+        GoogleOAuth2Adapter.jwks = self.previous_jwks
+
+    def get_runs(self, scenario):
+        return self.repeat if 'ms' in self.budgets[scenario] else 1
+
+    def test_callback_new_user(self):
+        runs = [self.login(self.provider.authorize())
+                for _ in range(self.get_runs('callback_new_user'))]
+        self.assertWithinBudget('callback_new_user', runs)
+
+    def test_callback_returning_user(self):
+        uid = 'budget-returning-user'
+        self.login(self.provider.authorize(uid=uid))
+        runs = [self.login(self.provider.authorize(uid=uid))
+                for _ in range(self.get_runs('callback_returning_user'))]
+        self.assertWithinBudget('callback_returning_user', runs)
+
+    def test_api_request(self):
+        token = self.login(self.provider.authorize())['token']
+        # Warm up the token and user caches, when enabled.
+        self.api_request(token)
+        runs = [self.api_request(token)
+                for _ in range(self.get_runs('api_request'))]
+        self.assertWithinBudget('api_request', runs)
+
+    def assertWithinBudget(self, scenario, runs):
+        budget = self.budgets[scenario]
+        for key in ('queries', 'outbound'):
+            self.assertEqual(max(run[key] for run in runs), budget[key],
+                             '%s: %s differ from the budget' % (scenario, key))
+        if 'ms' in budget:
+            median = statistics.median(run['ms'] for run in runs)
+            self.assertLessEqual(median, budget['ms'],
+                                 '%s: p50 %.2fms over the budget'
+                                 % (scenario, median))
+
+    def login(self, code):
+        client = Client()
+        login_response = client.get(reverse('oauth2_login',
+                                            args=('google',)))
+        params = {'code': code}
+        state = get_state(login_response)
+        if state:
+            params['state'] = state
+        callback_url = reverse('oauth2_callback', args=('google',))
+        response, measure = self.measure(
+            lambda: client.get(callback_url, params))
+
+        cookie_name = getattr(settings, 'AUTH_COOKIE_NAME', 'auth')
+        self.assertEqual(response.status_code, 302, response.content[:200])
+        self.assertIn(cookie_name, response.cookies)
+        measure['token'] = response.cookies[cookie_name].value
+        return measure
+
+    def api_request(self, token):
+        request = RequestFactory().get('/budget/',
+                                       HTTP_AUTHORIZATION='Bearer ' + token)
+        response, measure = self.measure(
+            lambda: BudgetView.as_view()(request))
+        self.assertEqual(response.status_code, 200)
+        return measure
+
+    def measure(self, run):
+        calls = len(self.provider.calls)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = run()
+            elapsed = time.perf_counter() - start
+        queries = [query for query in context.captured_queries
+                   if not query['sql'].startswith(TRANSACTION_STATEMENTS)]
+        return response, {
+            'queries': len(queries),
+            'outbound': len(self.provider.calls) - calls,
+            'ms': elapsed * 1000,
+        }
@@ -0,0 +1,166 @@
+import threading
+import time
+from unittest import skipIf
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from requests import Response
+
+from rest_auth.exceptions import OAuth2Error
+from rest_auth.testing import StubProvider, generate_signing_key, \
+    make_profile
+from rest_auth.views.google import GoogleOAuth2Adapter
+from rest_auth.views.id_token import JWKSCache, RSAAlgorithm, \
+    verify_id_token
+from rest_auth.views.transport import set_transport
+
+
+requires_cryptography = skipIf(RSAAlgorithm is None,
+                               'cryptography is not installed')
+
+
+@requires_cryptography
+class IdTokenVerificationTests(SimpleTestCase):
+    """
+    Verification of the id tokens against the key set of the stub provider.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.previous_jwks = GoogleOAuth2Adapter.jwks
+        cls.provider = StubProvider(
+            id_token=True, audience=settings.SOCIAL_AUTH_GOOGLE_OAUTH2_KEY)
+        cls.other_key, cls.other_jwk = generate_signing_key('rotated')
+
+    @classmethod
+    def tearDownClass(cls):
+        GoogleOAuth2Adapter.jwks = cls.previous_jwks
+        super().tearDownClass()
+
+    def setUp(self):
+        self.adapter = GoogleOAuth2Adapter()
+        self.profile = make_profile('stub-id-token')
+
+    def assertRejected(self, id_token):
+        with self.assertRaises(OAuth2Error) as context:
+            self.adapter.verify_id_token(id_token)
+        self.assertEqual(context.exception.cause, 'id_token')
+
+    def test_valid_token(self):
+        claims = self.adapter.verify_id_token(
+            self.provider.make_id_token(self.profile))
+        self.assertEqual(claims['sub'], self.profile['id'])
+
+    def test_bad_signature(self):
+        self.assertRejected(self.provider.make_id_token(
+            self.profile, private_key=self.other_key))
+
+    def test_wrong_audience(self):
+        self.assertRejected(self.provider.make_id_token(self.profile,
+                                                        aud='other'))
+
+    def test_wrong_issuer(self):
+        self.assertRejected(self.provider.make_id_token(
+            self.profile, iss='https://issuer.example.com'))
+
+    def test_expired(self):
+        now = int(time.time())
+        self.assertRejected(self.provider.make_id_token(
+            self.profile, iat=now - 3600, exp=now - 600))
+
+    def test_unknown_key(self):
+        self.assertRejected(self.provider.make_id_token(
+            self.profile, private_key=self.other_key, kid='rotated'))
+
+
+@requires_cryptography
+class JWKSCacheTests(SimpleTestCase):
+    """
+    Refreshes of the key set for the unknown `kid`s.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.provider = StubProvider(id_token=True, audience='stub-client')
+        cls.other_key, cls.other_jwk = generate_signing_key('rotated')
+
+    def setUp(self):
+        self.published = list(self.provider.jwks['keys'])
+        self.fetches = 0
+        self.fail = False
+        self.id_token = self.provider.make_id_token(
+            make_profile('stub-rotated'), private_key=self.other_key,
+            kid='rotated')
+
+    def fetch(self):
+        self.fetches += 1
+        # Let the concurrent lookups pile up on the refresh
+        time.sleep(0.05)
+        if self.fail:
+            raise OSError('JWKS endpoint down')
+        return {'keys': list(self.published)}, None
+
+    def get_jwks(self, min_refresh_interval):
+        jwks = JWKSCache(fetch=self.fetch,
+                         min_refresh_interval=min_refresh_interval)
+        jwks.refresh()
+        self.fetches = 0
+        return jwks
+
+    def verify(self, jwks):
+        return verify_id_token(self.id_token, jwks, audience='stub-client',
+                               issuers=GoogleOAuth2Adapter.id_token_issuers)
+
+    def test_rotated_key_concurrent_lookups(self):
+        jwks = self.get_jwks(min_refresh_interval=0.1)
+        self.published.append(self.other_jwk)
+        time.sleep(0.1)
+        results = []
+
+        def verify():
+            try:
+                results.append(self.verify(jwks)['sub'])
+            except OAuth2Error as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=verify) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['stub-rotated'] * 8)
+        self.assertEqual(self.fetches, 1)
+
+    def test_unknown_key_refresh_rate_limited(self):
+        jwks = self.get_jwks(min_refresh_interval=60)
+        self.published.append(self.other_jwk)
+        with self.assertRaises(OAuth2Error):
+            self.verify(jwks)
+        self.assertEqual(self.fetches, 0)
+
+    def test_failed_refresh_is_retried(self):
+        jwks = self.get_jwks(min_refresh_interval=0.1)
+        self.published.append(self.other_jwk)
+        time.sleep(0.1)
+        self.fail = True
+        with self.assertRaises(OSError):
+            self.verify(jwks)
+        self.fail = False
+        self.assertEqual(self.verify(jwks)['sub'], 'stub-rotated')
+        self.assertEqual(self.fetches, 2)
+
+    def test_invalid_jwks_response(self):
+        class HtmlTransport(object):
+            def get(self, url, **kwargs):
+                resp = Response()
+                resp.status_code = 200
+                resp._content = b'<html>Service Unavailable</html>'
+                return resp
+
+        previous = set_transport(HtmlTransport())
+        try:
+            with self.assertRaises(OAuth2Error) as context:
+                JWKSCache(url='https://example.com/certs').get_key('stub')
+        finally:
+            set_transport(previous)
+        self.assertEqual(context.exception.cause, 'id_token')
@@ -0,0 +1,35 @@
+from django.test import Client, TestCase, override_settings
+
+from rest_auth.auth_utils import create_tokens_for_user
+from rest_auth.models import User
+
+
+class TokenRefreshTests(TestCase):
+    """
+    Rotation of the refresh tokens and detection of their reuse.
+    """
+    def setUp(self):
+        self.user = User.objects.create(email='refresh@example.com',
+                                        first_name='Refresh',
+                                        last_name='User')
+
+    def refresh(self, refresh_token):
+        return Client().post('/accounts/token/refresh/',
+                             {'refresh': refresh_token})
+
+    def test_concurrent_refresh(self):
+        access_token, refresh_token = create_tokens_for_user(self.user)
+        self.assertEqual(self.refresh(refresh_token).status_code, 200)
+        self.assertEqual(self.refresh(refresh_token).status_code, 200)
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.tokens_not_before)
+
+    @override_settings(AUTH_REFRESH_REUSE_GRACE=0)
+    def test_reuse_revokes_user_tokens(self):
+        access_token, refresh_token = create_tokens_for_user(self.user)
+        self.assertEqual(self.refresh(refresh_token).status_code, 200)
+        response = self.refresh(refresh_token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json()['code'], 'token_revoked')
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.tokens_not_before)
@@ -0,0 +1,188 @@
+"""
+Token bucket throttling of the login and callback views:
+    AUTH_THROTTLE_BACKEND = 'local'  # or 'django' to use the cache framework
+    AUTH_THROTTLE_RATES = {
+        'login': '30/min',  # per client ip
+        'callback': '30/min',  # per client ip
+        'callback_global': '50/s',  # token exchanges of the whole process
+    }
+    AUTH_THROTTLE_CACHE_ALIAS = 'default'  # 'django' only
+    AUTH_THROTTLE_IP_HEADER = None  # e.g. 'HTTP_X_FORWARDED_FOR'
+    AUTH_THROTTLE_PROXY_COUNT = 1  # trusted proxies appending to it
+
+A rate 'N/period' allows bursts of N requests, refilled at N per period. A
+scope without a rate is not throttled. The 'local' buckets are per process,
+with the 'django' backend the buckets are shared through the cache, without
+locking, so concurrent requests may slightly exceed the rate.
+
+Throttled requests get a 429 with a `Retry-After` header and are counted in
+`rest_auth_throttled_requests_total`.
+"""
+import math
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from rest_auth.cache import LRUCache
+from rest_auth.exceptions import ImmediateHttpResponse
+from rest_auth.metrics import record_event, throttled_requests
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    Parse a rate as DRF does, ex: '30/min'.
+    :param rate: 'N/period', the period being s, m, h or d (or a word
+        starting with them)
+    :return: (capacity, tokens refilled per second) or None
+    """
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / PERIODS[period.strip()[0]]
+
+
+class LocalBuckets(object):
+    """
+    Per-process token buckets.
+    """
+    def __init__(self, max_size=10000):
+        self.buckets = LRUCache(max_size=max_size)
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, refill):
+        """
+        Take a token from a bucket.
+        :param key: The bucket key
+        :param capacity: Size of the bucket
+        :param refill: Tokens added per second
+        :return: 0 when a token was taken, otherwise the seconds until one
+            is available
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self.buckets.get(key) or (capacity, now)
+            tokens, wait = take_token(tokens, updated, now, capacity, refill)
+            # A full bucket expires, it would be recreated the same way
+            self.buckets.set(key, (tokens, now),
+                             time.time() + capacity / refill)
+        return wait
+
+
+class DjangoBuckets(object):
+    """
+    Token buckets stored through Django's cache framework.
+    """
+    key_prefix = 'rest_auth:throttle:'
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def consume(self, key, capacity, refill):
+        now = time.time()
+        key = self.key_prefix + key
+        tokens, updated = self.cache.get(key) or (capacity, now)
+        tokens, wait = take_token(tokens, updated, now, capacity, refill)
+        self.cache.set(key, (tokens, now), math.ceil(capacity / refill))
+        return wait
+
+
+def take_token(tokens, updated, now, capacity, refill):
+    """
+    Refill a bucket up to `now` and take a token from it.
+    :return: (tokens left, seconds to wait for a token)
+    """
+    tokens = min(capacity, tokens + max(now - updated, 0) * refill)
+    if tokens >= 1:
+        return tokens - 1, 0
+    return tokens, (1 - tokens) / refill
+
+
+_buckets = None
+_buckets_config = None
+_buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    """
+    Return the configured token buckets.
+    :return: LocalBuckets, DjangoBuckets or None if disabled
+    """
+    global _buckets, _buckets_config
+    config = (
+        getattr(settings, 'AUTH_THROTTLE_BACKEND', None),
+        getattr(settings, 'AUTH_THROTTLE_CACHE_ALIAS', 'default'),
+    )
+    if config != _buckets_config:
+        with _buckets_lock:
+            backend, alias = config
+            if backend == 'local':
+                _buckets = LocalBuckets()
+            elif backend == 'django':
+                _buckets = DjangoBuckets(alias=alias)
+            else:
+                _buckets = None
+            _buckets_config = config
+    return _buckets
+
+
+def get_client_ip(request):
+    """
+    The client address, from `AUTH_THROTTLE_IP_HEADER` behind a proxy. The
+    left entries of X-Forwarded-For are set by the client, the address is
+    the one appended by the first of the `AUTH_THROTTLE_PROXY_COUNT` trusted
+    proxies, i.e. the Nth entry from the right.
+    """
+    header = getattr(settings, 'AUTH_THROTTLE_IP_HEADER', None)
+    if header and request.META.get(header):
+        entries = [entry.strip() for entry in request.META[header].split(',')]
+        count = getattr(settings, 'AUTH_THROTTLE_PROXY_COUNT', 1)
+        if 0 < count <= len(entries):
+            return entries[-count]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_throttles(request, scopes):
+    """
+    Take a token from the bucket of each scope.
+    :param request: django HttpRequest
+    :param scopes: (scope, per_ip) pairs, global scopes have a single bucket
+    :raise ImmediateHttpResponse: 429 response when a bucket is empty
+    """
+    buckets = get_buckets()
+    if buckets is None:
+        return
+    rates = getattr(settings, 'AUTH_THROTTLE_RATES', {})
+    for scope, per_ip in scopes:
+        rate = parse_rate(rates.get(scope))
+        if rate is None:
+            continue
+        key = '%s:%s' % (scope, get_client_ip(request)) if per_ip else scope
+        wait = buckets.consume(key, *rate)
+        if wait:
+            record_event(throttled_requests, scope=scope)
+            response = HttpResponse('Too many requests.', status=429,
+                                    content_type='text/plain')
+            response['Retry-After'] = str(math.ceil(wait))
+            raise ImmediateHttpResponse(response)
+
+
+async def acheck_throttles(request, scopes):
+    """
+    `check_throttles` for async views, the 'django' backend runs in a
+    thread.
+    """
+    if isinstance(get_buckets(), DjangoBuckets):
+        await sync_to_async(check_throttles)(request, scopes)
+    else:
+        check_throttles(request, scopes)
@@ -0,0 +1,85 @@
+"""
+Per-phase timing of the oauth callback.
+
+The phases are measured with a monotonic clock and reported:
+ - in a `Server-Timing` response header when `AUTH_SERVER_TIMING` is set
+ - through the `callback_timed` signal
+ - to the callables listed in `AUTH_CALLBACK_TIMING_HOOKS`, each called as
+   `hook(request=request, timings=timings, outcome=outcome)`
+
+A failing receiver or hook is logged (`rest_auth.timing` logger) and never
+fails the callback.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+# Sent with `request`, `timings` (phase name -> seconds) and `outcome`
+# ('success' or 'error').
+callback_timed = Signal()
+
+logger = logging.getLogger(__name__)
+
+_hooks = {}
+
+
+class PhaseTimer(object):
+    """
+    Collect the duration of the named phases of a request.
+    """
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def server_timing(self):
+        """
+        Format the timings as a `Server-Timing` header value.
+        """
+        return ', '.join('%s;dur=%.2f' % (name, seconds * 1000)
+                         for name, seconds in self.timings.items())
+
+
+def get_timing_hooks():
+    paths = tuple(getattr(settings, 'AUTH_CALLBACK_TIMING_HOOKS', ()))
+    hooks = _hooks.get(paths)
+    if hooks is None:
+        hooks = _hooks[paths] = [import_string(path) for path in paths]
+    return hooks
+
+
+def report_timings(sender, request, response, timer, outcome):
+    """
+    Publish the timings of a callback.
+    :param sender: The adapter class
+    :param request: django HttpRequest
+    :param response: The callback response
+    :param timer: PhaseTimer instance
+    :param outcome: 'success' or 'error'
+    :return: The response
+    """
+    if getattr(settings, 'AUTH_SERVER_TIMING', False):
+        response['Server-Timing'] = timer.server_timing()
+    results = callback_timed.send_robust(sender=sender, request=request,
+                                         timings=timer.timings,
+                                         outcome=outcome)
+    for receiver, result in results:
+        if isinstance(result, Exception):
+            logger.error('callback_timed receiver %r failed', receiver,
+                         exc_info=result)
+    for hook in get_timing_hooks():
+        try:
+            hook(request=request, timings=timer.timings, outcome=outcome)
+        except Exception:
+            logger.exception('Callback timing hook %r failed', hook)
+    return response
@@ -1,11 +1,33 @@
+from django.conf import settings
 from django.urls import path
 
-from rest_auth.views.google import google_oauth2_login, google_oauth2_callback
+from rest_auth.views.avatars import avatar
+from rest_auth.views.oauth2 import oauth2_login, oauth2_callback, \
+    oauth2_login_async, oauth2_callback_async
 from rest_auth.views.templates import login_cancelled, login_error
+from rest_auth.views.tokens import token_refresh, logout, jwks
+
+if getattr(settings, 'AUTH_ASYNC_VIEWS', False):
+    login_view, callback_view = oauth2_login_async, oauth2_callback_async
+else:
+    login_view, callback_view = oauth2_login, oauth2_callback
 
 urlpatterns = [
-    path('login/', google_oauth2_login, name="google_login"),
-    path('login/callback/', google_oauth2_callback, name="google_callback"),
+    path('<str:provider>/login/', login_view, name='oauth2_login'),
+    path('<str:provider>/login/callback/', callback_view,
+         name='oauth2_callback'),
+    # routes and names of the former google only urls, when included
+    # under accounts/google/
+    path('login/', login_view, {'provider': 'google'}, name='google_login'),
+    path('login/callback/', callback_view, {'provider': 'google'},
+         name='google_callback'),
     path('login/cancelled/', login_cancelled, name='login_cancelled'),
     path('login/error/', login_error, name='login_error'),
+    path('token/refresh/', token_refresh, name='token_refresh'),
+    path('logout/', logout, name='logout'),
+    path('jwks.json', jwks, name='jwks'),
 ]
+
+if getattr(settings, 'AUTH_AVATARS_ENABLED', False):
+    urlpatterns.append(path('avatars/<str:key>/<int:size>.jpg', avatar,
+                            name='avatar'))
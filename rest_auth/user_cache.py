@@ -0,0 +1,118 @@
+"""
+Opt-in cache of the users loaded by `RestAuthentication`, so authenticated
+requests don't run a `User` query each time. It is enabled with:
+    AUTH_USER_CACHE = 'local'  # or 'django' to use the cache framework
+    AUTH_USER_CACHE_TTL = 300
+    AUTH_USER_CACHE_MAX_SIZE = 1024  # 'local' only
+    AUTH_USER_CACHE_ALIAS = 'default'  # 'django' only
+
+Entries are invalidated by the `User` signals in `rest_auth.signals`. The
+'local' backend only sees the signals of its own process, deployments with
+several processes should use the 'django' backend with a shared cache.
+Entries are keyed by the token user id, which is expected to be the user
+primary key (simplejwt's default `USER_ID_FIELD`).
+"""
+import copy
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_auth.cache import LRUCache
+
+
+class LocalUserCache(object):
+    """
+    Per-process user cache.
+    """
+    def __init__(self, ttl=300, max_size=1024):
+        self.ttl = ttl
+        self.cache = LRUCache(max_size=max_size)
+
+    def get(self, user_id):
+        user = self.cache.get(user_id)
+        # Callers may modify the returned user, keep the cached one intact.
+        return copy.copy(user) if user is not None else None
+
+    def set(self, user_id, user):
+        self.cache.set(user_id, copy.copy(user), time.time() + self.ttl)
+
+    def delete(self, user_id):
+        self.cache.delete(user_id)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class DjangoUserCache(object):
+    """
+    User cache stored through Django's cache framework.
+    """
+    key_prefix = 'rest_auth:user:'
+
+    def __init__(self, ttl=300, alias='default'):
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, user_id):
+        return self.cache.get(self.key_prefix + str(user_id))
+
+    def set(self, user_id, user):
+        self.cache.set(self.key_prefix + str(user_id), user, self.ttl)
+
+    def delete(self, user_id):
+        self.cache.delete(self.key_prefix + str(user_id))
+
+    def clear(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+_user_cache = None
+_user_cache_config = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """
+    Return the configured user cache.
+    :return: LocalUserCache, DjangoUserCache or None if disabled
+    """
+    global _user_cache, _user_cache_config
+    config = (
+        getattr(settings, 'AUTH_USER_CACHE', None),
+        getattr(settings, 'AUTH_USER_CACHE_TTL', 300),
+        getattr(settings, 'AUTH_USER_CACHE_MAX_SIZE', 1024),
+        getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default'),
+    )
+    if config != _user_cache_config:
+        with _user_cache_lock:
+            backend, ttl, max_size, alias = config
+            if backend == 'local':
+                _user_cache = LocalUserCache(ttl=ttl, max_size=max_size)
+            elif backend == 'django':
+                _user_cache = DjangoUserCache(ttl=ttl, alias=alias)
+            else:
+                _user_cache = None
+            _user_cache_config = config
+    return _user_cache
+
+
+def invalidate_user(user_id):
+    """
+    Drop a user from the cache.
+    :param user_id: The user primary key
+    """
+    user_cache = get_user_cache()
+    if user_cache is not None:
+        user_cache.delete(user_id)
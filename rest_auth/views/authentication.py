@@ -1,5 +1,38 @@
+import hashlib
+import threading
+
 from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from rest_auth.cache import LRUCache
+from rest_auth.metrics import record_event, authenticated_requests, \
+    token_validation_failures
+from rest_auth.models import ClaimsUser
+from rest_auth.revocation import is_token_revoked
+from rest_auth.routers import replica_get, user_key
+from rest_auth.user_cache import get_user_cache
+
+_token_cache = None
+_token_cache_lock = threading.Lock()
+
+
+def get_token_cache():
+    """
+    Return the per-process cache of validated tokens, sized with:
+        AUTH_TOKEN_CACHE_SIZE = 1024  # 0 disables it
+    Its hit and miss counters are available with `get_token_cache().stats()`.
+    :return: LRUCache instance or None if disabled
+    """
+    global _token_cache
+    size = getattr(settings, 'AUTH_TOKEN_CACHE_SIZE', 1024)
+    if _token_cache is None or _token_cache.max_size != size:
+        with _token_cache_lock:
+            if _token_cache is None or _token_cache.max_size != size:
+                _token_cache = LRUCache(max_size=size)
+    return _token_cache if size > 0 else None
 
 
 class RestAuthentication(JWTAuthentication):
@@ -20,5 +53,111 @@ class RestAuthentication(JWTAuthentication):
         if not jwt_token:
             return None
 
-        validated_token = self.get_validated_token(jwt_token)
-        return self.get_user(validated_token), validated_token
+        try:
+            validated_token = self.get_validated_token(jwt_token)
+            if is_token_revoked(validated_token.payload):
+                raise InvalidToken('Token has been revoked',
+                                   code='token_revoked')
+            if self.is_stateless(request):
+                mode = 'stateless'
+                user = self.get_stateless_user(validated_token)
+            else:
+                mode = 'user'
+                user = self.get_user(validated_token)
+        except AuthenticationFailed as e:
+            codes = e.get_codes()
+            if isinstance(codes, dict):
+                codes = codes.get('code', 'unknown')
+            record_event(token_validation_failures, reason=codes)
+            raise
+        record_event(authenticated_requests, mode=mode)
+        return user, validated_token
+
+    def get_validated_token(self, raw_token):
+        """
+        Validate the token, or return it from the cache of validated tokens.
+        Entries are keyed by a digest of the raw token and expire with the
+        token's own `exp` claim.
+        """
+        token_cache = get_token_cache()
+        if token_cache is None:
+            return super().get_validated_token(raw_token)
+
+        if isinstance(raw_token, str):
+            raw_token = raw_token.encode()
+        key = hashlib.sha256(raw_token).digest()
+        validated_token = token_cache.get(key)
+        if validated_token is None:
+            validated_token = super().get_validated_token(raw_token)
+            token_cache.set(key, validated_token, validated_token['exp'])
+        return validated_token
+
+    def is_stateless(self, request):
+        """
+        Whether the request gets a `ClaimsUser` built from the token instead
+        of the `User` row. A view decides with its `stateless_authentication`
+        attribute, otherwise the request path is matched against:
+            AUTH_STATELESS_PATHS = ['/api/internal/']
+        """
+        view = (getattr(request, 'parser_context', None) or {}).get('view')
+        stateless = getattr(view, 'stateless_authentication', None)
+        if stateless is not None:
+            return stateless
+        paths = getattr(settings, 'AUTH_STATELESS_PATHS', ())
+        return bool(paths) and request.path.startswith(tuple(paths))
+
+    def get_stateless_user(self, validated_token):
+        """
+        Build the user from the token claims. Tokens minted without the
+        stateless claims (see `AUTH_STATELESS_CLAIMS`) fall back to the
+        database.
+        """
+        if 'email' not in validated_token:
+            return self.get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user '
+                               'identification')
+        return ClaimsUser(validated_token, user_id)
+
+    def get_user(self, validated_token):
+        """
+        Return the user of the token, from the user cache when it is enabled
+        (see `rest_auth.user_cache`), otherwise from a read replica when they
+        are configured (see `rest_auth.routers`). Cache misses are read from
+        the primary: the pins of `rest_auth.routers` are per process, a row
+        read from a lagging replica could put back a user just deactivated
+        or logged out everywhere by another process, for the whole TTL.
+        """
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user '
+                               'identification')
+
+        user_cache = get_user_cache()
+        if user_cache is None:
+            return self.load_user(validated_token, user_id)
+
+        user = user_cache.get(user_id)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+        return user
+
+    def load_user(self, validated_token, user_id):
+        # A user missing or inactive on a lagging replica is looked up again
+        # on the primary.
+        return replica_get(super().get_user, validated_token,
+                           pin_key=user_key(user_id),
+                           retry_on=(AuthenticationFailed,))
+
+
+class StatelessRestAuthentication(RestAuthentication):
+    """
+    RestAuthentication that always authenticates with a `ClaimsUser`, for the
+    views listing it in `authentication_classes`.
+    """
+    def is_stateless(self, request):
+        return True
@@ -0,0 +1,33 @@
+import re
+
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+
+from rest_auth.avatars import get_avatar_name, get_sizes, get_storage
+
+AVATAR_KEY_RE = re.compile(r'^[0-9a-f]{32}$')
+# A key always serves the same bytes
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@require_GET
+def avatar(request, key, size):
+    """
+    Serve an avatar thumbnail. The ETag is checked before the storage is
+    touched.
+    """
+    if not AVATAR_KEY_RE.match(key) or size not in get_sizes():
+        raise Http404('Unknown avatar')
+    etag = '"%s-%d"' % (key, size)
+    if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            content = get_storage().open(get_avatar_name(key, size))
+        except OSError:
+            raise Http404('Unknown avatar')
+        response = FileResponse(content, content_type='image/jpeg')
+    response['Cache-Control'] = CACHE_CONTROL
+    response['ETag'] = etag
+    return response
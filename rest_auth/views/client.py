@@ -1,9 +1,11 @@
 from urllib.parse import parse_qsl
 
-import requests
 from django.utils.http import urlencode
 
 from rest_auth.exceptions import OAuth2Error
+from rest_auth.login_state import get_code_challenge
+from rest_auth.views.transport import get_transport, \
+    get_async_transport
 
 
 class OAuth2Client(object):
@@ -24,8 +26,12 @@ class OAuth2Client(object):
         self.callback_url = callback_url
         self.consumer_key = consumer_key
         self.consumer_secret = consumer_secret
-        self.scope = scope_delimiter.join(set(scope))
+        # The provider registry hands over the scope already joined
+        self.scope = scope if isinstance(scope, str) \
+            else scope_delimiter.join(set(scope))
         self.state = None
+        # PKCE code verifier, its challenge is sent to the authorization url
+        self.code_verifier = None
         self.headers = headers
         self.basic_auth = basic_auth
 
@@ -45,26 +51,29 @@ class OAuth2Client(object):
         }
         if self.state:
             params['state'] = self.state
+        if self.code_verifier:
+            params['code_challenge'] = get_code_challenge(self.code_verifier)
+            params['code_challenge_method'] = 'S256'
         params.update(extra_params)
         return '%s?%s' % (authorization_url, urlencode(params))
 
-    def get_access_token(self, code):
+    def get_access_token_request(self, code):
         """
-        Fetch the access token based on the code
+        Build the arguments of the access token request
         :param code: code received from provider
         :type code: string
-        :return: The access token
-        :rtype: json
+        :return: The request method, url and keyword arguments
+        :rtype: tuple
         """
         data = {
             'redirect_uri': self.callback_url,
             'grant_type': 'authorization_code',
             'code': code
         }
+        if self.code_verifier:
+            data['code_verifier'] = self.code_verifier
         if self.basic_auth:
-            auth = requests.auth.HTTPBasicAuth(
-                self.consumer_key,
-                self.consumer_secret)
+            auth = (self.consumer_key, self.consumer_secret)
         else:
             auth = None
             data.update({
@@ -72,27 +81,65 @@ class OAuth2Client(object):
                 'client_secret': self.consumer_secret
             })
         params = None
-        url = self.access_token_url
         if self.access_token_method == 'GET':
             params = data
             data = None
 
-        resp = requests.request(
-            self.access_token_method,
-            url,
-            params=params,
-            data=data,
-            headers=self.headers,
-            auth=auth)
+        return self.access_token_method, self.access_token_url, {
+            'params': params,
+            'data': data,
+            'headers': self.headers,
+            'auth': auth,
+        }
 
+    def parse_access_token(self, resp):
+        """
+        Parse the providers response of the access token request
+        :param resp: The response object
+        :return: The access token
+        :rtype: json
+        """
         access_token = None
         app_json = 'application/json'
         if resp.status_code == 200:
             if resp.headers['content-type'].split(';')[0] == app_json:
                 access_token = resp.json()
             else:
-                access_token = dict(parse_qsl(resp.content))
+                access_token = dict(parse_qsl(resp.text))
         if not access_token or 'access_token' not in access_token:
             raise OAuth2Error(message='Error retrieving access token: %s'
-                                      % resp.content)
+                                      % resp.content,
+                              cause='token_exchange')
         return access_token
+
+    def get_access_token(self, code):
+        """
+        Fetch the access token based on the code
+        :param code: code received from provider
+        :type code: string
+        :return: The access token
+        :rtype: json
+        """
+        method, url, kwargs = self.get_access_token_request(code)
+        resp = get_transport().request(method, url, endpoint='token',
+                                       **kwargs)
+        return self.parse_access_token(resp)
+
+
+class AsyncOAuth2Client(OAuth2Client):
+    """
+    Client used by the async views, the access token is fetched without
+    blocking the event loop.
+    """
+    async def get_access_token(self, code):
+        """
+        Fetch the access token based on the code
+        :param code: code received from provider
+        :type code: string
+        :return: The access token
+        :rtype: json
+        """
+        method, url, kwargs = self.get_access_token_request(code)
+        resp = await get_async_transport().request(method, url,
+                                                   endpoint='token', **kwargs)
+        return self.parse_access_token(resp)
@@ -22,5 +22,6 @@ class AuthError(object):
 
 
 class GoogleScope(object):
+    OPENID = 'openid'
     EMAIL = 'email'
     PROFILE = 'profile'
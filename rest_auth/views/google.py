@@ -1,11 +1,15 @@
+import threading
 from urllib.parse import parse_qsl
 
-import requests
+from asgiref.sync import sync_to_async
 from django.conf import settings as _settings
 from django.urls import reverse
 
 from rest_auth.views.constants import GoogleScope, AuthAction
-from rest_auth.views.oauth2 import OAuth2CallbackView, OAuth2LoginView
+from rest_auth.views.id_token import JWKSCache, verify_id_token
+from rest_auth.views.oauth2 import OAuth2CallbackView, OAuth2LoginView, \
+    AsyncOAuth2CallbackView, AsyncOAuth2LoginView
+from rest_auth.views.transport import get_transport, get_async_transport
 
 
 class GoogleOAuth2Adapter:
@@ -17,27 +21,47 @@ class GoogleOAuth2Adapter:
     access_token_url = 'https://accounts.google.com/o/oauth2/token'
     authorize_url = 'https://accounts.google.com/o/oauth2/auth'
     profile_url = 'https://www.googleapis.com/oauth2/v1/userinfo'
+    jwks_url = 'https://www.googleapis.com/oauth2/v3/certs'
+    id_token_issuers = ('https://accounts.google.com', 'accounts.google.com')
+    # Claims that change with every issued token, not stored in extra_data
+    id_token_volatile_claims = ('iat', 'exp', 'nbf', 'at_hash', 'c_hash',
+                                'nonce', 'jti')
     access_token_method = 'POST'
     login_cancelled_error = 'access_denied'
     scope_delimiter = ' '
     basic_auth = False
     headers = None
+    # Supports PKCE (RFC 7636) with the S256 method
+    pkce = True
+    # JWKSCache used to verify id tokens, built on first use
+    jwks = None
+    _jwks_lock = threading.Lock()
 
-    def get_auth_params(self, request, action):
+    def get_static_auth_params(self):
         """
-        Add additional auth params such as:
+        Get the additional auth params from settings, such as:
             SOCIALACCOUNT_PROVIDERS={
                 'google': {
                     'AUTH_PARAMS': {'auth_type': 'reauthenticate'},
                 }
             }
+        :return: Auth params
+        """
+        providers = getattr(_settings, 'SOCIALACCOUNT_PROVIDERS', None) or {}
+        return dict(providers.get(self.id, {}).get('AUTH_PARAMS', {}))
+
+    def get_auth_params(self, request, action, static_params=None):
+        """
+        Get the auth params of a login request: the static ones, the dynamic
+        `auth_params` query parameter and the action ones.
         :param request: django HttpRequest
         :param action: AuthAction instance
+        :param static_params: Precomputed static auth params, read from
+            settings when not given
         :return: Auth params
         """
-        settings = getattr(_settings, 'SOCIALACCOUNT_PROVIDERS', None)
-        content = _settings.get(self.id, {}) if settings else {}
-        ret = dict(content.get('AUTH_PARAMS', {}))
+        ret = dict(static_params if static_params is not None
+                   else self.get_static_auth_params())
         dynamic_auth_params = request.GET.get('auth_params', None)
         if dynamic_auth_params:
             ret.update(dict(parse_qsl(dynamic_auth_params)))
@@ -51,7 +75,44 @@ class GoogleOAuth2Adapter:
         Get providers scope
         :return: list of scopes
         """
-        return [GoogleScope.PROFILE, GoogleScope.EMAIL]
+        scope = [GoogleScope.PROFILE, GoogleScope.EMAIL]
+        if self.use_id_token():
+            scope.append(GoogleScope.OPENID)
+        return scope
+
+    def use_id_token(self):
+        """
+        Whether the user data is read from the verified id token instead of
+        the userinfo endpoint:
+            SOCIAL_AUTH_GOOGLE_ID_TOKEN = True
+        :return: bool
+        """
+        return getattr(_settings, 'SOCIAL_AUTH_GOOGLE_ID_TOKEN', False)
+
+    def get_jwks(self):
+        """
+        Get the cached key set of the provider, shared by all requests.
+        :return: JWKSCache instance
+        """
+        cls = type(self)
+        if cls.jwks is None:
+            with cls._jwks_lock:
+                if cls.jwks is None:
+                    cls.jwks = JWKSCache(self.jwks_url)
+        return cls.jwks
+
+    def verify_id_token(self, id_token):
+        """
+        Verify the id token locally and return its claims.
+        :param id_token: The encoded id token
+        :return: The verified claims as dict
+        """
+        return verify_id_token(
+            id_token,
+            self.get_jwks(),
+            audience=self.get_credentials()['oauth2_key'],
+            issuers=self.id_token_issuers,
+        )
 
     def get_credentials(self):
         """
@@ -64,6 +125,13 @@ class GoogleOAuth2Adapter:
             'oauth2_secret': _settings.SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET,
         }
 
+    def get_callback_path(self):
+        """
+        Get the path of the callback view of this provider.
+        :return: The callback path
+        """
+        return reverse('oauth2_callback', kwargs={'provider': self.id})
+
     def get_callback_url(self, request):
         """
         Build and get the callback url. This url should match the same url
@@ -71,8 +139,7 @@ class GoogleOAuth2Adapter:
         :param request: django HttpRequest
         :return: The built URL
         """
-        callback_url = reverse(self.id + "_callback")
-        return request.build_absolute_uri(callback_url)
+        return request.build_absolute_uri(self.get_callback_path())
 
     def get_token(self, data):
         """
@@ -82,18 +149,55 @@ class GoogleOAuth2Adapter:
         """
         return data.get('access_token')
 
-    def get_extra_data(self, token):
+    def get_extra_data(self, token, response=None):
         """
         Get the necessary data from the providers response and attach
-        additional information.
+        additional information. When the id token mode is enabled the data is
+        read from the verified id token, without calling the userinfo
+        endpoint.
         :param token: The access token
+        :param response: The access token response as dict
         :return: The dict containing parsed data from providers response
         """
-        resp = requests.get(self.profile_url, params={'access_token': token,
-                                                      'alt': 'json'})
+        id_token = (response or {}).get('id_token')
+        if id_token and self.use_id_token():
+            claims = self.verify_id_token(id_token)
+            return self.parse_id_token_claims(token, claims)
+
+        resp = get_transport().get(self.profile_url,
+                                   params={'access_token': token,
+                                           'alt': 'json'},
+                                   endpoint='userinfo')
         resp.raise_for_status()
-        data = resp.json()
+        return self.parse_extra_data(token, resp.json())
 
+    async def aget_extra_data(self, token, response=None):
+        """
+        Async version of `get_extra_data`.
+        :param token: The access token
+        :param response: The access token response as dict
+        :return: The dict containing parsed data from providers response
+        """
+        id_token = (response or {}).get('id_token')
+        if id_token and self.use_id_token():
+            claims = await sync_to_async(
+                self.verify_id_token, thread_sensitive=False)(id_token)
+            return self.parse_id_token_claims(token, claims)
+
+        resp = await get_async_transport().get(self.profile_url,
+                                               params={'access_token': token,
+                                                       'alt': 'json'},
+                                               endpoint='userinfo')
+        resp.raise_for_status()
+        return self.parse_extra_data(token, resp.json())
+
+    def parse_extra_data(self, token, data):
+        """
+        Build the user data from the providers userinfo response.
+        :param token: The access token
+        :param data: The userinfo response as dict
+        :return: The dict containing parsed data from providers response
+        """
         return {
             'provider': self.id,
             'token': token,
@@ -106,6 +210,33 @@ class GoogleOAuth2Adapter:
             'extra_data': data,
         }
 
+    def parse_id_token_claims(self, token, claims):
+        """
+        Build the user data from the verified id token claims.
+        :param token: The access token
+        :param claims: The id token claims as dict
+        :return: The dict containing parsed data from providers response
+        """
+        return {
+            'provider': self.id,
+            'token': token,
+
+            'uid': claims.get('sub'),
+            'email': claims.get('email'),
+            'first_name': claims.get('given_name'),
+            'last_name': claims.get('family_name'),
+            'profile_photo': claims.get('picture'),
+            'extra_data': {
+                key: value for key, value in claims.items()
+                if key not in self.id_token_volatile_claims
+            },
+        }
+
 
 google_oauth2_login = OAuth2LoginView.adapter_view(GoogleOAuth2Adapter)
 google_oauth2_callback = OAuth2CallbackView.adapter_view(GoogleOAuth2Adapter)
+
+google_oauth2_login_async = AsyncOAuth2LoginView.adapter_view(
+    GoogleOAuth2Adapter)
+google_oauth2_callback_async = AsyncOAuth2CallbackView.adapter_view(
+    GoogleOAuth2Adapter)
@@ -0,0 +1,199 @@
+"""
+Local verification of OpenID Connect id tokens against a cached JWKS.
+"""
+import json
+import re
+import threading
+import time
+
+import jwt
+from django.core.exceptions import ImproperlyConfigured
+
+from rest_auth.exceptions import OAuth2Error
+from rest_auth.views.transport import get_transport
+
+try:
+    from jwt.algorithms import RSAAlgorithm
+except ImportError:  # pragma: no cover - cryptography is not installed
+    RSAAlgorithm = None
+
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+
+class JWKSCache(object):
+    """
+    Thread-safe cache of the providers signing keys, indexed by `kid`.
+
+    The key set is fetched on first use and kept for the `max-age` announced
+    by the provider. Once it is stale it is refreshed in a background thread
+    while the current keys keep serving. A token signed with an unknown `kid`
+    (key rotation) triggers an immediate refresh, at most once every
+    `min_refresh_interval` seconds; the concurrent lookups wait for it (up to
+    `refresh_wait` seconds) instead of failing.
+
+    For tests a static key set can be given with `keys`, or a custom loader
+    returning `(jwks_dict, max_age)` with `fetch`.
+    """
+    refresh_wait = 10
+
+    def __init__(self, url=None, keys=None, fetch=None, max_age=3600,
+                 min_refresh_interval=60):
+        if RSAAlgorithm is None:
+            raise ImproperlyConfigured(
+                'Verifying id tokens requires the `cryptography` package.')
+        self.url = url
+        self.default_max_age = max_age
+        self.min_refresh_interval = min_refresh_interval
+        self._fetch = fetch
+        self._lock = threading.Lock()
+        self._refreshed = threading.Condition(self._lock)
+        self._refreshing = False
+        self._refreshing_kid = False
+        self._keys = None
+        self._expires_at = 0
+        self._last_refresh = 0
+        if keys is not None:
+            self._fetch = fetch or (lambda: (keys, None))
+            self.refresh()
+
+    def fetch(self):
+        """
+        Download the key set from the providers JWKS url.
+        :return: The JWKS as dict and its max age in seconds
+        """
+        if self._fetch is not None:
+            return self._fetch()
+        resp = get_transport().get(self.url, endpoint='jwks')
+        resp.raise_for_status()
+        try:
+            jwks = resp.json()
+        except ValueError:
+            raise OAuth2Error(message='Invalid JWKS response',
+                              cause='id_token')
+        match = MAX_AGE_RE.search(resp.headers.get('cache-control', ''))
+        return jwks, int(match.group(1)) if match else None
+
+    def refresh(self):
+        """
+        Reload the key set synchronously.
+        """
+        jwks, max_age = self.fetch()
+        keys = {}
+        for jwk in jwks.get('keys', []):
+            if jwk.get('kty') != 'RSA':
+                continue
+            keys[jwk.get('kid')] = RSAAlgorithm.from_jwk(json.dumps(jwk))
+        if max_age is None:
+            max_age = self.default_max_age
+        now = time.time()
+        with self._lock:
+            self._keys = keys
+            self._expires_at = now + max_age
+            self._last_refresh = now
+
+    def refresh_in_background(self):
+        """
+        Reload the key set in a daemon thread, unless one is already running.
+        """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh()
+            except Exception:
+                # Keep serving the current keys, retry on the next lookup.
+                pass
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def refresh_for_kid(self, kid, now):
+        """
+        Refresh the key set for an unknown `kid`, at most once every
+        `min_refresh_interval` seconds. The concurrent lookups wait for the
+        refresh in flight, a failed refresh doesn't count.
+        :param kid: The key id from the token header
+        :param now: The current timestamp
+        :return: The public key or None
+        """
+        with self._lock:
+            if self._refreshing_kid:
+                self._refreshed.wait_for(lambda: not self._refreshing_kid,
+                                         self.refresh_wait)
+                return self._keys.get(kid)
+            if now - self._last_refresh < self.min_refresh_interval:
+                return None
+            self._refreshing_kid = True
+            last_refresh = self._last_refresh
+            self._last_refresh = now
+        try:
+            self.refresh()
+        except Exception:
+            with self._lock:
+                self._last_refresh = last_refresh
+            raise
+        finally:
+            with self._lock:
+                self._refreshing_kid = False
+                self._refreshed.notify_all()
+        return self._keys.get(kid)
+
+    def get_key(self, kid):
+        """
+        Return the public key used to verify a token signed with `kid`.
+        :param kid: The key id from the token header
+        :return: The public key
+        """
+        if self._keys is None:
+            self.refresh()
+        now = time.time()
+        if now >= self._expires_at:
+            self.refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is None:
+            key = self.refresh_for_kid(kid, now)
+        if key is None:
+            raise OAuth2Error(message='Unknown id token signing key: %s'
+                                      % kid, cause='id_token')
+        return key
+
+
+def verify_id_token(id_token, jwks, audience, issuers, algorithms=('RS256',),
+                    leeway=60):
+    """
+    Verify the signature and the claims of an id token.
+    :param id_token: The encoded id token
+    :param jwks: JWKSCache instance holding the providers keys
+    :param audience: The expected audience, the oauth2 client id
+    :param issuers: The accepted issuers
+    :param algorithms: The accepted signing algorithms
+    :param leeway: Accepted clock skew in seconds
+    :return: The verified claims
+    :rtype: dict
+    """
+    try:
+        header = jwt.get_unverified_header(id_token)
+        if header.get('alg') not in algorithms:
+            raise OAuth2Error(message='Unexpected id token algorithm: %s'
+                                      % header.get('alg'), cause='id_token')
+        key = jwks.get_key(header.get('kid'))
+        claims = jwt.decode(id_token, key, algorithms=list(algorithms),
+                            audience=audience, leeway=leeway)
+    except jwt.InvalidTokenError as e:
+        raise OAuth2Error(message='Invalid id token: %s' % e,
+                          cause='id_token')
+
+    if claims.get('iss') not in issuers:
+        raise OAuth2Error(message='Invalid id token issuer: %s'
+                                  % claims.get('iss'), cause='id_token')
+    if not claims.get('sub'):
+        raise OAuth2Error(message='Id token contained no subject',
+                          cause='id_token')
+    return claims
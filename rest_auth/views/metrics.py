@@ -0,0 +1,12 @@
+from django.http import HttpResponse
+
+from rest_auth.metrics import registry
+
+
+def metrics(request):
+    """
+    Serve the authentication metrics in the Prometheus text format. It is
+    only routed when `AUTH_METRICS_ENABLED` is set.
+    """
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -1,20 +1,45 @@
+import re
+
 from django.conf import settings
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect
-from requests import RequestException
 
 from rest_auth.auth_utils import render_authentication_error, \
-    get_or_create_user, create_access_token_for_user
+    get_or_create_user, create_tokens_for_user, set_auth_cookies, \
+    arender_authentication_error, aget_or_create_user, \
+    acreate_tokens_for_user
+from rest_auth.avatars import schedule_avatar_fetch
+from rest_auth.coalescing import get_flight_key, run_once, arun_once
 from rest_auth.exceptions import ImmediateHttpResponse, AccountExistError
-from rest_auth.views.client import OAuth2Client, OAuth2Error
+from rest_auth.login_state import create_login_state, set_login_state, \
+    load_login_state, delete_login_state, get_cookie_name
+from rest_auth.metrics import record_event, record_login_error, \
+    login_starts, login_successes, login_cancellations, coalesced_callbacks
+from rest_auth.providers import get_provider
+from rest_auth.throttling import check_throttles, acheck_throttles
+from rest_auth.timing import PhaseTimer, report_timings
+from rest_auth.views.client import OAuth2Client, OAuth2Error, \
+    AsyncOAuth2Client
 from rest_auth.views.constants import AuthAction, AuthError
+from rest_auth.views.resilience import get_circuit_breaker
+from rest_auth.views.transport import TRANSPORT_ERRORS
+
+# Characters of the url safe authorization codes and states
+CALLBACK_PARAM_RE = re.compile(r'^[A-Za-z0-9._~/+=%*-]+$')
+# Error codes of the authorization response (RFC 6749 4.1.2.1), any other
+# `error` is counted as 'other' so the client can't add metric labels
+PROVIDER_ERRORS = ('invalid_request', 'unauthorized_client', 'access_denied',
+                   'unsupported_response_type', 'invalid_scope',
+                   'server_error', 'temporarily_unavailable')
 
 
 class OAuth2View(object):
     """
     View used for login and callback.
     """
+    client_class = OAuth2Client
+
     @classmethod
     def adapter_view(cls, adapter):
         """
@@ -23,33 +48,43 @@ class OAuth2View(object):
         :return: Wrapped view of that provider
         """
         def view(request, *args, **kwargs):
-            self = cls()
-            self.adapter = adapter()
-            try:
-                return self.dispatch(request, *args, **kwargs)
-            except ImmediateHttpResponse as e:
-                return e.response
+            return cls.provider_view(request, adapter.id, *args, **kwargs)
 
         return view
 
-    def get_client(self, request, credentials):
+    @classmethod
+    def provider_view(cls, request, provider, *args, **kwargs):
         """
-        Get client based on the providers credentials.
+        View serving every registered provider, routed by its id:
+            path('accounts/<str:provider>/login/', oauth2_login)
+        :param request: django HttpRequest
+        :param provider: The provider id, ex: 'google'
+        """
+        self = cls()
+        self.provider = get_provider(provider)
+        self.adapter = self.provider.adapter
+        try:
+            return self.dispatch(request, *args, **kwargs)
+        except ImmediateHttpResponse as e:
+            return e.response
+
+    def get_client(self, request):
+        """
+        Get client based on the providers configuration.
         :param request: django HttpRequest
-        :param credentials: Providers credentials as dict
         :return: OAuth2Client instance
         """
-        client = OAuth2Client(
+        provider = self.provider
+        client = self.client_class(
             request,
-            credentials['oauth2_key'],
-            credentials['oauth2_secret'],
-            self.adapter.access_token_method,
-            self.adapter.access_token_url,
-            self.adapter.get_callback_url(request),
-            self.adapter.get_scope(),
-            scope_delimiter=self.adapter.scope_delimiter,
-            headers=self.adapter.headers,
-            basic_auth=self.adapter.basic_auth
+            provider.oauth2_key,
+            provider.oauth2_secret,
+            provider.access_token_method,
+            provider.access_token_url,
+            request.build_absolute_uri(provider.callback_path),
+            provider.scope,
+            headers=provider.headers,
+            basic_auth=provider.basic_auth
         )
 
         return client
@@ -59,72 +94,322 @@ class OAuth2LoginView(OAuth2View):
     """
     View used to handle login request and redirect to callback view.
     """
+    # (scope, per_ip) pairs of the AUTH_THROTTLE_RATES checked
+    throttle_scopes = (('login', True),)
+
     def dispatch(self, request, *args, **kwargs):
         """
         Dispatch the login request to callback view or return OAuth2Error
         """
-        credentials = self.adapter.get_credentials()
-        client = self.get_client(request, credentials)
+        check_throttles(request, self.throttle_scopes)
+        return self.get_login_redirect(request)
+
+    def get_login_redirect(self, request):
+        """
+        Redirect to the provider with a new login state.
+        :param request: django HttpRequest
+        :return: HttpResponseRedirect or the error response
+        """
+        client = self.get_client(request)
+        login_state = create_login_state(self.provider)
+        client.state = login_state.state
+        client.code_verifier = login_state.code_verifier
         action = request.GET.get('action', AuthAction.AUTHENTICATE)
 
-        auth_url = self.adapter.authorize_url
-        auth_params = self.adapter.get_auth_params(request, action)
+        auth_url = self.provider.authorize_url
+        auth_params = self.adapter.get_auth_params(
+            request, action, static_params=self.provider.auth_params)
 
         try:
-            return HttpResponseRedirect(
+            # Don't send the user to the provider when the callback would
+            # fail anyway on the token exchange.
+            get_circuit_breaker(self.provider.access_token_url).check()
+            response = HttpResponseRedirect(
                 client.get_redirect_url(auth_url, auth_params)
             )
         except OAuth2Error as e:
-            return render_authentication_error(request, error=e)
+            record_login_error(self.adapter.id, AuthError.UNKNOWN, e)
+            return render_authentication_error(request, exception=e)
+        record_event(login_starts, provider=self.adapter.id)
+        return set_login_state(response, self.provider, login_state)
 
 
 class OAuth2CallbackView(OAuth2View):
     """
     View used to handle providers callback.
     """
+    # (scope, per_ip) pairs of the AUTH_THROTTLE_RATES checked on arrival
+    throttle_scopes = (('callback', True),)
+    # and checked once the state matched, before the (coalesced) token
+    # exchange, so a throttled callback doesn't fail its duplicates
+    provider_throttle_scopes = (('callback_global', False),)
+    max_param_length = 1024
+
     def dispatch(self, request, *args, **kwargs):
         """
         This dispatch is responsible for a few things:
-        1. To show an authentication error, if raised
-        2. To use the `code` parameter received from the provider, and get
+        1. To show an authentication error, if raised, or reject the
+        malformed and throttled callbacks
+        2. To verify the `state` parameter against the login state cookie.
+        3. To use the `code` parameter received from the provider, and get
         the access token.
-        3. To use the access token to get basic user information from the
+        4. To use the access token to get basic user information from the
         provider
-        4. To create user account and social account if they don't exist
+        5. To create user account and social account if they don't exist
         and/or retrieve the user instance.
-        5. Adding jwt cookie auth based on user
-        6. Redirect the page to success login url(defined in project settings).
+        6. Adding jwt cookie auth based on user
+        7. Redirect the page to success login url(defined in project settings).
+
+        Steps 3 to 6 run once for the duplicates of a callback (see
+        `rest_auth.coalescing`), they get the tokens of the first one.
+        """
+        check_throttles(request, self.throttle_scopes)
+        error = self.get_callback_error(request)
+        if error is not None:
+            self.record_callback_error(request, error)
+            return delete_login_state(
+                render_authentication_error(request, error=error),
+                self.provider)
+
+        client = self.get_client(request)
+        timer = PhaseTimer()
+
+        try:
+            self.check_login_state(request, client)
+            check_throttles(request, self.provider_throttle_scopes)
+            (encoded_token, refresh_token), first = run_once(
+                self.get_flight_key(request),
+                lambda: self.login(request, client, timer))
+            with timer.phase('redirect'):
+                response = self.get_login_response(encoded_token,
+                                                   refresh_token)
+            outcome = 'success'
+            self.record_login_success(first)
+        except (PermissionDenied, OAuth2Error, AccountExistError,
+                *TRANSPORT_ERRORS) as exception:
+            record_login_error(self.adapter.id, AuthError.UNKNOWN, exception)
+            response = render_authentication_error(request,
+                                                   exception=exception)
+            outcome = 'error'
+        delete_login_state(response, self.provider)
+        return report_timings(type(self.adapter), request, response, timer,
+                              outcome)
+
+    def login(self, request, client, timer):
+        """
+        Exchange the code, get or create the user and issue its tokens.
+        :param request: django HttpRequest
+        :param client: OAuth2Client instance
+        :param timer: PhaseTimer instance
+        :return: (encoded access token, encoded refresh token)
+        """
+        with timer.phase('token'):
+            access_token = client.get_access_token(request.GET['code'])
+        token = self.adapter.get_token(access_token)
+        with timer.phase('userinfo'):
+            extra_data = self.adapter.get_extra_data(token, access_token)
+        with timer.phase('user'):
+            user = get_or_create_user(extra_data)
+        schedule_avatar_fetch(user)
+        with timer.phase('jwt'):
+            return create_tokens_for_user(user)
+
+    def get_flight_key(self, request):
+        return get_flight_key(self.adapter.id, request.GET['code'],
+                              request.GET.get('state'))
+
+    def record_login_success(self, first):
+        """
+        Count a successful login, or a duplicate callback served the tokens
+        of the first one.
+        :param first: Whether this callback did the login
+        """
+        if first:
+            record_event(login_successes, provider=self.adapter.id)
+        else:
+            record_event(coalesced_callbacks, provider=self.adapter.id)
+
+    def check_login_state(self, request, client):
+        """
+        Verify the returned state against the login state cookie and hand
+        the PKCE code verifier over to the client.
+        :param request: django HttpRequest
+        :param client: OAuth2Client instance
+        :raise OAuth2Error: When the state is missing or doesn't match
+        """
+        login_state = load_login_state(request, self.provider)
+        client.state = login_state.state
+        client.code_verifier = login_state.code_verifier
+
+    def get_callback_error(self, request):
+        """
+        Check the callback parameters for a provider error, or parameters
+        that can't be valid.
+        :param request: django HttpRequest
+        :return: AuthError value or None if the callback can proceed
         """
         if 'error' in request.GET or 'code' not in request.GET:
             # Distinguish cancel from error
             auth_error = request.GET.get('error', None)
             if auth_error == self.adapter.login_cancelled_error:
-                error = AuthError.CANCELLED
-            else:
-                error = AuthError.UNKNOWN
-            return render_authentication_error(request, error=error)
+                return AuthError.CANCELLED
+            return AuthError.UNKNOWN
+        if self.get_invalid_param(request) is not None:
+            return AuthError.UNKNOWN
+        return None
 
-        credentials = self.adapter.get_credentials()
-        client = self.get_client(request, credentials)
+    def get_invalid_param(self, request):
+        """
+        Cheap checks of the callback parameters, so junk callbacks are
+        rejected before any call to the provider.
+        :param request: django HttpRequest
+        :return: The cause of the rejection or None
+        """
+        for name in ('code', 'state'):
+            value = request.GET.get(name)
+            if not value:
+                return 'missing_' + name
+            if len(value) > self.max_param_length or \
+                    not CALLBACK_PARAM_RE.match(value):
+                return 'invalid_' + name
+        if not request.COOKIES.get(get_cookie_name()):
+            return 'missing_login_state'
+        return None
 
+    def record_callback_error(self, request, error):
+        """
+        Count a callback that came back with a provider error.
+        :param request: django HttpRequest
+        :param error: AuthError value
+        """
+        if error == AuthError.CANCELLED:
+            record_event(login_cancellations, provider=self.adapter.id)
+        else:
+            cause = request.GET.get('error')
+            if cause is None:
+                cause = self.get_invalid_param(request)
+            elif cause not in PROVIDER_ERRORS:
+                cause = 'other'
+            record_login_error(self.adapter.id, error, cause=cause)
+
+    def get_login_response(self, encoded_token, refresh_token=None):
+        """
+        Redirect to the success login url with the jwt cookies set.
+        :param encoded_token: The encoded access token of the logged in user
+        :param refresh_token: The encoded refresh token
+        :return: HttpResponseRedirect
+        """
+        login_success_url = getattr(settings, 'LOGIN_SUCCESS_URL', '/')
+        return set_auth_cookies(redirect(login_success_url), encoded_token,
+                                refresh_token)
+
+
+class AsyncOAuth2View(OAuth2View):
+    """
+    Async view used for login and callback under ASGI.
+    """
+    client_class = AsyncOAuth2Client
+
+    @classmethod
+    def adapter_view(cls, adapter):
+        """
+        Wrapper async view for provider
+        :param adapter: Social Provider, ex: GoogleOAuth2Adapter
+        :return: Wrapped async view of that provider
+        """
+        async def view(request, *args, **kwargs):
+            return await cls.provider_view(request, adapter.id, *args,
+                                           **kwargs)
+
+        return view
+
+    @classmethod
+    async def provider_view(cls, request, provider, *args, **kwargs):
+        """
+        Async view serving every registered provider, routed by its id.
+        :param request: django HttpRequest
+        :param provider: The provider id, ex: 'google'
+        """
+        self = cls()
+        self.provider = get_provider(provider)
+        self.adapter = self.provider.adapter
         try:
-            access_token = client.get_access_token(request.GET['code'])
-            token = self.adapter.get_token(access_token)
-            extra_data = self.adapter.get_extra_data(token)
-            user = get_or_create_user(extra_data)
-            encoded_token = create_access_token_for_user(user)
-            login_success_url = getattr(settings, 'LOGIN_SUCCESS_URL', '/')
-            cookie_name = getattr(settings, 'AUTH_COOKIE_NAME', 'auth')
-            max_age = getattr(settings, 'AUTH_COOKIE_MAX_AGE', 604800)
-            response = redirect(login_success_url)
-            response.set_cookie(
-                cookie_name,
-                encoded_token,
-                max_age=max_age,
-                httponly=True,
-                samesite='lax',
-            )
-            return response
-        except (PermissionDenied, OAuth2Error, RequestException,
-                AccountExistError) as exception:
-            return render_authentication_error(request, exception=exception)
+            return await self.dispatch(request, *args, **kwargs)
+        except ImmediateHttpResponse as e:
+            return e.response
+
+
+class AsyncOAuth2LoginView(AsyncOAuth2View, OAuth2LoginView):
+    """
+    Async view used to handle login request. Building the redirect does no
+    I/O, so it only wraps the blocking implementation.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        await acheck_throttles(request, self.throttle_scopes)
+        return self.get_login_redirect(request)
+
+
+class AsyncOAuth2CallbackView(AsyncOAuth2View, OAuth2CallbackView):
+    """
+    Async view used to handle providers callback. The provider calls are
+    awaited on the event loop, the database work runs in a thread.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        Same steps as `OAuth2CallbackView.dispatch`, without holding a
+        thread while waiting on the provider.
+        """
+        await acheck_throttles(request, self.throttle_scopes)
+        error = self.get_callback_error(request)
+        if error is not None:
+            self.record_callback_error(request, error)
+            return delete_login_state(
+                await arender_authentication_error(request, error=error),
+                self.provider)
+
+        client = self.get_client(request)
+        timer = PhaseTimer()
+
+        try:
+            self.check_login_state(request, client)
+            await acheck_throttles(request, self.provider_throttle_scopes)
+            (encoded_token, refresh_token), first = await arun_once(
+                self.get_flight_key(request),
+                lambda: self.login(request, client, timer))
+            with timer.phase('redirect'):
+                response = self.get_login_response(encoded_token,
+                                                   refresh_token)
+            outcome = 'success'
+            self.record_login_success(first)
+        except (PermissionDenied, OAuth2Error, AccountExistError,
+                *TRANSPORT_ERRORS) as exception:
+            record_login_error(self.adapter.id, AuthError.UNKNOWN, exception)
+            response = await arender_authentication_error(
+                request, exception=exception)
+            outcome = 'error'
+        delete_login_state(response, self.provider)
+        return report_timings(type(self.adapter), request, response, timer,
+                              outcome)
+
+    async def login(self, request, client, timer):
+        """
+        `OAuth2CallbackView.login` awaiting the provider calls.
+        """
+        with timer.phase('token'):
+            access_token = await client.get_access_token(request.GET['code'])
+        token = self.adapter.get_token(access_token)
+        with timer.phase('userinfo'):
+            extra_data = await self.adapter.aget_extra_data(
+                token, access_token)
+        with timer.phase('user'):
+            user = await aget_or_create_user(extra_data)
+        schedule_avatar_fetch(user)
+        with timer.phase('jwt'):
+            return await acreate_tokens_for_user(user)
+
+
+oauth2_login = OAuth2LoginView.provider_view
+oauth2_callback = OAuth2CallbackView.provider_view
+
+oauth2_login_async = AsyncOAuth2LoginView.provider_view
+oauth2_callback_async = AsyncOAuth2CallbackView.provider_view
@@ -0,0 +1,298 @@
+"""
+Timeouts, retries and circuit breaking of the provider HTTP calls.
+
+Every call gets the connect/read timeout of its endpoint:
+    SOCIAL_AUTH_HTTP_TIMEOUTS = {'token': (3.05, 10), 'userinfo': (3.05, 5)}
+
+Idempotent calls (GET) failing with a transport error, a 5xx or a 429 are
+retried with exponential backoff and full jitter, at most
+`SOCIAL_AUTH_HTTP_RETRIES` times per call. Retries are also bounded by a
+per-process budget so that an outage does not multiply the traffic sent to
+the provider: each call deposits `SOCIAL_AUTH_HTTP_RETRY_RATIO` tokens and
+each retry withdraws one.
+
+Each provider host has a circuit breaker. Once at least
+`SOCIAL_AUTH_CIRCUIT_MIN_CALLS` calls were made in the last
+`SOCIAL_AUTH_CIRCUIT_WINDOW` seconds and their error rate reaches
+`SOCIAL_AUTH_CIRCUIT_ERROR_RATE`, the circuit opens and calls fail fast with
+`CircuitOpenError` for `SOCIAL_AUTH_CIRCUIT_RESET_TIMEOUT` seconds. A single
+trial call is then let through, closing the circuit again on success.
+"""
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from rest_auth.exceptions import OAuth2Error
+from rest_auth.metrics import record_event, circuit_breaker_open, \
+    circuit_breaker_rejections, circuit_breaker_transitions, \
+    provider_retries
+
+DEFAULT_TIMEOUTS = {
+    'token': (3.05, 10),
+    'userinfo': (3.05, 5),
+    'jwks': (3.05, 5),
+    'default': (3.05, 10),
+}
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS')
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(OAuth2Error):
+    """
+    Raised instead of calling a provider whose circuit is open.
+    """
+    def __init__(self, host, retry_after, *args, **kwargs):
+        super().__init__(message='Circuit open for %s, retry in %.0fs'
+                                 % (host, retry_after),
+                         cause='circuit_open')
+        self.host = host
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Thread-safe circuit breaker over the calls to a single host.
+
+    :param name: The guarded host, used in errors and metrics
+    :param error_rate: Error rate opening the circuit
+    :param min_calls: Calls needed in the window before the rate is checked
+    :param window: Length of the sliding window, in seconds
+    :param reset_timeout: Seconds the circuit stays open before a trial call
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, error_rate=0.5, min_calls=20, window=30,
+                 reset_timeout=30):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._calls = deque()
+        self._errors = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check that a call may be made.
+        :raise CircuitOpenError: When the circuit is open
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            retry_after = self.opened_at + self.reset_timeout - now
+            if self.state == self.OPEN and retry_after <= 0:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial:
+                self._trial = True
+                return
+        record_event(circuit_breaker_rejections, host=self.name)
+        raise CircuitOpenError(self.name, max(retry_after, 0))
+
+    def check(self):
+        """
+        Fail fast while the circuit is open, without taking the trial call.
+        :raise CircuitOpenError: When the circuit is open
+        """
+        if self.state != self.OPEN:
+            return
+        retry_after = self.opened_at + self.reset_timeout - time.monotonic()
+        if retry_after > 0:
+            record_event(circuit_breaker_rejections, host=self.name)
+            raise CircuitOpenError(self.name, retry_after)
+
+    def record(self, success):
+        """
+        Record the outcome of a call.
+        :param success: Whether the provider answered properly
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._trial = False
+                self._reset_window()
+                if success:
+                    self._set_state(self.CLOSED)
+                else:
+                    self._open(now)
+                return
+
+            self._calls.append((now, success))
+            if not success:
+                self._errors += 1
+            while self._calls and self._calls[0][0] < now - self.window:
+                if not self._calls.popleft()[1]:
+                    self._errors -= 1
+            if self.state == self.CLOSED and \
+                    len(self._calls) >= self.min_calls and \
+                    self._errors >= self.error_rate * len(self._calls):
+                self._open(now)
+
+    def release(self):
+        """
+        Give back the trial call of a half open circuit, when the call ended
+        without an outcome (e.g. cancelled or failed outside the transport).
+        """
+        with self._lock:
+            self._trial = False
+
+    def _open(self, now):
+        self.opened_at = now
+        self._reset_window()
+        self._set_state(self.OPEN)
+
+    def _reset_window(self):
+        self._calls.clear()
+        self._errors = 0
+
+    def _set_state(self, state):
+        self.state = state
+        circuit_breaker_open.set(0 if state == self.CLOSED else 1,
+                                 host=self.name)
+        record_event(circuit_breaker_transitions, host=self.name, state=state)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'calls': len(self._calls),
+                'errors': self._errors,
+                'opened_at': self.opened_at,
+            }
+
+
+class RetryBudget(object):
+    """
+    Token bucket limiting the retries to a fraction of the calls.
+
+    :param ratio: Tokens deposited per call, i.e. allowed retries per call
+    :param min_tokens: Initial and minimum capacity of the bucket
+    """
+    def __init__(self, ratio=0.1, min_tokens=10):
+        self.ratio = ratio
+        self.capacity = max(min_tokens, 1)
+        self.tokens = float(self.capacity)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + self.ratio)
+
+    def withdraw(self):
+        """
+        Take a token for a retry.
+        :return: Whether the retry is allowed
+        """
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_retry_budget = None
+
+
+def get_circuit_breaker(url):
+    """
+    Return the circuit breaker of the host of `url`.
+    :param url: The requested url
+    :return: CircuitBreaker instance
+    """
+    host = urlparse(url).netloc
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = _breakers[host] = CircuitBreaker(
+                    host,
+                    error_rate=getattr(
+                        settings, 'SOCIAL_AUTH_CIRCUIT_ERROR_RATE', 0.5),
+                    min_calls=getattr(
+                        settings, 'SOCIAL_AUTH_CIRCUIT_MIN_CALLS', 20),
+                    window=getattr(
+                        settings, 'SOCIAL_AUTH_CIRCUIT_WINDOW', 30),
+                    reset_timeout=getattr(
+                        settings, 'SOCIAL_AUTH_CIRCUIT_RESET_TIMEOUT', 30),
+                )
+    return breaker
+
+
+def get_circuit_breakers():
+    """
+    Return the state of every circuit breaker of this process.
+    :return: dict of host to breaker stats
+    """
+    return {host: breaker.stats()
+            for host, breaker in list(_breakers.items())}
+
+
+def reset_circuit_breakers():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def get_retry_budget():
+    global _retry_budget
+    if _retry_budget is None:
+        _retry_budget = RetryBudget(
+            ratio=getattr(settings, 'SOCIAL_AUTH_HTTP_RETRY_RATIO', 0.1),
+            min_tokens=getattr(settings, 'SOCIAL_AUTH_HTTP_RETRY_MIN', 10),
+        )
+    return _retry_budget
+
+
+def get_timeout(endpoint):
+    """
+    Return the timeout of an endpoint.
+    :param endpoint: The endpoint name, e.g. 'token'
+    :return: The connect and read timeouts in seconds
+    :rtype: tuple
+    """
+    timeouts = dict(DEFAULT_TIMEOUTS)
+    timeouts.update(getattr(settings, 'SOCIAL_AUTH_HTTP_TIMEOUTS', {}))
+    return tuple(timeouts.get(endpoint, timeouts['default']))
+
+
+def get_max_retries(method):
+    if method.upper() not in IDEMPOTENT_METHODS:
+        return 0
+    return getattr(settings, 'SOCIAL_AUTH_HTTP_RETRIES', 2)
+
+
+def get_backoff(attempt):
+    """
+    Exponential backoff with full jitter.
+    :param attempt: The number of the failed attempt, starting at 0
+    :return: The delay in seconds before the next attempt
+    """
+    base = getattr(settings, 'SOCIAL_AUTH_HTTP_BACKOFF', 0.1)
+    cap = getattr(settings, 'SOCIAL_AUTH_HTTP_BACKOFF_MAX', 1.0)
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_failure(response):
+    return response.status_code >= 500 or response.status_code == 429
+
+
+def should_retry(attempt, max_retries, endpoint):
+    """
+    Whether a failed attempt is retried, taking a token from the budget.
+    """
+    if attempt >= max_retries or not get_retry_budget().withdraw():
+        return False
+    record_event(provider_retries, endpoint=endpoint)
+    return True
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from rest_auth.auth_utils import create_tokens_for_user, set_auth_cookies, \
+    delete_auth_cookies
+from rest_auth.metrics import record_event, token_refreshes
+from rest_auth.models import User
+from rest_auth.revocation import revoke_token, revoke_user_tokens, \
+    is_issued_before_stamp, is_recently_rotated
+from rest_auth.signing import get_jwks
+from rest_auth.views.authentication import RestAuthentication
+
+
+def get_refresh_token(request):
+    """
+    Read the refresh token from its cookie, or the `refresh` form field.
+    :param request: django HttpRequest
+    :return: The encoded refresh token or None
+    """
+    cookie_name = getattr(settings, 'AUTH_REFRESH_COOKIE_NAME',
+                          'auth_refresh')
+    return request.COOKIES.get(cookie_name) or request.POST.get('refresh')
+
+
+def token_error(detail, code):
+    response = JsonResponse({'detail': detail, 'code': code}, status=401)
+    return delete_auth_cookies(response)
+
+
+# The refresh cookie is SameSite=Strict, it is never sent cross-site.
+@csrf_exempt
+@require_POST
+def token_refresh(request):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    The presented refresh token is revoked; presenting it again revokes
+    every token of its user, as it was most likely stolen. Unless it was
+    rotated less than `AUTH_REFRESH_REUSE_GRACE` seconds ago: concurrent
+    refreshes of two tabs, or a retried request, get a new pair too.
+    """
+    raw_token = get_refresh_token(request)
+    if not raw_token:
+        return token_error('No refresh token', 'token_missing')
+    try:
+        refresh = RefreshToken(raw_token)
+    except TokenError as e:
+        record_event(token_refreshes, outcome='invalid')
+        return token_error(str(e), 'token_not_valid')
+
+    user = User.objects.filter(
+        pk=refresh.get(api_settings.USER_ID_CLAIM), is_active=True).first()
+    if user is None or is_issued_before_stamp(refresh.payload, user):
+        record_event(token_refreshes, outcome='invalid')
+        return token_error('Token has been revoked', 'token_revoked')
+
+    outcome = 'success'
+    if not revoke_token(refresh.payload, rotated=True):
+        if not is_recently_rotated(refresh.payload):
+            revoke_user_tokens(user.pk)
+            record_event(token_refreshes, outcome='reused')
+            return token_error('Token has been revoked', 'token_revoked')
+        outcome = 'concurrent'
+
+    access_token, refresh_token = create_tokens_for_user(user)
+    record_event(token_refreshes, outcome=outcome)
+    return set_auth_cookies(JsonResponse({'access': access_token}),
+                            access_token, refresh_token)
+
+
+@csrf_exempt
+@require_POST
+def logout(request):
+    """
+    Revoke the presented access and refresh tokens and delete their cookies.
+    With `all=1` every token of the user is revoked (logout everywhere).
+    """
+    user_id = None
+    raw_refresh = get_refresh_token(request)
+    authentication = RestAuthentication()
+    header = authentication.get_header(request)
+    if header is not None:
+        raw_access = authentication.get_raw_token(header)
+    else:
+        raw_access = request.COOKIES.get(
+            getattr(settings, 'AUTH_COOKIE_NAME', 'auth'))
+    for token_class, raw_token in ((RefreshToken, raw_refresh),
+                                   (AccessToken, raw_access)):
+        if not raw_token:
+            continue
+        try:
+            token = token_class(raw_token)
+        except TokenError:
+            continue
+        revoke_token(token.payload)
+        user_id = token.get(api_settings.USER_ID_CLAIM, user_id)
+
+    if user_id is not None and request.POST.get('all'):
+        revoke_user_tokens(user_id)
+    return delete_auth_cookies(HttpResponse(status=204))
+
+
+@require_GET
+def jwks(request):
+    """
+    Publish the public keys verifying the issued tokens, cacheable for
+    `AUTH_JWKS_MAX_AGE` seconds and revalidated with its ETag.
+    """
+    body, etag = get_jwks()
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if if_none_match.strip() == '*' or etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['Cache-Control'] = 'public, max-age=%d' % getattr(
+        settings, 'AUTH_JWKS_MAX_AGE', 3600)
+    response['ETag'] = etag
+    return response
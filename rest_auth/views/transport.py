@@ -0,0 +1,403 @@
+"""
+Shared HTTP transport used by the provider adapters and the oauth client.
+
+A single transport is kept per process so that the token exchange and the
+userinfo calls reuse pooled keep-alive connections instead of opening a new
+TCP+TLS connection on every login.
+
+Each call goes through `send_with_policy`, applying the timeouts, retries and
+circuit breaker of `rest_auth.views.resilience`.
+"""
+import asyncio
+import importlib.util
+import os
+import threading
+import time
+import weakref
+
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from rest_auth.metrics import provider_request_seconds
+from rest_auth.views.resilience import RETRY_STATUS_CODES, get_backoff, \
+    get_circuit_breaker, get_circuit_breakers, get_max_retries, \
+    get_retry_budget, get_timeout, is_failure, should_retry
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+
+TRANSPORT_ERRORS = (requests.RequestException,)
+if httpx is not None:
+    TRANSPORT_ERRORS += (httpx.HTTPError,)
+
+# httpx only imports `h2` on the first HTTP/2 request
+HTTP2_AVAILABLE = httpx is not None and \
+    importlib.util.find_spec('h2') is not None
+
+
+class HttpTransport(object):
+    """
+    Thread-safe, pooled HTTP transport backed by `requests`.
+    """
+    def __init__(self, pool_size=10, keep_alive=True):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(pool_connections=pool_size,
+                                   pool_maxsize=pool_size)
+        self.session.mount('https://', self.adapter)
+        self.session.mount('http://', self.adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def request(self, method, url, endpoint='other', **kwargs):
+        """
+        Perform a request through the pooled session.
+        :param method: HTTP method
+        :param url: The requested url
+        :param endpoint: The endpoint name, selecting the timeout and used
+            in the metrics
+        :return: The response object
+        """
+        kwargs.setdefault('timeout', get_timeout(endpoint))
+        return send_with_policy(self.send, method, url, endpoint, kwargs)
+
+    def send(self, method, url, endpoint, **kwargs):
+        with self._lock:
+            self._requests += 1
+        start = time.perf_counter()
+        try:
+            return self.session.request(method, url, **kwargs)
+        finally:
+            provider_request_seconds.observe(time.perf_counter() - start,
+                                             endpoint=endpoint)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        Return the pool statistics of this transport.
+        :return: dict with the transport and per host pool counters
+        """
+        pools = {}
+        manager = self.adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            host = '%s://%s:%s' % (pool.scheme, pool.host, pool.port)
+            pools[host] = {
+                'connections_opened': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': sum(
+                    1 for conn in list(pool.pool.queue) if conn is not None
+                ) if pool.pool is not None else 0,
+            }
+        return {
+            'backend': 'requests',
+            'http2': False,
+            'pool_size': self.pool_size,
+            'keep_alive': self.keep_alive,
+            'requests': self._requests,
+            'circuit_breakers': get_circuit_breakers(),
+            'pools': pools,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class Http2Transport(object):
+    """
+    Thread-safe, pooled HTTP/2 transport backed by `httpx`. Only used when
+    `SOCIAL_AUTH_HTTP2` is enabled and httpx (with the h2 extra) is installed.
+    """
+    def __init__(self, pool_size=10, keep_alive=True):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size if keep_alive else 0,
+        )
+        self.client = httpx.Client(http2=True, limits=limits)
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def request(self, method, url, endpoint='other', **kwargs):
+        kwargs.setdefault('timeout', get_httpx_timeout(endpoint))
+        return send_with_policy(self.send, method, url, endpoint, kwargs)
+
+    def send(self, method, url, endpoint, stream=False, **kwargs):
+        with self._lock:
+            self._requests += 1
+        start = time.perf_counter()
+        try:
+            # A streamed body is read with `iter_bytes` and must be closed
+            return self.client.send(
+                self.client.build_request(method, url, **kwargs),
+                stream=stream)
+        finally:
+            provider_request_seconds.observe(time.perf_counter() - start,
+                                             endpoint=endpoint)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        Return the statistics of this transport, httpx doesn't expose its
+        pool counters.
+        """
+        return {
+            'backend': 'httpx',
+            'http2': True,
+            'pool_size': self.pool_size,
+            'keep_alive': self.keep_alive,
+            'requests': self._requests,
+            'circuit_breakers': get_circuit_breakers(),
+        }
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncHttpTransport(object):
+    """
+    Pooled, non blocking HTTP transport backed by `httpx.AsyncClient`. It is
+    bound to the event loop it was created on.
+    """
+    def __init__(self, pool_size=10, keep_alive=True, http2=False):
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self.http2 = http2
+        limits = httpx.Limits(
+            max_connections=pool_size,
+            max_keepalive_connections=pool_size if keep_alive else 0,
+        )
+        self.client = httpx.AsyncClient(http2=http2, limits=limits)
+        self._requests = 0
+
+    async def request(self, method, url, endpoint='other', **kwargs):
+        kwargs.setdefault('timeout', get_httpx_timeout(endpoint))
+        return await asend_with_policy(self.send, method, url, endpoint,
+                                       kwargs)
+
+    async def send(self, method, url, endpoint, **kwargs):
+        self._requests += 1
+        start = time.perf_counter()
+        try:
+            return await self.client.request(method, url, **kwargs)
+        finally:
+            provider_request_seconds.observe(time.perf_counter() - start,
+                                             endpoint=endpoint)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return {
+            'backend': 'httpx-async',
+            'http2': self.http2,
+            'pool_size': self.pool_size,
+            'keep_alive': self.keep_alive,
+            'requests': self._requests,
+            'circuit_breakers': get_circuit_breakers(),
+        }
+
+    async def close(self):
+        await self.client.aclose()
+
+
+class ThreadedAsyncTransport(object):
+    """
+    Async facade over the shared blocking transport, used when httpx is not
+    installed. Requests run in a worker thread so the event loop is never
+    blocked, and they still reuse the pooled connections.
+    """
+    async def request(self, method, url, **kwargs):
+        return await sync_to_async(
+            get_transport().request, thread_sensitive=False
+        )(method, url, **kwargs)
+
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request('POST', url, **kwargs)
+
+    def stats(self):
+        return get_transport().stats()
+
+    async def close(self):
+        pass
+
+
+def send_with_policy(send, method, url, endpoint, kwargs):
+    """
+    Perform a request through the circuit breaker of its host, retrying
+    idempotent requests that failed.
+    :param send: Callable performing a single attempt
+    :param method: HTTP method
+    :param url: The requested url
+    :param endpoint: The endpoint name
+    :param kwargs: The request arguments
+    :return: The response object
+    :raise CircuitOpenError: When the circuit of the host is open
+    """
+    breaker = get_circuit_breaker(url)
+    max_retries = get_max_retries(method)
+    get_retry_budget().deposit()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            response = send(method, url, endpoint, **kwargs)
+        except TRANSPORT_ERRORS:
+            breaker.record(False)
+            if not should_retry(attempt, max_retries, endpoint):
+                raise
+        except BaseException:
+            # Cancellations and bugs say nothing about the provider
+            breaker.release()
+            raise
+        else:
+            breaker.record(not is_failure(response))
+            if response.status_code not in RETRY_STATUS_CODES or \
+                    not should_retry(attempt, max_retries, endpoint):
+                return response
+            # Release the connection of a streamed response
+            response.close()
+        time.sleep(get_backoff(attempt))
+        attempt += 1
+
+
+async def asend_with_policy(send, method, url, endpoint, kwargs):
+    """
+    Async version of `send_with_policy`.
+    """
+    breaker = get_circuit_breaker(url)
+    max_retries = get_max_retries(method)
+    get_retry_budget().deposit()
+    attempt = 0
+    while True:
+        breaker.before_call()
+        try:
+            response = await send(method, url, endpoint, **kwargs)
+        except TRANSPORT_ERRORS:
+            breaker.record(False)
+            if not should_retry(attempt, max_retries, endpoint):
+                raise
+        except BaseException:
+            # Cancellations and bugs say nothing about the provider
+            breaker.release()
+            raise
+        else:
+            breaker.record(not is_failure(response))
+            if response.status_code not in RETRY_STATUS_CODES or \
+                    not should_retry(attempt, max_retries, endpoint):
+                return response
+        await asyncio.sleep(get_backoff(attempt))
+        attempt += 1
+
+
+def get_httpx_timeout(endpoint):
+    connect, read = get_timeout(endpoint)
+    return httpx.Timeout(read, connect=connect)
+
+
+_transport = None
+_transport_pid = None
+_transport_lock = threading.Lock()
+_transport_overridden = False
+_async_transports = weakref.WeakKeyDictionary()
+
+
+def build_transport():
+    """
+    Build a new transport based on the project settings:
+        SOCIAL_AUTH_HTTP_POOL_SIZE = 10
+        SOCIAL_AUTH_HTTP_KEEP_ALIVE = True
+        SOCIAL_AUTH_HTTP2 = False
+    HTTP/2 requires httpx with its `h2` extra, without them the `requests`
+    transport is used.
+    :return: HttpTransport or Http2Transport instance
+    """
+    pool_size = getattr(settings, 'SOCIAL_AUTH_HTTP_POOL_SIZE', 10)
+    keep_alive = getattr(settings, 'SOCIAL_AUTH_HTTP_KEEP_ALIVE', True)
+    http2 = getattr(settings, 'SOCIAL_AUTH_HTTP2', False)
+    if http2 and HTTP2_AVAILABLE:
+        return Http2Transport(pool_size=pool_size, keep_alive=keep_alive)
+    return HttpTransport(pool_size=pool_size, keep_alive=keep_alive)
+
+
+def get_transport():
+    """
+    Return the transport shared by this process. A new one is built after a
+    fork so that worker processes never share sockets with their parent.
+    :return: HttpTransport or Http2Transport instance
+    """
+    global _transport, _transport_pid
+    pid = os.getpid()
+    if _transport is None or _transport_pid != pid:
+        with _transport_lock:
+            if _transport is None or _transport_pid != pid:
+                _transport = build_transport()
+                _transport_pid = pid
+    return _transport
+
+
+def set_transport(transport):
+    """
+    Replace the shared transport, e.g. with a stub provider.
+    :param transport: The new transport or None to rebuild it from settings
+    :return: The previous transport
+    """
+    global _transport, _transport_pid, _transport_overridden
+    with _transport_lock:
+        previous = _transport
+        _transport = transport
+        _transport_pid = os.getpid() if transport is not None else None
+        _transport_overridden = transport is not None
+    return previous
+
+
+def get_async_transport():
+    """
+    Return the async transport of the running event loop. When the shared
+    transport was replaced with `set_transport` the async views use it too.
+    :return: AsyncHttpTransport or ThreadedAsyncTransport instance
+    """
+    if _transport_overridden:
+        return ThreadedAsyncTransport()
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None:
+        if httpx is not None:
+            transport = AsyncHttpTransport(
+                pool_size=getattr(settings, 'SOCIAL_AUTH_HTTP_POOL_SIZE', 10),
+                keep_alive=getattr(settings, 'SOCIAL_AUTH_HTTP_KEEP_ALIVE',
+                                   True),
+                http2=getattr(settings, 'SOCIAL_AUTH_HTTP2', False) and
+                HTTP2_AVAILABLE,
+            )
+        else:
+            transport = ThreadedAsyncTransport()
+        _async_transports[loop] = transport
+    return transport